@@ -3,232 +3,45 @@ from markupsafe import escape
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
 
-import threading
 import asyncio
-from bleak import BleakClient, BleakScanner
-
 import time
+import numpy as np
 from datetime import datetime, timezone
 import os
+import sys
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # Database configuration - use SQLite file in project by default
+# (GRIP8A_FLASK_DB points it elsewhere, e.g. load_test.py's throwaway DB)
 base_dir = os.path.abspath(os.path.dirname(__file__))
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    f"sqlite:///{os.path.join(base_dir, 'grip8a.db')}"
-)
+DB_PATH = os.environ.get("GRIP8A_FLASK_DB") or os.path.join(base_dir, "grip8a.db")
+app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)
 
+# Make the grip8a package importable when run as `python flask_app/app.py`
+sys.path.insert(0, os.path.dirname(base_dir))
+from grip8a.analysis.metrics import METRIC_FIELDS, segment_metrics
+from grip8a.analysis.reps import rep_thresholds, segment_reps
+from grip8a.ble.manager import BLEManager
+from grip8a.ble.simulator import load_backend
+from grip8a.db import cache, calibration, migrations, rollups
+from grip8a.db.connection import transaction
+from grip8a.utils.engine import ProtocolHost, recording_subscriber, rep_subscriber
+from grip8a.utils.protocols import PRESETS, compile_protocol, total_duration
+
 # BLE Device Configuration
 DEVICE_NAME = "Arduino"
 CHARACTERISTIC_UUID = "5387e989-6064-48e4-9387-688c754efcfa"
 
-# Shared state for the latest force reading
-force = 0.0
-
-
-# ---------------------------
-# Notification handler
-# ---------------------------
-def notification_handler(sender, data):
-    """Callback for handling incoming BLE notifications.
 
-    This is called from the Bleak client's event loop thread. It updates the
-    module-level `force` variable so the Flask `/data` endpoint can return it.
-    """
-    global force
-    try:
-        # Prefer interpreting raw bytes as an unsigned little-endian integer
-        force = int.from_bytes(data, byteorder="little", signed=False)
-    except Exception:
-        try:
-            # Fallback: try decoding as a UTF-8 numeric string
-            s = data.decode().strip()
-            force = float(s)
-        except Exception:
-            # Could not parse incoming data; keep previous value
-            print("Warning: could not parse BLE notification:", data)
-
-
-# ---------------------------
-# BLE manager that runs an asyncio loop in a background thread
-# ---------------------------
-class BLEManager:
-    def __init__(self):
-        self.loop = None
-        self.thread = None
-        self.stop_event = None  # asyncio.Event created inside the loop
-        self.task_future = (
-            None  # concurrent.futures.Future for the coroutine running the BLE task
-        )
-        self.client = None
-        self._lock = threading.Lock()
-
-    def _start_loop_thread(self):
-        """Create and start the asyncio event loop in a background thread."""
-        self.loop = asyncio.new_event_loop()
-
-        def _run_loop():
-            asyncio.set_event_loop(self.loop)
-            self.loop.run_forever()
-
-        self.thread = threading.Thread(target=_run_loop, daemon=True)
-        self.thread.start()
-
-        # Create the asyncio.Event inside the loop and store it
-        fut = asyncio.run_coroutine_threadsafe(self._create_event(), self.loop)
-        self.stop_event = fut.result()
-
-    async def _create_event(self):
-        return asyncio.Event()
-
-    def start(self):
-        """Start the background BLE task (non-blocking)."""
-        with self._lock:
-            if self.task_future and not self.task_future.done():
-                # already running
-                return
-            if self.loop is None:
-                self._start_loop_thread()
-            # Schedule the BLE coroutine on the background loop
-            self.task_future = asyncio.run_coroutine_threadsafe(
-                self._ble_task(self.stop_event), self.loop
-            )
-
-    def is_running(self):
-        with self._lock:
-            return bool(self.task_future and not self.task_future.done())
-
-    def is_connected(self):
-        # very lightweight check: see if client reference exists and is connected
-        with self._lock:
-            client = self.client
-        if client is None:
-            return False
-        try:
-            # BleakClient.has a `.is_connected` coroutine/property depending on version.
-            # Use a synchronous check by scheduling it on the loop if available.
-            coro = getattr(client, "is_connected", None)
-            if coro is None:
-                return False
-            if asyncio.iscoroutinefunction(coro):
-                # schedule and get result
-                fut = asyncio.run_coroutine_threadsafe(coro(), self.loop)
-                return fut.result(timeout=2)
-            elif isinstance(coro, bool):
-                return bool(coro)
-            else:
-                # property-like
-                return bool(coro)
-        except Exception:
-            return False
-
-    def stop(self, timeout=10):
-        """Request the BLE task to stop and tear down the background loop."""
-        with self._lock:
-            if not self.loop or not self.stop_event:
-                return
-            # signal the task to stop
-            try:
-                asyncio.run_coroutine_threadsafe(
-                    self.stop_event.set(), self.loop
-                ).result(timeout=2)
-            except Exception as e:
-                print("Error signaling BLE stop_event:", e)
-
-            # wait for the task to exit
-            if self.task_future:
-                try:
-                    self.task_future.result(timeout=timeout)
-                except Exception as e:
-                    print("BLE task did not finish cleanly:", e)
-
-            # stop the loop
-            try:
-                self.loop.call_soon_threadsafe(self.loop.stop)
-            except Exception as e:
-                print("Error stopping BLE loop:", e)
-
-            # join the thread briefly
-            if self.thread:
-                self.thread.join(timeout=1)
-
-            # clear state
-            self.loop = None
-            self.thread = None
-            self.stop_event = None
-            self.task_future = None
-            self.client = None
-
-    async def _ble_task(self, stop_event: asyncio.Event):
-        """Coroutine that scans, connects, subscribes to notifications and keeps running.
-
-        Runs inside the background asyncio loop.
-        """
-        self.client = None
-        try:
-            while not stop_event.is_set():
-                try:
-                    print("BLE: scanning for devices...")
-                    devices = await BleakScanner.discover()
-                    target = None
-                    for d in devices:
-                        if d.name == DEVICE_NAME:
-                            target = d
-                            break
-
-                    if not target:
-                        print("BLE: device not found, retrying in 5s...")
-                        await asyncio.sleep(5)
-                        continue
-
-                    client = BleakClient(target.address)
-                    self.client = client
-                    # Use context manager to ensure clean disconnects on exit
-                    async with client:
-                        print(f"BLE: Connected to {DEVICE_NAME} ({target.address})")
-                        try:
-                            await client.start_notify(
-                                CHARACTERISTIC_UUID, notification_handler
-                            )
-                        except Exception as e:
-                            print("BLE: Failed to start notify:", e)
-                            # let context manager exit and retry
-                            await asyncio.sleep(5)
-                            continue
-
-                        # Wait until stop_event is set (i.e. until a stop is requested)
-                        await stop_event.wait()
-
-                        # When stopping, try to stop notifications cleanly
-                        try:
-                            await client.stop_notify(CHARACTERISTIC_UUID)
-                        except Exception:
-                            pass
-
-                    # If we get here and stop_event was set, break out
-                    if stop_event.is_set():
-                        break
-
-                    # Otherwise, connection dropped unexpectedly - retry after a pause
-                    print("BLE: Disconnected unexpectedly, retrying in 5s...")
-                    await asyncio.sleep(5)
-
-                except Exception as e:
-                    print("BLE task iteration error:", e)
-                    await asyncio.sleep(5)
-        finally:
-            # ensure we clear client reference
-            self.client = None
-            print("BLE: task exiting")
-
-
-# Single manager instance
-ble_manager = BLEManager()
+# Single manager instance (GRIP8A_BLE_BACKEND=sim or replay runs without the device)
+# Calibration profiles (grip8a/db/calibration.py) for its devices live in this app's DB
+ble_manager = BLEManager(DEVICE_NAME, CHARACTERISTIC_UUID, backend=load_backend(),
+                         calibration_db=DB_PATH)
 
 
 # ---------------------------
@@ -260,6 +73,7 @@ class Reading(db.Model):
     timestamp_ms = db.Column(db.BigInteger, nullable=False)
     timestamp_iso = db.Column(db.String(50), nullable=False)
     force = db.Column(db.Float, nullable=False)
+    raw_force = db.Column(db.Float, nullable=True)  # sensor value before calibration
 
     def to_dict(self):
         return {
@@ -268,12 +82,119 @@ class Reading(db.Model):
             "timestamp_ms": self.timestamp_ms,
             "timestamp_iso": self.timestamp_iso,
             "force": self.force,
+            "raw_force": self.raw_force,
         }
 
 
+class Rep(db.Model):
+    """A rep as detected in the force stream, with its metrics (see grip8a/analysis/metrics.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    run_key = db.Column(db.String(120), nullable=True)  # protocol run it was recorded in
+    set_number = db.Column(db.Integer, nullable=True)
+    rep_number = db.Column(db.Integer, nullable=True)
+    start_ms = db.Column(db.Float, nullable=False)
+    end_ms = db.Column(db.Float, nullable=False)
+    peak_force = db.Column(db.Float)
+    time_to_peak_s = db.Column(db.Float)
+    max_rfd = db.Column(db.Float)
+    impulse = db.Column(db.Float)
+    mean_force = db.Column(db.Float)
+    drop_off = db.Column(db.Float)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "run_key": self.run_key,
+            "set_number": self.set_number,
+            "rep_number": self.rep_number,
+            "start_ms": self.start_ms,
+            "end_ms": self.end_ms,
+            **{name: getattr(self, name) for name in METRIC_FIELDS},
+        }
+
+
+def _flask_v1_indexes(c):
+    # /stats/user and /api/history per user, /api/readings newest first, name lookups
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reading_user_ts ON reading (user_id, timestamp_ms)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reading_ts ON reading (timestamp_ms)")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_name_lower ON "user" (lower(name))')
+
+
+def _insert_rows(conn, table, rows):
+    """INSERT a list of same-keyed dicts into `table`. Returns the last rowid."""
+    columns = list(rows[0])
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                     [tuple(r[k] for k in columns) for r in rows])
+    return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+
+def _rep_rows(user_id, t, forces, weight=None):
+    """Rep table rows for every rep detected in one stream (times in seconds)."""
+    on, off = rep_thresholds(weight)
+    reps = segment_reps(t, forces, on, off)
+    return [{
+        "user_id": user_id, "start_ms": start * 1000, "end_ms": end * 1000, **metrics,
+    } for (start, end), metrics in zip(reps.tolist(), segment_metrics(t, forces, reps, off))]
+
+
+def _flask_v2_reps(c):
+    # /stats/user rep summary; and detect reps in the readings stored before reps were tracked
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rep_user_start ON rep (user_id, start_ms)")
+    weights = dict(c.execute('SELECT id, weight FROM "user"').fetchall())
+    for (user_id,) in c.execute("SELECT DISTINCT user_id FROM reading").fetchall():
+        arr = np.array(c.execute(
+            "SELECT timestamp_ms, force FROM reading WHERE user_id IS ? ORDER BY timestamp_ms", (user_id,)
+        ).fetchall(), dtype=np.float64).reshape(-1, 2)
+        rows = _rep_rows(user_id, arr[:, 0] / 1000, arr[:, 1], weights.get(user_id))
+        if rows:
+            _insert_rows(c, "rep", rows)
+
+
+def _flask_v3_data_versions(c):
+    # bumped by the writers below so cached /stats/user summaries know when they're stale
+    cache.init_versions(conn=c)
+
+
+def _flask_v4_calibration(c):
+    # per-device calibration profiles, and the uncalibrated value of each reading
+    calibration.init_calibration(conn=c)
+    migrations.add_columns(c, "reading", {"raw_force": "FLOAT"})
+
+
+# Schema steps for this app's tables (create_all only creates missing tables)
+FLASK_MIGRATIONS = [
+    (1, "query indexes", _flask_v1_indexes),
+    (2, "rep metrics", _flask_v2_reps),
+    (3, "data versions", _flask_v3_data_versions),
+    (4, "calibration", _flask_v4_calibration),
+]
+
+# Rollups are keyed by user id (as text) and fed from the `reading` table
+READING_ROLLUP_SQL = "SELECT CAST(user_id AS TEXT), timestamp_ms, force, NULL FROM reading"
+
 with app.app_context():
     # Create tables if they don't exist
     db.create_all()
+    migrations.migrate(DB_PATH, FLASK_MIGRATIONS, component="flask")
+    # First run with rollups: build them from the readings already stored
+    if rollups.init_rollups(DB_PATH):
+        rollups.rebuild_rollups(DB_PATH, READING_ROLLUP_SQL)
+
+
+def _insert_readings(rows):
+    """Insert `reading` rows (dicts), fold them into the rollups and mark the users' cached stats stale.
+
+    All in one transaction, like force_db's writer, so nobody sees readings
+    without their rollups or under an old data version. Returns the last id.
+    """
+    users = [None if r["user_id"] is None else str(r["user_id"]) for r in rows]
+    with transaction(DB_PATH) as conn:
+        last_id = _insert_rows(conn, "reading", rows)
+        rollups.apply_batch(conn, users, [r["timestamp_ms"] for r in rows], [r["force"] for r in rows])
+        cache.bump_versions(conn, "readings", set(users))
+    return last_id
 
 
 # ---------------------------
@@ -302,26 +223,38 @@ def stats_for_user(username):
     except Exception:
         user = None
 
+    # Served from the rollup tables: cost depends on buckets, not on stored readings; and
+    # cached until the user's readings or reps change, so unchanged data is one lookup
     if user is None:
-        total_force = None
+        stats = {
+            "count": 0, "total_force": 0.0, "avg_force": 0.0, "min_force": 0.0, "max_force": 0.0,
+        }
+        reps = None
     else:
-        row = db.session.query(
-        func.count(Reading.id).label('count'),
-        func.avg(Reading.force).label('avg_force'),
-        func.sum(Reading.force).label('total_force'),
-        func.min(Reading.force).label('min_force'),
-        func.max(Reading.force).label('max_force'),
-    ).filter(Reading.user_id == user.id).first()
-
-    stats = {
-        "count": int(row.count or 0),
-        "total_force": float(row.total_force) if row.total_force is not None else 0.0,
-        "avg_force": float(row.avg_force) if row.avg_force is not None else 0.0,
-        "min_force": float(row.min_force) if row.min_force is not None else 0.0,
-        "max_force": float(row.max_force) if row.max_force is not None else 0.0,
-    }
+        stats, reps = cache.cached(
+            "user_stats", user.id, ("readings", "reps"),
+            lambda: (rollups.user_summary(str(user.id), db=DB_PATH), _rep_summary(user.id)),
+            db=DB_PATH,
+        )
 
-    return render_template("stats.html", selected_user=username, stats=stats)
+    return render_template("stats.html", selected_user=username, stats=stats, reps=reps)
+
+
+def _rep_summary(user_id, recent=10):
+    """Rep count, bests and averages plus the latest reps, from the per-rep metrics stored as reps end."""
+    count, best_peak, best_rfd, avg_mean, avg_drop_off = db.session.query(
+        func.count(Rep.id), func.max(Rep.peak_force), func.max(Rep.max_rfd),
+        func.avg(Rep.mean_force), func.avg(Rep.drop_off),
+    ).filter(Rep.user_id == user_id).one()
+    latest = Rep.query.filter_by(user_id=user_id).order_by(Rep.start_ms.desc()).limit(recent).all()
+    return {
+        "count": count,
+        "best_peak": best_peak or 0.0,
+        "best_rfd": best_rfd or 0.0,
+        "avg_mean_force": avg_mean or 0.0,
+        "avg_drop_off": avg_drop_off or 0.0,
+        "latest": [r.to_dict() for r in latest],
+    }
 
 @app.route("/create_user")
 def create_user():
@@ -355,24 +288,50 @@ def connect_status():
         {
             "running": ble_manager.is_running(),
             "connected": ble_manager.is_connected(),
+            "stream": ble_manager.stream_stats(),
+            "reconnects": ble_manager.reconnect_stats(),
+            "devices": {
+                device_id: ble_manager.is_connected(device_id)
+                for device_id in ble_manager.device_ids()
+            },
         }
     )
 
 
 @app.route("/data")
 def data():
-    """Return the latest force reading and timestamps."""
+    """Return the latest force reading and timestamps.
+
+    With `?since=<seq>` also return every buffered sample newer than that
+    sequence number, so pollers don't miss readings between requests.
+    `?device=<id>` selects a sensor when several are configured.
+    """
     ts = time.time()
     ts_ms = int(ts * 1000)
     ts_iso = datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
-    return jsonify(
-        {
-            "time": ts,
-            "time_ms": ts_ms,
-            "time_iso": ts_iso,
-            "force": force,
+    device_id = request.args.get("device")
+    if device_id is not None and device_id not in ble_manager.sessions:
+        return jsonify({"error": "unknown device"}), 404
+    latest = ble_manager.latest(device_id)
+    payload = {
+        "time": ts,
+        "time_ms": ts_ms,
+        "time_iso": ts_iso,
+        "force": latest[2] if latest else 0.0,
+        "seq": latest[1] if latest else -1,
+    }
+
+    since = request.args.get("since", type=int)
+    if since is not None:
+        t, seq, values = ble_manager.samples_since(since, device_id)
+        # buffer times are monotonic; shift them onto the wall clock
+        offset_ms = ts_ms - time.monotonic() * 1000
+        payload["samples"] = {
+            "time_ms": (t * 1000 + offset_ms).astype("int64").tolist(),
+            "seq": seq.tolist(),
+            "force": values.tolist(),
         }
-    )
+    return jsonify(payload)
 
 
 # API: create a user
@@ -433,14 +392,126 @@ def api_readings():
             timestamp_iso=timestamp_iso,
             force=float(rforce),
         )
-        db.session.add(reading)
-        db.session.commit()
+        reading.id = _insert_readings([{k: v for k, v in reading.to_dict().items() if k != "id"}])
         return jsonify(reading.to_dict()), 201
 
     recent = Reading.query.order_by(Reading.timestamp_ms.desc()).limit(100).all()
     return jsonify([r.to_dict() for r in recent])
 
 
+# API: force history for charts, downsampled to at most `points` buckets
+@app.route("/api/history")
+def api_history():
+    user_id = request.args.get("user_id")
+    end_ms = request.args.get("end_ms", type=int) or int(time.time() * 1000)
+    start_ms = request.args.get("start_ms", type=int) or end_ms - 24 * 3600 * 1000
+    points = request.args.get("points", default=500, type=int)
+    hist = rollups.query_rollups(user_id, start_ms, end_ms, max_points=points, db=DB_PATH)
+    return jsonify({
+        "resolution_ms": hist["resolution_ms"],
+        "bucket_ms": hist["bucket_ms"].tolist(),
+        "count": hist["count"].tolist(),
+        "min": hist["min"].tolist(),
+        "max": hist["max"].tolist(),
+        "mean": hist["mean"].tolist(),
+    })
+
+
+# ---------------------------
+# Server-side workout protocols
+# ---------------------------
+# All users' timers run on one background asyncio loop; clients poll for events.
+protocol_host = ProtocolHost()
+
+
+def _write_samples(user_id, forces, times, raw):
+    rows = [{
+        "user_id": user_id,
+        "timestamp_ms": int(t * 1000),
+        "timestamp_iso": datetime.fromtimestamp(t, tz=timezone.utc).isoformat(),
+        "force": float(f),
+        "raw_force": float(r),
+    } for f, t, r in zip(forces, times, raw)]
+    if rows:
+        _insert_readings(rows)
+
+
+def _save_rep(row):
+    with transaction(DB_PATH) as conn:
+        _insert_rows(conn, "rep", [row])
+        cache.bump_versions(conn, "reps", [None if row["user_id"] is None else str(row["user_id"])])
+
+
+def _rep_handler(user_id, key):
+    def on_rep(rep, event):
+        row = {
+            "user_id": user_id, "run_key": key,
+            "set_number": event["phase"]["set"], "rep_number": event["phase"]["rep"],
+            "start_ms": rep["start"] * 1000, "end_ms": rep["end"] * 1000, **rep["metrics"],
+        }
+        runner = protocol_host.get(key)
+        if runner is not None:
+            runner.publish("rep", rep=row)  # pollers get the numbers as soon as the rep ends
+        asyncio.get_running_loop().run_in_executor(None, _save_rep, row)
+    return on_rep
+
+
+def _reading_sink(user_id):
+    def sink(forces, times, event, raw):
+        # DB work goes to a worker thread so the shared timer loop never waits on it
+        asyncio.get_running_loop().run_in_executor(None, _write_samples, user_id, forces, times, raw)
+    return sink
+
+
+@app.route("/api/protocols")
+def protocol_presets():
+    return jsonify({key: {"protocol": p, "duration": total_duration(compile_protocol(p))}
+                    for key, p in PRESETS.items()})
+
+
+@app.route("/api/protocols/start", methods=["POST"])
+def protocol_start():
+    payload = request.get_json() or {}
+    protocol = payload.get("protocol") or PRESETS.get(payload.get("preset"))
+    if protocol is None:
+        return jsonify({"error": "protocol or known preset required"}), 400
+    try:
+        compile_protocol(protocol)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"invalid protocol: {e}"}), 400
+    user_id = payload.get("user_id")
+    key = str(payload.get("key") or user_id or "default")
+    subscribers = []
+    if payload.get("record"):
+        subscribers.append(recording_subscriber(ble_manager, _reading_sink(user_id),
+                                                payload.get("device"), raw=True))
+        user = db.session.get(User, user_id) if user_id is not None else None
+        on, off = rep_thresholds(user.weight if user else None)
+        subscribers.append(rep_subscriber(ble_manager, _rep_handler(user_id, key), on, off,
+                                          payload.get("device")))
+    runner = protocol_host.start(key, protocol, subscribers)
+    return jsonify({"key": key, "timeline": [p._asdict() for p in runner.timeline]}), 201
+
+
+@app.route("/api/protocols/<key>")
+def protocol_status(key):
+    runner = protocol_host.get(key)
+    if runner is None:
+        return jsonify({"error": "no such protocol run"}), 404
+    since = request.args.get("since", default=0, type=int)
+    events = runner.events_since(since)
+    return jsonify({
+        "status": runner.status(),
+        "events": [e for _, e in events],
+        "next": events[-1][0] + 1 if events else since,
+    })
+
+
+@app.route("/api/protocols/<key>/stop", methods=["POST"])
+def protocol_stop(key):
+    return jsonify({"stopped": protocol_host.stop(key)})
+
+
 # Run the app
 if __name__ == "__main__":
     # Important note for development: avoid Flask auto-reloader while developing BLE code,
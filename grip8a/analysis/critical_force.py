@@ -0,0 +1,156 @@
+import sqlite3
+import time
+import numpy as np
+from grip8a.db import cache
+from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection, transaction
+from grip8a.db.migrations import migrate
+from grip8a.utils.protocols import PRESETS
+
+DB = DB_FORCE
+
+# ----------------------
+# Critical force / W'
+# ----------------------
+#
+# From an all-out repeater test (PRESETS["cf_test_7_3"]: 24 x 7 s on, 3 s off,
+# every rep as hard as possible) force falls until it levels off:
+#
+#   critical force  the end-test plateau, the mean hold force of the last
+#                   PLATEAU_REPS reps (highest force sustainable "forever")
+#   W'              the impulse above critical force summed over the test,
+#                   sum of max(0, impulse - CF * duration) per rep (force * s)
+#
+# Works from the per-rep metrics stored with each rep (analysis/metrics.py),
+# so every rep of every test of every user is handled in one vectorized pass.
+
+PLATEAU_REPS = 6     # reps at the end of the test that form the plateau
+MIN_TEST_REPS = 12   # fewer detected reps than this isn't a usable test
+CF_TEST_PROTOCOL = PRESETS["cf_test_7_3"]["name"]
+
+
+def estimate(groups, mean_force, impulse, duration, plateau_reps=PLATEAU_REPS, min_reps=MIN_TEST_REPS):
+    """Critical force and W' for many tests at once.
+
+    Inputs are one entry per rep, grouped by test and in rep order within
+    each test (`groups` any sortable test key, contiguous). Returns a dict
+    of arrays, one entry per test: group, reps, critical_force, w_prime,
+    plateau_cv (spread of the plateau reps; high means no real plateau).
+    Tests with fewer than `min_reps` reps get NaN.
+    """
+    groups = np.asarray(groups)
+    mean_force = np.asarray(mean_force, dtype=np.float64)
+    impulse = np.asarray(impulse, dtype=np.float64)
+    duration = np.asarray(duration, dtype=np.float64)
+    n = len(groups)
+    if n == 0:
+        empty = np.empty(0)
+        return {"group": groups[:0], "reps": np.empty(0, dtype=np.int64), "critical_force": empty,
+                "w_prime": empty, "plateau_cv": empty}
+
+    first = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    reps = np.diff(np.append(first, n))
+    test = np.repeat(np.arange(len(first)), reps)
+    from_end = np.repeat(first + reps, reps) - 1 - np.arange(n)
+
+    plateau = (from_end < plateau_reps).astype(np.float64)
+    count = np.bincount(test, weights=plateau)
+    cf = np.bincount(test, weights=mean_force * plateau) / count
+    spread = np.bincount(test, weights=(mean_force - cf[test]) ** 2 * plateau) / count
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.sqrt(spread) / cf
+    above = np.maximum(impulse - cf[test] * duration, 0.0)
+    w_prime = np.bincount(test, weights=above)
+
+    usable = reps >= min_reps
+    return {
+        "group": groups[first],
+        "reps": reps,
+        "critical_force": np.where(usable, cf, np.nan),
+        "w_prime": np.where(usable, w_prime, np.nan),
+        "plateau_cv": np.where(usable, cv, np.nan),
+    }
+
+
+# ----------------------
+# Stored tests
+# ----------------------
+
+def load_test_reps(user=None, protocol=CF_TEST_PROTOCOL, db=None):
+    """Per-rep (session_id, user, started_ms, mean_force, impulse, duration) arrays of every test, in rep order."""
+    where, params = ["ws.protocol = ?", "r.mean_force IS NOT NULL"], [protocol]
+    if user is not None:
+        where.append("ws.user = ?")
+        params.append(user)
+    rows = get_connection(db or DB).execute(f"""
+        SELECT r.session_id, s.set_number, r.rep_number, ws.user, ws.started_ms,
+               r.mean_force, r.impulse, (r.offset_ms - r.onset_ms) / 1000.0
+        FROM workout_reps r
+        JOIN workout_sessions ws ON ws.id = r.session_id
+        JOIN workout_sets s ON s.id = r.set_id
+        WHERE {' AND '.join(where)}
+    """, params).fetchall()
+    if not rows:
+        return None
+    session_id, set_number, rep_number, users, started_ms, mean_force, impulse, duration = zip(*rows)
+    # sorting here is cheaper than an ORDER BY temp b-tree in SQLite
+    order = np.lexsort((rep_number, set_number, session_id))
+    return {
+        "session_id": np.array(session_id, dtype=np.int64)[order],
+        "user": np.array(users, dtype=object)[order],
+        "started_ms": np.array(started_ms, dtype=np.int64)[order],
+        "mean_force": np.array(mean_force, dtype=np.float64)[order],
+        "impulse": np.array(impulse, dtype=np.float64)[order],
+        "duration": np.array(duration, dtype=np.float64)[order],
+    }
+
+
+def _estimate_tests(user, protocol, db):
+    """estimate() over the stored tests (of `user`), as one dict per test."""
+    reps = load_test_reps(user, protocol, db)
+    if reps is None:
+        return []
+    result = estimate(reps["session_id"], reps["mean_force"], reps["impulse"], reps["duration"])
+    first = np.searchsorted(reps["session_id"], result["group"])
+    return [{
+        "session_id": int(session_id), "user": user_, "started_ms": int(started_ms), "reps": int(count),
+        "critical_force": None if np.isnan(cf) else float(cf),
+        "w_prime": None if np.isnan(wp) else float(wp),
+        "plateau_cv": None if np.isnan(cv) else float(cv),
+    } for session_id, user_, started_ms, count, cf, wp, cv in zip(
+        result["group"], reps["user"][first], reps["started_ms"][first], result["reps"],
+        result["critical_force"], result["w_prime"], result["plateau_cv"])]
+
+
+def update_critical_force(user=None, protocol=CF_TEST_PROTOCOL, db=None):
+    """Estimate CF and W' for every stored test (of `user`) and save them. Returns the tests saved.
+
+    The estimates are reused from the analytics cache until reps are re-measured.
+    """
+    db = db or DB
+    migrate(db)
+    tests = cache.cached("critical_force", user, ("reps",), lambda: _estimate_tests(user, protocol, db),
+                         params=(protocol,), db=db)
+    if not tests:
+        return tests
+    now_ms = int(time.time() * 1000)
+    with transaction(db) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO critical_force_tests
+                (session_id, user, started_ms, reps, critical_force, w_prime, plateau_cv, computed_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(t["session_id"], t["user"], t["started_ms"], t["reps"], t["critical_force"],
+               t["w_prime"], t["plateau_cv"], now_ms) for t in tests])
+    return tests
+
+
+def latest_critical_force(user, db=None):
+    """The user's most recent usable test as a dict, or None."""
+    c = get_connection(db or DB).cursor()
+    c.row_factory = sqlite3.Row
+    row = c.execute("""
+        SELECT * FROM critical_force_tests
+        WHERE user = ? AND critical_force IS NOT NULL
+        ORDER BY started_ms DESC LIMIT 1
+    """, (user,)).fetchone()
+    return dict(row) if row else None
@@ -0,0 +1,289 @@
+import math
+import os
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from grip8a.ble.config import FORCE_FILTERS
+
+# ----------------------
+# Force signal conditioning
+# ----------------------
+#
+# A FilterChain runs raw sensor values through a list of stages:
+#
+#   Tare(offset)                    subtract the unloaded reading
+#   MovingAverage(window)           mean of the last `window` samples
+#   LowPass(alpha | cutoff_hz, rate_hz)
+#                                   first-order IIR, y += alpha * (x - y)
+#   MedianDespike(window, threshold)
+#                                   running median; with a threshold only
+#                                   samples that far from it are replaced
+#   Decimate(factor)                keep every `factor`-th sample
+#
+# Every stage works both ways: step() one sample at a time in constant
+# memory (the live path), and process() a whole array in NumPy (stored
+# data, or a notification's batch of samples). Both do the same floating
+# point operations in the same order, so the results are bit-identical
+# however the stream is cut into chunks. Stages look at sample counts, not
+# time stamps, so windows and cut-offs assume a steady sample rate.
+#
+# The live path is configured with a spec string such as
+# "tare:offset=12|median:window=5,threshold=40|lowpass:cutoff_hz=20,rate_hz=1000"
+# (see load_filters()).
+
+
+class Tare:
+    def __init__(self, offset=0.0):
+        self.offset = float(offset)
+
+    def reset(self):
+        pass
+
+    def step(self, x):
+        return x - self.offset
+
+    def process(self, x):
+        return x - self.offset
+
+
+class MovingAverage:
+    """Mean of the last `window` samples (of fewer while the window fills)."""
+
+    def __init__(self, window=5):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        self._last = deque(maxlen=self.window)
+
+    def step(self, x):
+        self._last.append(x)
+        # sum() adds oldest to newest, the same order process() uses
+        return sum(self._last) / len(self._last)
+
+    def process(self, x):
+        n, m = self.window, len(x)
+        history = list(self._last)[-(n - 1):] if n > 1 else []
+        padded = np.concatenate((np.zeros(n - 1 - len(history)), history, x))
+        total = np.zeros(m)
+        for j in range(n):  # window position by position, oldest first
+            total += padded[j:j + m]
+        count = np.minimum(len(history) + np.arange(1, m + 1), n).astype(np.float64)
+        self._last.extend(x[-n:].tolist())
+        return total / count
+
+
+class LowPass:
+    """First-order IIR low-pass, y[i] = d * y[i-1] + alpha * x[i] with d = 1 - alpha.
+
+    Give `alpha` directly, or `cutoff_hz` and the stream's `rate_hz`. The
+    filter starts from the first sample (as if it had always been there).
+
+    The recursion is evaluated in closed form over blocks of `block`
+    samples, counted from the start of the stream: with c the output just
+    before the block and k the position in it,
+
+        S[k] = alpha * x[0] * d**0 + ... + alpha * x[k] * d**-k
+        y[k] = d**(k + 1) * c + d**k * S[k]
+
+    so process() is a cumsum per block plus one scalar step per block, and
+    step() does the same multiplications and additions one sample at a
+    time. `block` is capped so d**-block stays far from overflowing.
+    """
+
+    MAX_BLOCK = 1024
+
+    def __init__(self, alpha=None, cutoff_hz=None, rate_hz=None):
+        if alpha is None:
+            if not cutoff_hz or not rate_hz:
+                raise ValueError("LowPass needs alpha, or cutoff_hz and rate_hz")
+            dt, rc = 1.0 / rate_hz, 1.0 / (2 * math.pi * cutoff_hz)
+            alpha = dt / (rc + dt)
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = float(alpha)
+        d = 1.0 - self.alpha
+        self.block = 1 if d == 0 else max(1, min(self.MAX_BLOCK, int(300 / -math.log2(d))))
+        k = np.arange(self.block)
+        self._w = d ** -k.astype(np.float64)       # weight of x[k] in S
+        self._q = d ** k.astype(np.float64)        # weight of S[k] in y[k]
+        self._p = d ** (k + 1).astype(np.float64)  # weight of c in y[k]
+        self._wl, self._ql, self._pl = self._w.tolist(), self._q.tolist(), self._p.tolist()
+        self.reset()
+
+    def reset(self):
+        self._y = None      # last output
+        self._k = 0         # position of the next sample in its block
+        self._carry = None  # output just before the current block
+        self._sum = 0.0     # S so far in the current block
+
+    def step(self, x):
+        k = self._k
+        if k == 0:
+            self._carry = x if self._y is None else self._y
+            self._sum = 0.0
+        self._sum += self.alpha * x * self._wl[k]
+        self._y = self._pl[k] * self._carry + self._ql[k] * self._sum
+        self._k = (k + 1) % self.block
+        return self._y
+
+    def process(self, x):
+        m, n, k = len(x), self.block, self._k
+        if m == 0:
+            return np.empty(0)
+        if k == 0:
+            self._carry = float(x[0]) if self._y is None else self._y
+        # lay the batch out on the block grid; the running S of a block
+        # already under way goes just before its next sample, so cumsum
+        # continues it with the same additions step() would do
+        padded = np.zeros(-(-(k + m) // n) * n)
+        if k:
+            padded[k - 1] = self._sum
+        padded[k:k + m] = self.alpha * x * self._w[(k + np.arange(m)) % n]
+        sums = np.cumsum(padded.reshape(-1, n), axis=1)
+
+        carries = [self._carry]
+        p_last, q_last = self._pl[-1], self._ql[-1]
+        for s in sums[:-1, -1].tolist():
+            carries.append(p_last * carries[-1] + q_last * s)
+        y = (self._p * np.array(carries)[:, None] + self._q * sums).ravel()[k:k + m]
+
+        self._k = (k + m) % n
+        self._y = float(y[-1])
+        self._carry = carries[-1]
+        self._sum = float(sums[-1, self._k - 1]) if self._k else 0.0
+        return y
+
+
+class MedianDespike:
+    """Running median of the last `window` samples (the lower median while it fills).
+
+    With `threshold`, a sample is only replaced by the median when it is
+    more than `threshold` away from it, so the signal itself isn't smoothed.
+    """
+
+    def __init__(self, window=5, threshold=None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = int(window)
+        self.threshold = None if threshold is None else float(threshold)
+        self.reset()
+
+    def reset(self):
+        self._last = deque(maxlen=self.window)
+
+    def step(self, x):
+        self._last.append(x)
+        median = sorted(self._last)[(len(self._last) - 1) // 2]
+        if self.threshold is None or abs(x - median) > self.threshold:
+            return median
+        return x
+
+    def process(self, x):
+        n, m = self.window, len(x)
+        history = list(self._last)[-(n - 1):] if n > 1 else []
+        values = np.concatenate((history, x))
+        median = np.empty(m)
+        filling = max(0, min(m, n - 1 - len(history)))  # outputs whose window isn't full yet
+        for k in range(filling):
+            window = np.sort(values[:len(history) + k + 1])
+            median[k] = window[(len(window) - 1) // 2]
+        if m > filling:
+            windows = sliding_window_view(values[len(history) + filling - n + 1:], n)
+            median[filling:] = np.partition(windows, (n - 1) // 2, axis=1)[:, (n - 1) // 2]
+        self._last.extend(x[-n:].tolist())
+        if self.threshold is None:
+            return median
+        return np.where(np.abs(x - median) > self.threshold, median, x)
+
+
+class Decimate:
+    """Keep every `factor`-th sample (the first one, then every factor after it)."""
+
+    def __init__(self, factor=2):
+        if factor < 1:
+            raise ValueError("factor must be at least 1")
+        self.factor = int(factor)
+        self.reset()
+
+    def reset(self):
+        self._seen = 0
+
+    def step(self, x):
+        keep = self._seen % self.factor == 0
+        self._seen += 1
+        return x if keep else None
+
+    def keep(self, n):
+        """Mask of which of the next `n` samples survive."""
+        mask = (self._seen + np.arange(n)) % self.factor == 0
+        self._seen += n
+        return mask
+
+
+class FilterChain:
+    """Stages applied in order to a stream of (time, force) samples."""
+
+    def __init__(self, *stages):
+        self.stages = list(stages)
+
+    def reset(self):
+        """Forget the stream so far (e.g. after a reconnect)."""
+        for stage in self.stages:
+            stage.reset()
+
+    def step(self, t, force):
+        """Filter one sample. Returns (t, force), or None when it is decimated away."""
+        x = float(force)
+        for stage in self.stages:
+            x = stage.step(x)
+            if x is None:
+                return None
+        return t, x
+
+    def process(self, times, forces):
+        """Filter a batch of samples, continuing from the previous batch. Returns (times, forces)."""
+        t = np.asarray(times, dtype=np.float64)
+        x = np.asarray(forces, dtype=np.float64)
+        for stage in self.stages:
+            if len(x) == 0:
+                break
+            if isinstance(stage, Decimate):
+                mask = stage.keep(len(x))
+                t, x = t[mask], x[mask]
+            else:
+                x = stage.process(x)
+        return t, x
+
+
+STAGES = {
+    "tare": Tare,
+    "average": MovingAverage,
+    "lowpass": LowPass,
+    "median": MedianDespike,
+    "decimate": Decimate,
+}
+
+
+def parse_filters(spec):
+    """FilterChain from a spec like "median:window=5|lowpass:alpha=0.2", or None for an empty spec."""
+    stages = []
+    for part in filter(None, (p.strip() for p in spec.split("|"))):
+        name, _, args = part.partition(":")
+        if name not in STAGES:
+            raise ValueError(f"unknown filter {name!r}")
+        options = {}
+        for item in filter(None, args.split(",")):
+            key, _, value = item.partition("=")
+            options[key] = float(value) if "." in value or "e" in value else int(value)
+        stages.append(STAGES[name](**options))
+    return FilterChain(*stages) if stages else None
+
+
+def load_filters(spec=None):
+    """parse_filters() of `spec`, defaulting to GRIP8A_FORCE_FILTERS, then FORCE_FILTERS in ble/config.py."""
+    if spec is None:
+        spec = os.environ.get("GRIP8A_FORCE_FILTERS", FORCE_FILTERS)
+    return parse_filters(spec)
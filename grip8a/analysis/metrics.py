@@ -0,0 +1,117 @@
+import math
+from collections import deque
+import numpy as np
+
+# ----------------------
+# Per-rep force metrics
+# ----------------------
+#
+# Computed over a rep as segmented by reps.py: every sample inside
+# [start, end], with the curve pinned to the `off` threshold at both ends
+# (that is where the boundaries were interpolated).
+#
+#   peak_force      highest sample
+#   time_to_peak_s  start -> peak
+#   max_rfd         steepest rise over any RFD_WINDOW, force units / s
+#   impulse         force integrated over the rep (trapezoids), force * s
+#   mean_force      impulse / duration, i.e. time-weighted mean over the hold
+#   drop_off        1 - (mean of the last DROP_OFF_WINDOW) / peak, as a fraction
+#
+# RepMetrics folds samples in one at a time (O(1) amortized), so the numbers
+# are ready the moment the detector ends the rep; rep_metrics() and
+# segment_metrics() are the vectorized equivalents for stored data.
+
+RFD_WINDOW = 0.1        # seconds
+DROP_OFF_WINDOW = 1.0   # seconds at the end of the rep compared with the peak
+
+METRIC_FIELDS = ("peak_force", "time_to_peak_s", "max_rfd", "impulse", "mean_force", "drop_off")
+
+
+def _result(start, end, impulse, peak, peak_t, max_rfd, tail_mean):
+    duration = end - start
+    return {
+        "peak_force": peak,
+        "time_to_peak_s": peak_t - start,
+        "max_rfd": max_rfd,
+        "impulse": impulse,
+        "mean_force": impulse / duration if duration > 0 else peak,
+        "drop_off": 1.0 - tail_mean / peak if peak > 0 else 0.0,
+    }
+
+
+class RepMetrics:
+    """Running metrics for one rep. reset() at its start, add() each sample, result() at its end."""
+
+    def __init__(self, rfd_window=RFD_WINDOW, tail_window=DROP_OFF_WINDOW):
+        self.rfd_window = rfd_window
+        self.tail_window = tail_window
+
+    def reset(self, start, level):
+        self.start = start
+        self.level = level
+        self.impulse = 0.0
+        self.peak, self.peak_t = level, start
+        self.max_rfd = 0.0
+        self._last = (start, level)
+        self._window = deque([(start, level)])  # samples within rfd_window of the newest
+        self._tail = deque([(start, level)])    # samples within tail_window of the newest
+
+    def add(self, t, f):
+        t0, f0 = self._last
+        self.impulse += (f + f0) * (t - t0) / 2
+        self._last = (t, f)
+        if f > self.peak:
+            self.peak, self.peak_t = f, t
+
+        window = self._window
+        window.append((t, f))
+        while window[0][0] < t - self.rfd_window:
+            window.popleft()
+        # only full windows: a short span at the very start would exaggerate noise
+        tj, fj = window[0]
+        if t - self.start >= self.rfd_window and t > tj:
+            rfd = (f - fj) / (t - tj)
+            if rfd > self.max_rfd:
+                self.max_rfd = rfd
+
+        tail = self._tail
+        tail.append((t, f))
+        while tail[0][0] < t - self.tail_window:
+            tail.popleft()
+
+    def result(self, end):
+        """Metrics for the rep ending at `end` (where the force crossed the level again)."""
+        t0, f0 = self._last
+        impulse = self.impulse + (self.level + f0) * (end - t0) / 2
+        tail = [f for t, f in self._tail if t >= end - self.tail_window]
+        tail_mean = math.fsum(tail) / len(tail) if tail else self.level
+        return _result(self.start, end, impulse, self.peak, self.peak_t, self.max_rfd, tail_mean)
+
+
+def rep_metrics(times, forces, start, end, level, rfd_window=RFD_WINDOW, tail_window=DROP_OFF_WINDOW):
+    """RepMetrics for one rep, vectorized. `times`/`forces` may extend past the rep."""
+    t = np.asarray(times, dtype=np.float64)
+    f = np.asarray(forces, dtype=np.float64)
+    lo, hi = np.searchsorted(t, start, side="left"), np.searchsorted(t, end, side="right")
+    t = np.concatenate(([start], t[lo:hi]))
+    f = np.concatenate(([level], f[lo:hi]))
+
+    tt, ff = np.append(t, end), np.append(f, level)
+    impulse = float(np.sum((ff[1:] + ff[:-1]) * np.diff(tt) / 2))
+    p = int(np.argmax(f))
+
+    j = np.searchsorted(t, t - rfd_window, side="left")
+    span = t - t[j]
+    full = (t - start >= rfd_window) & (span > 0)
+    rfd = (f[full] - f[j[full]]) / span[full]
+    max_rfd = max(0.0, float(rfd.max())) if len(rfd) else 0.0
+
+    tail = f[t >= end - tail_window]
+    tail_mean = math.fsum(tail.tolist()) / len(tail) if len(tail) else level
+    return _result(start, end, impulse, float(f[p]), float(t[p]), max_rfd, tail_mean)
+
+
+def segment_metrics(times, forces, reps, level, **kwargs):
+    """rep_metrics() for every (start, end) row of `reps` over one stream (e.g. segment_reps output)."""
+    return [rep_metrics(times, forces, start, end, level, **kwargs)
+            for start, end in np.asarray(reps, dtype=np.float64).reshape(-1, 2).tolist()]
@@ -0,0 +1,254 @@
+import numpy as np
+from grip8a.analysis.metrics import segment_metrics
+from grip8a.db import workout_db
+
+# ----------------------
+# Rep detection
+# ----------------------
+#
+# A rep starts when the force climbs over the `on` threshold and ends when it
+# falls back under the lower `off` threshold (hysteresis, so noise around one
+# level can't toggle it). Both boundaries are reported where the force
+# crossed `off`, interpolated between the two samples around the crossing,
+# so an early pull or a late release is timed exactly rather than snapped to
+# the countdown. A dip under `off` shorter than `min_gap` (a regrip) doesn't
+# end the rep, and reps shorter than `min_duration` are dropped.
+#
+# RepDetector does this one sample at a time in O(1); segment_reps() is the
+# same rule vectorized over a whole stored stream and gives identical
+# boundaries, so history can be re-segmented in bulk.
+
+# Thresholds as fractions of bodyweight (force and bodyweight in the same unit)
+REP_ON_FRACTION = 0.20
+REP_OFF_FRACTION = 0.10
+# Used instead when the bodyweight isn't known, added to the calibrated baseline
+REP_ON_FORCE = 10.0
+REP_OFF_FORCE = 5.0
+
+REP_MIN_DURATION = 0.3   # seconds; shorter pulls are discarded
+REP_MIN_GAP = 0.15       # seconds under `off` that still count as the same rep
+
+
+def rep_thresholds(bodyweight=None, baseline=0.0, on_fraction=REP_ON_FRACTION, off_fraction=REP_OFF_FRACTION):
+    """(on, off) force thresholds above `baseline` (the unloaded reading)."""
+    if bodyweight:
+        return baseline + on_fraction * bodyweight, baseline + off_fraction * bodyweight
+    return baseline + REP_ON_FORCE, baseline + REP_OFF_FORCE
+
+
+def _cross(t0, f0, t1, f1, level):
+    """Time at which the line from (t0, f0) to (t1, f1) passes `level`."""
+    return t0 + (level - f0) * (t1 - t0) / (f1 - f0)
+
+
+class RepDetector:
+    """Streaming rep segmentation: feed (time, force) samples, get rep events.
+
+    Events are tuples ("start", start), ("end", start, end, metrics) and
+    ("cancel", start) for a rep that turned out shorter than `min_duration`.
+    A rep's end is only certain `min_gap` after the force drops, so the end
+    event arrives that much later, but carries the exact drop time.
+    `callback(event)` is called for each event, if given.
+
+    With `metrics=RepMetrics` (see metrics.py; any factory with the same
+    interface works), each rep's metrics are accumulated as its samples
+    arrive and come with its end event; otherwise metrics is None.
+    """
+
+    def __init__(self, on, off, min_duration=REP_MIN_DURATION, min_gap=REP_MIN_GAP, callback=None,
+                 metrics=None):
+        if off > on:
+            raise ValueError("the off threshold must not be above the on threshold")
+        self.on = on
+        self.off = off
+        self.min_duration = min_duration
+        self.min_gap = min_gap
+        self.callback = callback
+        self.metrics = metrics
+        self.active = False
+        self.start = None
+        self.reps = []         # (start, end) of every completed rep
+        self.rep_metrics = []  # metrics of each completed rep (None without a factory)
+        self._prev = None      # last (t, f)
+        self._rise = None      # where the force last went over `off`
+        self._drop = None      # where an active rep went under `off`, pending min_gap
+        self._dip = []         # samples since the drop: part of the rep if it turns out a regrip
+        self._acc = None       # metrics accumulator of the rising or active rep
+
+    def _emit(self, event):
+        if self.callback is not None:
+            self.callback(event)
+        return event
+
+    def _finish(self):
+        start, end = self.start, self._drop
+        acc, self._acc = self._acc, None
+        self.active, self.start, self._drop = False, None, None
+        if end - start < self.min_duration:
+            return self._emit(("cancel", start))
+        metrics = acc.result(end) if acc is not None else None
+        self.reps.append((start, end))
+        self.rep_metrics.append(metrics)
+        return self._emit(("end", start, end, metrics))
+
+    def update(self, t, f):
+        """Process one sample. Returns the events it caused (usually none)."""
+        prev, self._prev = self._prev, (t, f)
+        events = ()
+        if self._drop is not None:
+            if t - self._drop > self.min_gap:
+                events = (self._finish(),)
+            elif f >= self.on:
+                self._drop = None  # regrip, same rep
+                if self._acc is not None:
+                    for sample in self._dip:
+                        self._acc.add(*sample)
+                    self._acc.add(t, f)
+                self._dip = []
+                return events
+            else:
+                self._dip.append((t, f))
+        if self.active and self._drop is None:
+            if f < self.off:
+                self._drop = _cross(prev[0], prev[1], t, f, self.off)
+                self._rise = None
+                self._dip = [(t, f)]
+            elif self._acc is not None:
+                self._acc.add(t, f)
+            return events
+
+        # idle, or waiting out a dip: remember where the next rise began
+        if f < self.off:
+            self._rise = None
+        elif self._rise is None:
+            self._rise = t if prev is None else _cross(prev[0], prev[1], t, f, self.off)
+        if not self.active:
+            if self._rise is None:
+                self._acc = None
+            elif self._acc is not None:
+                self._acc.add(t, f)
+            elif self.metrics is not None:
+                self._acc = self.metrics()
+                self._acc.reset(self._rise, self.off)
+                # a rise that began while the last rep's end was pending
+                for sample in self._dip:
+                    if sample[0] >= self._rise:
+                        self._acc.add(*sample)
+                self._acc.add(t, f)
+            if self._dip:
+                self._dip = []
+            if f >= self.on:
+                self.active, self.start = True, self._rise
+                events += (self._emit(("start", self.start)),)
+        return events
+
+    def feed(self, times, forces):
+        """Process a chunk of samples. Returns the events it caused."""
+        events = []
+        for t, f in zip(np.asarray(times, dtype=np.float64).tolist(),
+                        np.asarray(forces, dtype=np.float64).tolist()):
+            events.extend(self.update(t, f))
+        return events
+
+    def flush(self):
+        """End of stream: settle a pending end, and end a rep still in progress at the last sample."""
+        if self.active and self._drop is None and self._prev is not None:
+            self._drop = self._prev[0]
+        if self._drop is not None:
+            return self._finish()
+        return None
+
+
+def segment_reps(times, forces, on, off, min_duration=REP_MIN_DURATION, min_gap=REP_MIN_GAP):
+    """Vectorized RepDetector over a whole stream. Returns an (n, 2) array of (start, end).
+
+    Matches feeding the same samples to RepDetector and calling flush().
+    """
+    t = np.asarray(times, dtype=np.float64)
+    f = np.asarray(forces, dtype=np.float64)
+    n = len(f)
+    if n == 0:
+        return np.empty((0, 2))
+    idx = np.arange(n)
+    # hysteresis state: set by a sample >= on, reset by one < off, held in between
+    last_on = np.maximum.accumulate(np.where(f >= on, idx, -1))
+    last_off = np.maximum.accumulate(np.where(f < off, idx, -1))
+    state = np.concatenate(([0], (last_on > last_off).astype(np.int8), [0]))
+    edges = np.diff(state)
+    rise = np.flatnonzero(edges == 1)   # first sample >= on
+    fall = np.flatnonzero(edges == -1)  # first sample < off (n: still up at the end)
+    if len(rise) == 0:
+        return np.empty((0, 2))
+
+    # start: the `off` crossing just before the rise (or the first sample);
+    # end: the `off` crossing at the fall (or the last sample)
+    # (the masked-out lanes may divide by zero; np.where discards them)
+    j = last_off[rise]
+    j0, j1 = np.maximum(j, 0), np.minimum(j + 1, n - 1)
+    k = np.minimum(fall, n - 1)
+    k0 = np.maximum(k - 1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        start = np.where(j >= 0, _cross(t[j0], f[j0], t[j1], f[j1], off), t[0])
+        end = np.where(fall < n, _cross(t[k0], f[k0], t[k], f[k], off), t[n - 1])
+
+    # merge across regrips: the next rep reached `on` within min_gap of the drop
+    new = np.concatenate(([True], t[rise[1:]] - end[:-1] > min_gap))
+    first = np.flatnonzero(new)
+    last = np.concatenate((first[1:] - 1, [len(new) - 1]))
+    reps = np.column_stack((start[first], end[last]))
+    return reps[reps[:, 1] - reps[:, 0] >= min_duration]
+
+
+# ----------------------
+# Re-segmenting stored sessions
+# ----------------------
+
+def match_reps(detected, planned):
+    """For each planned (start, end), the index of the detected rep overlapping it most, or -1."""
+    detected = np.asarray(detected, dtype=np.float64).reshape(-1, 2)
+    planned = np.asarray(planned, dtype=np.float64).reshape(-1, 2)
+    if len(detected) == 0:
+        return np.full(len(planned), -1)
+    overlap = (np.minimum(planned[:, 1:2], detected[:, 1])
+               - np.maximum(planned[:, 0:1], detected[:, 0]))
+    best = np.argmax(overlap, axis=1)
+    return np.where(overlap[np.arange(len(planned)), best] > 0, best, -1)
+
+
+def resegment_session(session_id, bodyweight=None, baseline=0.0,
+                      min_duration=REP_MIN_DURATION, min_gap=REP_MIN_GAP):
+    """Detect reps over a stored session and update each rep's onset/offset and metrics.
+
+    Each workout rep gets the detected rep that overlaps its timed window
+    most. Reps nothing overlaps keep what they had, and a session with no
+    stored samples (archived, say) is left alone. Returns the detected
+    (start, end) array in Unix seconds.
+    """
+    ts_ms, forces = workout_db.session_samples(session_id)
+    if len(ts_ms) == 0:
+        return np.empty((0, 2))
+    if bodyweight is None:
+        bodyweight = workout_db.session_bodyweight(session_id)
+    on, off = rep_thresholds(bodyweight, baseline)
+    t = ts_ms / 1000.0
+    reps = segment_reps(t, forces, on, off, min_duration, min_gap)
+
+    rows = workout_db.session_reps(session_id)
+    planned = [(r["started_ms"] / 1000.0, (r["ended_ms"] or r["started_ms"]) / 1000.0) for r in rows]
+    matched = match_reps(reps, planned)
+    metrics = iter(segment_metrics(t, forces, reps[matched[matched >= 0]], off))
+    bounds = []
+    for row, i in zip(rows, matched.tolist()):
+        if i >= 0:
+            onset, offset = (reps[i] * 1000).tolist()
+            bounds.append((row["rep_id"], onset, offset, next(metrics)))
+    workout_db.set_rep_bounds_many(bounds)
+    return reps
+
+
+def resegment_history(user=None, **kwargs):
+    """resegment_session() for every stored session (of `user`), e.g. to backfill metrics.
+
+    Returns {session_id: detected rep count}.
+    """
+    return {sid: len(resegment_session(sid, **kwargs)) for sid in workout_db.session_ids(user)}
@@ -0,0 +1,159 @@
+import threading
+import time
+import numpy as np
+
+DEFAULT_CAPACITY = 16384
+
+
+class ForceBuffer:
+    """Fixed-capacity ring buffer of (monotonic time, sequence number, force).
+
+    Written from the BLE loop thread, read from anywhere. Storage is
+    preallocated NumPy arrays so appends never allocate and reads are slices.
+    Once full, the oldest samples are overwritten. Each sample also keeps the
+    sensor's raw value from before calibration; reads return it with raw=True.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self._t = np.zeros(self.capacity, dtype=np.float64)
+        self._seq = np.zeros(self.capacity, dtype=np.int64)
+        self._force = np.zeros(self.capacity, dtype=np.float64)
+        self._raw = np.zeros(self.capacity, dtype=np.float64)
+        self._count = 0      # total samples ever written
+        self._next_seq = 0   # sequence number given to the next sample
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    # ----------------------
+    # Writes
+    # ----------------------
+
+    def append(self, force, t=None, raw=None):
+        """Store one sample and return its sequence number. `raw` defaults to `force`."""
+        if t is None:
+            t = time.monotonic()
+        with self._lock:
+            if self._count:
+                t = max(t, self._t[(self._count - 1) % self.capacity])
+            i = self._count % self.capacity
+            seq = self._next_seq
+            self._t[i] = t
+            self._seq[i] = seq
+            self._force[i] = force
+            self._raw[i] = force if raw is None else raw
+            self._count += 1
+            self._next_seq = seq + 1
+        return seq
+
+    def extend(self, forces, times, skip=0, raw=None):
+        """Store a batch of samples in one vectorized write.
+
+        `times` must be non-decreasing; values earlier than the newest stored
+        sample are clamped so the time column stays sorted. `skip` advances
+        the sequence counter first, leaving a visible hole for lost samples.
+        `raw` (same length as `forces`) defaults to `forces`. Returns the
+        sequence number of the first stored sample.
+        """
+        forces = np.asarray(forces, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        raw = forces if raw is None else np.asarray(raw, dtype=np.float64)
+        n = len(forces)
+        with self._lock:
+            first_seq = self._next_seq + skip
+            if n == 0:
+                self._next_seq = first_seq
+                return first_seq
+            if self._count:
+                times = np.maximum(times, self._t[(self._count - 1) % self.capacity])
+            seqs = np.arange(first_seq, first_seq + n, dtype=np.int64)
+            if n > self.capacity:
+                # only the newest `capacity` samples can survive anyway
+                drop = n - self.capacity
+                forces, times, seqs, raw = forces[drop:], times[drop:], seqs[drop:], raw[drop:]
+                self._count += drop
+                n = self.capacity
+            idx = (self._count + np.arange(n)) % self.capacity
+            self._t[idx] = times
+            self._seq[idx] = seqs
+            self._force[idx] = forces
+            self._raw[idx] = raw
+            self._count += n
+            self._next_seq = int(seqs[-1]) + 1
+        return first_seq
+
+    # ----------------------
+    # Reads
+    # ----------------------
+
+    def latest(self):
+        """Most recent (t, seq, force), or None if nothing has arrived yet."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            i = (self._count - 1) % self.capacity
+            return float(self._t[i]), int(self._seq[i]), float(self._force[i])
+
+    def snapshot(self):
+        """All retained samples, oldest first, as (t, seq, force) arrays."""
+        with self._lock:
+            return self._slice(0)
+
+    def since(self, seq, raw=False):
+        """Samples with sequence number greater than `seq`, oldest first.
+
+        Pass the last sequence number you consumed (or -1 for everything).
+        If the reader fell behind by more than `capacity` samples the gap
+        shows up as a jump in the returned sequence numbers. With `raw` the
+        uncalibrated values come back as a fourth array.
+        """
+        with self._lock:
+            return self._slice(self._search(self._seq, seq, "right"), raw=raw)
+
+    def last(self, seconds, now=None):
+        """Samples that arrived within the last `seconds` of monotonic time."""
+        if now is None:
+            now = time.monotonic()
+        return self.between(now - seconds, now)
+
+    def between(self, t_start, t_end):
+        """Samples with t_start <= t <= t_end, oldest first."""
+        with self._lock:
+            lo = self._search(self._t, t_start, "left")
+            hi = self._search(self._t, t_end, "right")
+            return self._slice(lo, hi)
+
+    # ----------------------
+    # Internals (call with lock held)
+    # ----------------------
+
+    def _search(self, arr, value, side):
+        """Logical index for `value` in a sorted column, without unrolling the ring."""
+        if self._count <= self.capacity:
+            return int(np.searchsorted(arr[:self._count], value, side=side))
+        head = self._count % self.capacity
+        older = arr[head:]
+        k = int(np.searchsorted(older, value, side=side))
+        if k < len(older):
+            return k
+        return len(older) + int(np.searchsorted(arr[:head], value, side=side))
+
+    def _slice(self, lo, hi=None, raw=False):
+        n = len(self)
+        if hi is None:
+            hi = n
+        hi = min(hi, n)
+        lo = min(max(lo, 0), hi)
+        head = self._count % self.capacity if self._count > self.capacity else 0
+        idx = (head + np.arange(lo, hi)) % self.capacity
+        if raw:
+            return self._t[idx], self._seq[idx], self._force[idx], self._raw[idx]
+        return self._t[idx], self._seq[idx], self._force[idx]
@@ -1,2 +1,25 @@
 DEVICE_NAME = "Grip8a"
 CHARACTERISTIC_UUID = "5387e989-6064-48e4-9387-688c754efcfa"
+
+# Devices a BLEManager() connects to by default. Add one entry per sensor
+# (e.g. left/right hand); "id" tags the stream, "address" skips the first scan.
+DEVICES = [
+    {"id": "grip8a", "name": DEVICE_NAME, "characteristic_uuid": CHARACTERISTIC_UUID},
+]
+
+# Samples kept in memory per device (ring buffer, oldest overwritten first)
+BUFFER_CAPACITY = 16384
+
+# Reconnect tuning (seconds)
+DIRECT_CONNECT_TIMEOUT = 5.0    # connect to the remembered address without scanning
+SCAN_TIMEOUT = 5.0              # name-filtered scan, returns at the first match
+RECONNECT_BACKOFF_BASE = 0.25   # first retry delay; doubles per failure, with jitter
+RECONNECT_BACKOFF_MAX = 8.0
+
+# Signal conditioning applied to every device's samples as they arrive, e.g.
+# "median:window=5,threshold=40|lowpass:cutoff_hz=20,rate_hz=1000" (see
+# grip8a/analysis/filters.py). Empty keeps the raw values. A device entry
+# can set its own "filters"; GRIP8A_FORCE_FILTERS overrides this default.
+# Filters run before calibration (grip8a/db/calibration.py), so thresholds
+# and offsets are in sensor units.
+FORCE_FILTERS = ""
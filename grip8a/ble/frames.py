@@ -0,0 +1,118 @@
+import struct
+import numpy as np
+
+# ----------------------
+# Frame format (version 1)
+# ----------------------
+#
+# offset  size  field
+# 0       1     magic (0xA8)
+# 1       1     version (1)
+# 2       1     sample type code (see SAMPLE_TYPES)
+# 3       1     sample count N
+# 4       2     device sequence number of the first sample (uint16, wraps)
+# 6       2     sample interval in microseconds (0 = unknown)
+# 8       N*k   samples, little-endian
+#
+# The sequence number counts samples, not frames, so the next frame is
+# expected to start at seq + N. Anything else is a gap (lost samples) or a
+# duplicate/late frame.
+
+FRAME_MAGIC = 0xA8
+FRAME_VERSION = 1
+HEADER = struct.Struct("<BBBBHH")
+SEQ_MODULO = 1 << 16
+
+SAMPLE_TYPES = {
+    0: np.dtype("<u2"),
+    1: np.dtype("<i2"),
+    2: np.dtype("<i4"),
+    3: np.dtype("<f4"),
+}
+_TYPE_CODES = {dt: code for code, dt in SAMPLE_TYPES.items()}
+
+
+def encode_frame(seq, samples, dtype="<i2", interval_us=0):
+    """Pack samples into a version 1 frame (used by firmware tests and the simulator)."""
+    dt = np.dtype(dtype)
+    values = np.asarray(samples, dtype=dt)
+    if len(values) > 255:
+        raise ValueError("at most 255 samples per frame")
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, _TYPE_CODES[dt], len(values),
+                         seq % SEQ_MODULO, interval_us)
+    return header + values.tobytes()
+
+
+def decode_frame(data):
+    """Decode one frame into (seq, interval_us, samples) or return None.
+
+    Never raises on malformed input: the caller is the BLE callback and a
+    bad packet should cost a couple of comparisons, not an exception.
+    """
+    if len(data) < HEADER.size or data[0] != FRAME_MAGIC or data[1] != FRAME_VERSION:
+        return None
+    _, _, type_code, count, seq, interval_us = HEADER.unpack_from(data)
+    dt = SAMPLE_TYPES.get(type_code)
+    if dt is None or len(data) != HEADER.size + count * dt.itemsize:
+        return None
+    samples = np.frombuffer(data, dtype=dt, count=count, offset=HEADER.size)
+    return seq, interval_us, samples.astype(np.float64)
+
+
+def is_frame(data):
+    return len(data) >= HEADER.size and data[0] == FRAME_MAGIC and data[1] == FRAME_VERSION
+
+
+class FrameDecoder:
+    """Per-device frame decoder that tracks the sequence counter for gap detection."""
+
+    def __init__(self):
+        self.expected_seq = None
+        self.frames = 0
+        self.samples = 0
+        self.lost_samples = 0
+        self.gaps = 0
+        self.late_frames = 0
+        self.malformed = 0
+
+    def reset(self):
+        """Forget the sequence position (e.g. after a reconnect)."""
+        self.expected_seq = None
+
+    def decode(self, data):
+        """Return (gap, interval_us, samples) for a frame, or None if it must be dropped.
+
+        `gap` is how many samples were lost just before this frame.
+        """
+        frame = decode_frame(data)
+        if frame is None:
+            self.malformed += 1
+            return None
+        seq, interval_us, samples = frame
+
+        gap = 0
+        if self.expected_seq is not None:
+            diff = (seq - self.expected_seq) % SEQ_MODULO
+            if diff >= SEQ_MODULO // 2:
+                # behind where we are: duplicate or reordered frame
+                self.late_frames += 1
+                return None
+            gap = diff
+            if gap:
+                self.gaps += 1
+                self.lost_samples += gap
+
+        self.expected_seq = (seq + len(samples)) % SEQ_MODULO
+        self.frames += 1
+        self.samples += len(samples)
+        return gap, interval_us, samples
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "samples": self.samples,
+            "lost_samples": self.lost_samples,
+            "gaps": self.gaps,
+            "late_frames": self.late_frames,
+            "malformed": self.malformed,
+        }
@@ -1,30 +1,334 @@
-import asyncio, threading
-from bleak import BleakClient, BleakScanner
-from .config import DEVICE_NAME, CHARACTERISTIC_UUID
+import asyncio, threading, time
+import numpy as np
+from grip8a.analysis.filters import load_filters
+from grip8a.db import calibration
+from .buffer import ForceBuffer
+from .frames import FrameDecoder, is_frame
+from .reconnect import Backoff, ReconnectStats
+from .config import (DEVICES, CHARACTERISTIC_UUID, BUFFER_CAPACITY,
+                     DIRECT_CONNECT_TIMEOUT, SCAN_TIMEOUT,
+                     RECONNECT_BACKOFF_BASE, RECONNECT_BACKOFF_MAX)
 
-force = 0.0   # shared global reading
-
-def notification_handler(sender, data):
-    global force
+def parse_payload(data):
+    """Decode a single-sample notification payload, or return None."""
     try:
-        force = int.from_bytes(data, byteorder="little", signed=False)
-    except:
+        return int.from_bytes(data, byteorder="little", signed=False)
+    except Exception:
         try:
-            force = float(data.decode().strip())
-        except:
-            pass
+            return float(data.decode().strip())
+        except Exception:
+            return None
+
+
+class DeviceSession:
+    """One force sensor: its connection, reconnect state, decoder and sample buffer.
+
+    Sessions don't own a thread or loop; BLEManager runs every session's
+    run() coroutine on its single background loop.
+    """
+
+    def __init__(self, manager, device_id, name, characteristic_uuid=CHARACTERISTIC_UUID,
+                 address=None, buffer_capacity=BUFFER_CAPACITY, filters=None):
+        self.manager = manager
+        self.device_id = device_id
+        self.device_name = name
+        self.characteristic_uuid = characteristic_uuid
+        # last address we connected to; tried directly before falling back to a scan
+        self.address = address
+        self.reconnects = ReconnectStats()
+        # every notification lands here with its arrival time and sequence number
+        self.buffer = ForceBuffer(buffer_capacity)
+        self.decoder = FrameDecoder()
+        # signal conditioning applied before samples are buffered (None: raw values)
+        self.filters = load_filters(filters)
+        # profile turning filtered sensor values into force (db/calibration.py);
+        # looked up by address on every connect if the manager has a calibration
+        # DB, None stores the values as they are
+        self.calibration = None
+        # sensor temperature for the profile's temperature term, if something reports it
+        self.temperature = None
+        self.client = None
+
+    def notification_handler(self, sender, data):
+        """Bleak notification callback. Runs on the BLE loop thread.
+
+        Framed payloads (see frames.py) carry many samples and are decoded in
+        one step; anything else is treated as a legacy single-sample payload.
+        Either way the samples go through the device's filters, then its
+        calibration profile, before they are buffered, so the UI and the DB
+        only ever see conditioned values. The buffer keeps the filtered but
+        uncalibrated values alongside.
+        """
+        now = self.manager.clock()
+        if is_frame(data):
+            frame = self.decoder.decode(data)
+            if frame is None:
+                return
+            gap, interval_us, samples = frame
+            n = len(samples)
+            if n == 0:
+                return
+            # the notification arrives after its last sample; back-date the rest
+            times = now - np.arange(n - 1, -1, -1) * (interval_us * 1e-6)
+            if self.filters is not None:
+                times, samples = self.filters.process(times, samples)
+            raw = np.asarray(samples, dtype=np.float64)
+            profile = self.calibration
+            forces = raw if profile is None else calibration.apply(profile, raw, self.temperature)
+            self.buffer.extend(forces, times, skip=gap, raw=raw)
+            return
+
+        value = parse_payload(data)
+        if value is None:
+            return
+        if self.filters is not None:
+            sample = self.filters.step(now, value)
+            if sample is None:
+                return
+            now, value = sample
+        profile = self.calibration
+        if profile is None:
+            self.buffer.append(value, now)
+        else:
+            self.buffer.append(float(calibration.apply(profile, value, self.temperature)), now, raw=value)
+
+    def load_calibration(self):
+        """Look up the current calibration profile for the device's address.
+
+        Does nothing unless the manager was given a (migrated) calibration_db.
+        """
+        if self.address is None or self.manager.calibration_db is None:
+            return
+        try:
+            self.calibration = calibration.profile_for(self.address, db=self.manager.calibration_db)
+        except Exception as e:
+            print(f"BLE[{self.device_id}]: could not load calibration for {self.address}:", e)
+            return
+        if self.calibration is not None:
+            print(f"BLE[{self.device_id}]: calibration profile {self.calibration['id']} "
+                  f"({self.calibration['units']})")
+
+    async def _connect(self, on_disconnect):
+        """Connect to the device, returning (client, via) or (None, None).
+
+        Tries the remembered address first, which skips scanning entirely.
+        Otherwise scans with a name filter that returns at the first match.
+        """
+        client_cls = self.manager.client_cls
+        if self.address:
+            client = client_cls(
+                self.address, disconnected_callback=on_disconnect,
+                timeout=DIRECT_CONNECT_TIMEOUT,
+            )
+            try:
+                await client.connect()
+                return client, "direct"
+            except Exception as e:
+                print(f"BLE[{self.device_id}]: direct connect to {self.address} failed:", e)
+
+        print(f"BLE[{self.device_id}]: scanning for", self.device_name)
+        device = await self.manager.scanner_cls.find_device_by_name(
+            self.device_name, timeout=SCAN_TIMEOUT
+        )
+        if device is None:
+            return None, None
+        client = client_cls(device, disconnected_callback=on_disconnect)
+        await client.connect()
+        self.address = device.address
+        return client, "scan"
+
+    async def run(self, stop_event: asyncio.Event):
+        """Coroutine that connects, subscribes to notifications and reconnects on drops.
+
+        Runs inside the manager's background asyncio loop.
+        """
+        self.client = None
+        backoff = Backoff(RECONNECT_BACKOFF_BASE, RECONNECT_BACKOFF_MAX)
+        self.reconnects.link_lost()
+        try:
+            while not stop_event.is_set():
+                disconnected = asyncio.Event()
+                client = None
+                self.reconnects.attempts += 1
+                try:
+                    client, via = await self._connect(lambda _c: disconnected.set())
+                    if client is None:
+                        self.reconnects.failures += 1
+                        delay = backoff.next()
+                        print(f"BLE[{self.device_id}]: device not found, retrying in {delay:.1f}s...")
+                        await _sleep(stop_event, delay)
+                        continue
+
+                    self.client = client
+                    print(f"BLE[{self.device_id}]: Connected to {self.device_name} ({self.address})")
+                    # device counter may have restarted; don't report it as a gap
+                    self.decoder.reset()
+                    # and don't smooth across the outage
+                    if self.filters is not None:
+                        self.filters.reset()
+                    # a DB lookup; keep it off the loop so notifications aren't held up
+                    await asyncio.get_running_loop().run_in_executor(None, self.load_calibration)
+                    await client.start_notify(
+                        self.characteristic_uuid, self.notification_handler
+                    )
+                    self.reconnects.link_up(via)
+                    backoff.reset()
+
+                    # Run until a stop is requested or the link drops
+                    waiters = [
+                        asyncio.ensure_future(stop_event.wait()),
+                        asyncio.ensure_future(disconnected.wait()),
+                    ]
+                    try:
+                        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        for w in waiters:
+                            w.cancel()
+
+                    if stop_event.is_set():
+                        # When stopping, try to stop notifications cleanly
+                        try:
+                            await client.stop_notify(self.characteristic_uuid)
+                        except Exception:
+                            pass
+                        break
+
+                    # Connection dropped: go straight back to a direct connect
+                    print(f"BLE[{self.device_id}]: Disconnected unexpectedly, reconnecting...")
+                    self.reconnects.disconnects += 1
+                    self.reconnects.link_lost()
+
+                except Exception as e:
+                    print(f"BLE[{self.device_id}] task iteration error:", e)
+                    self.reconnects.failures += 1
+                    await _sleep(stop_event, backoff.next())
+                finally:
+                    if client is not None:
+                        try:
+                            await client.disconnect()
+                        except Exception:
+                            pass
+                    self.client = None
+        finally:
+            # ensure we clear client reference
+            self.client = None
+            print(f"BLE[{self.device_id}]: task exiting")
+
+
+async def _sleep(stop_event, delay):
+    """Sleep for `delay` seconds, waking early if a stop is requested."""
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        pass
+
 
 class BLEManager:
-    def __init__(self):
+    """Runs any number of device sessions on one background asyncio loop.
+
+    With no arguments the devices listed in config.DEVICES are used. Passing
+    `device_name` (and optionally `characteristic_uuid`) configures a single
+    device, which is what older callers do. Every buffer is stamped from the
+    same monotonic clock so streams from different devices line up.
+
+    `backend` swaps Bleak for a simulated or replay backend (see simulator.py).
+    Calibration profiles are read from `calibration_db`, a migrated DB holding
+    calibration_profiles; without one samples are buffered uncalibrated.
+    """
+
+    def __init__(self, device_name=None, characteristic_uuid=CHARACTERISTIC_UUID,
+                 buffer_capacity=BUFFER_CAPACITY, address=None,
+                 client_cls=None, scanner_cls=None, devices=None,
+                 backend=None, calibration_db=None):
+        # Bleak-compatible classes, swappable for a fake/simulated backend
+        if backend is not None:
+            client_cls, scanner_cls = backend.client_cls, backend.scanner_cls
+        elif client_cls is None or scanner_cls is None:
+            # only the real radio needs bleak, and it's slow to import
+            from bleak import BleakClient, BleakScanner
+            client_cls = client_cls or BleakClient
+            scanner_cls = scanner_cls or BleakScanner
+        self.client_cls = client_cls
+        self.scanner_cls = scanner_cls
+        # shared time base for every device's buffer
+        self.clock = time.monotonic
+        self.buffer_capacity = buffer_capacity
+        self.calibration_db = calibration_db
+        self.sessions = {}  # device_id -> DeviceSession, in insertion order
         self.loop = None
         self.thread = None
         self.stop_event = None  # asyncio.Event created inside the loop
-        self.task_future = (
-            None  # concurrent.futures.Future for the coroutine running the BLE task
-        )
-        self.client = None
+        self.task_futures = {}  # device_id -> concurrent.futures.Future for its session
         self._lock = threading.Lock()
 
+        if devices is None and device_name is not None:
+            devices = [{"id": device_name, "name": device_name,
+                        "characteristic_uuid": characteristic_uuid, "address": address}]
+        for spec in (DEVICES if devices is None else devices):
+            self.add_device(**spec)
+
+    # ----------------------
+    # Devices
+    # ----------------------
+
+    def add_device(self, id, name, characteristic_uuid=CHARACTERISTIC_UUID, address=None, filters=None):
+        """Register a device; if the manager is running it starts connecting right away.
+
+        `filters` is a filter spec (see analysis/filters.py); None uses the configured default.
+        """
+        with self._lock:
+            if id in self.sessions:
+                raise ValueError(f"device id {id!r} already registered")
+            session = DeviceSession(self, id, name, characteristic_uuid, address,
+                                    self.buffer_capacity, filters)
+            self.sessions[id] = session
+            if self.loop is not None and self.task_futures:
+                self._launch(session)
+        return session
+
+    def remove_device(self, device_id, timeout=10):
+        """Disconnect and forget one device without disturbing the others."""
+        with self._lock:
+            session = self.sessions.pop(device_id)
+            fut = self.task_futures.pop(device_id, None)
+        if fut is not None:
+            fut.cancel()
+            try:
+                fut.result(timeout=timeout)
+            except Exception:
+                pass
+        return session
+
+    def session(self, device_id=None):
+        """Session for `device_id`, or the first registered device."""
+        if device_id is None:
+            return next(iter(self.sessions.values()))
+        return self.sessions[device_id]
+
+    def device_ids(self):
+        return list(self.sessions)
+
+    def set_calibration(self, device_id=None, profile=None):
+        """Calibrate a device with `profile` from now on (None: look it up again by address)."""
+        session = self.session(device_id)
+        if profile is None:
+            session.load_calibration()
+        else:
+            session.calibration = profile
+
+    # Single-device conveniences, kept for callers written before multi-device support
+    @property
+    def buffer(self):
+        return self.session().buffer
+
+    @property
+    def client(self):
+        return self.session().client
+
+    # ----------------------
+    # Loop management
+    # ----------------------
+
     def _start_loop_thread(self):
         """Create and start the asyncio event loop in a background thread."""
         self.loop = asyncio.new_event_loop()
@@ -43,27 +347,34 @@ class BLEManager:
     async def _create_event(self):
         return asyncio.Event()
 
+    def _launch(self, session):
+        """Schedule a session's coroutine on the background loop (lock held)."""
+        self.task_futures[session.device_id] = asyncio.run_coroutine_threadsafe(
+            session.run(self.stop_event), self.loop
+        )
+
     def start(self):
-        """Start the background BLE task (non-blocking)."""
+        """Start the background BLE tasks for every device (non-blocking)."""
         with self._lock:
-            if self.task_future and not self.task_future.done():
-                # already running
-                return
             if self.loop is None:
                 self._start_loop_thread()
-            # Schedule the BLE coroutine on the background loop
-            self.task_future = asyncio.run_coroutine_threadsafe(
-                self._ble_task(self.stop_event), self.loop
-            )
+            for device_id, session in self.sessions.items():
+                fut = self.task_futures.get(device_id)
+                if fut and not fut.done():
+                    # already running
+                    continue
+                self._launch(session)
 
     def is_running(self):
         with self._lock:
-            return bool(self.task_future and not self.task_future.done())
+            return any(not f.done() for f in self.task_futures.values())
 
-    def is_connected(self):
+    def is_connected(self, device_id=None):
         # very lightweight check: see if client reference exists and is connected
         with self._lock:
-            client = self.client
+            if not self.sessions:
+                return False
+            client = self.session(device_id).client
         if client is None:
             return False
         try:
@@ -85,24 +396,23 @@ class BLEManager:
             return False
 
     def stop(self, timeout=10):
-        """Request the BLE task to stop and tear down the background loop."""
+        """Request every BLE task to stop and tear down the background loop."""
         with self._lock:
             if not self.loop or not self.stop_event:
                 return
-            # signal the task to stop
+            # signal the tasks to stop
             try:
-                asyncio.run_coroutine_threadsafe(
-                    self.stop_event.set(), self.loop
-                ).result(timeout=2)
+                self.loop.call_soon_threadsafe(self.stop_event.set)
             except Exception as e:
                 print("Error signaling BLE stop_event:", e)
 
-            # wait for the task to exit
-            if self.task_future:
+            # wait for the tasks to exit
+            deadline = time.monotonic() + timeout
+            for device_id, fut in self.task_futures.items():
                 try:
-                    self.task_future.result(timeout=timeout)
+                    fut.result(timeout=max(0.0, deadline - time.monotonic()))
                 except Exception as e:
-                    print("BLE task did not finish cleanly:", e)
+                    print(f"BLE[{device_id}] task did not finish cleanly:", e)
 
             # stop the loop
             try:
@@ -118,67 +428,56 @@ class BLEManager:
             self.loop = None
             self.thread = None
             self.stop_event = None
-            self.task_future = None
-            self.client = None
+            self.task_futures = {}
+            for session in self.sessions.values():
+                session.client = None
 
-    async def _ble_task(self, stop_event: asyncio.Event):
-        """Coroutine that scans, connects, subscribes to notifications and keeps running.
+    # ----------------------
+    # Stats
+    # ----------------------
 
-        Runs inside the background asyncio loop.
-        """
-        self.client = None
-        try:
-            while not stop_event.is_set():
-                try:
-                    print("BLE: scanning for devices...")
-                    devices = await BleakScanner.discover()
-                    target = None
-                    for d in devices:
-                        if d.name == DEVICE_NAME:
-                            target = d
-                            break
-
-                    if not target:
-                        print("BLE: device not found, retrying in 5s...")
-                        await asyncio.sleep(5)
-                        continue
+    def stream_stats(self, device_id=None):
+        """Frame decoding counters: frames, samples, lost samples, gaps, ..."""
+        return self.session(device_id).decoder.stats()
 
-                    client = BleakClient(target.address)
-                    self.client = client
-                    # Use context manager to ensure clean disconnects on exit
-                    async with client:
-                        print(f"BLE: Connected to {DEVICE_NAME} ({target.address})")
-                        try:
-                            await client.start_notify(
-                                CHARACTERISTIC_UUID, notification_handler
-                            )
-                        except Exception as e:
-                            print("BLE: Failed to start notify:", e)
-                            # let context manager exit and retry
-                            await asyncio.sleep(5)
-                            continue
-
-                        # Wait until stop_event is set (i.e. until a stop is requested)
-                        await stop_event.wait()
+    def reconnect_stats(self, device_id=None):
+        """Connect counters and reconnect latency (link lost -> notifications flowing)."""
+        return self.session(device_id).reconnects.as_dict()
 
-                        # When stopping, try to stop notifications cleanly
-                        try:
-                            await client.stop_notify(CHARACTERISTIC_UUID)
-                        except Exception:
-                            pass
+    # ----------------------
+    # Buffer reads (safe from any thread)
+    # ----------------------
 
-                    # If we get here and stop_event was set, break out
-                    if stop_event.is_set():
-                        break
+    def latest(self, device_id=None):
+        """Most recent (t, seq, force) or None."""
+        return self.session(device_id).buffer.latest()
 
-                    # Otherwise, connection dropped unexpectedly - retry after a pause
-                    print("BLE: Disconnected unexpectedly, retrying in 5s...")
-                    await asyncio.sleep(5)
+    def latest_force(self, default=0.0, device_id=None):
+        sample = self.latest(device_id)
+        return default if sample is None else sample[2]
 
-                except Exception as e:
-                    print("BLE task iteration error:", e)
-                    await asyncio.sleep(5)
-        finally:
-            # ensure we clear client reference
-            self.client = None
-            print("BLE: task exiting")
+    def samples_since(self, seq, device_id=None, raw=False):
+        """(t, seq, force) arrays for every sample after sequence number `seq` (plus raw values with `raw`)."""
+        return self.session(device_id).buffer.since(seq, raw=raw)
+
+    def samples_last(self, seconds, device_id=None):
+        """(t, seq, force) arrays for the last `seconds` of monotonic time."""
+        return self.session(device_id).buffer.last(seconds, now=self.clock())
+
+    def aligned(self, seconds, rate_hz, device_ids=None):
+        """Resample several devices onto one shared time grid.
+
+        Returns (t, {device_id: forces}) covering the last `seconds`, with
+        each stream linearly interpolated at `rate_hz`. Devices with no
+        samples in the window come back as NaN.
+        """
+        now = self.clock()
+        t = np.arange(now - seconds, now, 1.0 / rate_hz)
+        out = {}
+        for device_id in (device_ids or self.device_ids()):
+            st, _, sf = self.session(device_id).buffer.between(t[0], now)
+            if len(st) == 0:
+                out[device_id] = np.full(len(t), np.nan)
+            else:
+                out[device_id] = np.interp(t, st, sf, left=np.nan, right=np.nan)
+        return t, out
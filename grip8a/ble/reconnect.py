@@ -0,0 +1,68 @@
+import random
+import time
+from collections import deque
+
+
+class Backoff:
+    """Exponential backoff with jitter.
+
+    Each call to next() doubles the ceiling (up to `maximum`) and returns a
+    random delay in the upper half of it, so several devices that dropped
+    together don't all retry in lockstep.
+    """
+
+    def __init__(self, base=0.25, maximum=8.0, factor=2.0, rng=None):
+        self.base = base
+        self.maximum = maximum
+        self.factor = factor
+        self.rng = rng or random.Random()
+        self.attempt = 0
+
+    def next(self):
+        ceiling = min(self.maximum, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return self.rng.uniform(ceiling / 2, ceiling)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ReconnectStats:
+    """Counters and latency history for the connect/reconnect path."""
+
+    def __init__(self, history=50):
+        self.attempts = 0
+        self.failures = 0
+        self.direct_connects = 0
+        self.scan_connects = 0
+        self.disconnects = 0
+        self._lost_at = None
+        self._latencies = deque(maxlen=history)
+
+    def link_lost(self, now=None):
+        """Mark the moment data stopped flowing (start, or unexpected disconnect)."""
+        self._lost_at = time.monotonic() if now is None else now
+
+    def link_up(self, via, now=None):
+        """Record a successful (re)connect; `via` is "direct" or "scan"."""
+        now = time.monotonic() if now is None else now
+        if via == "direct":
+            self.direct_connects += 1
+        else:
+            self.scan_connects += 1
+        if self._lost_at is not None:
+            self._latencies.append(now - self._lost_at)
+            self._lost_at = None
+
+    def as_dict(self):
+        lat = list(self._latencies)
+        return {
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "direct_connects": self.direct_connects,
+            "scan_connects": self.scan_connects,
+            "disconnects": self.disconnects,
+            "last_latency_s": lat[-1] if lat else None,
+            "mean_latency_s": sum(lat) / len(lat) if lat else None,
+            "max_latency_s": max(lat) if lat else None,
+        }
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+
+# Frames are stamped when they arrive, so a sample taken just before the end
+# of a window can still be in flight; close() waits this long for it.
+CLOSE_GRACE = 0.05
+
+
+class WindowRecorder:
+    """Hands every sample a device streamed inside [start, end] to `sink`.
+
+    Times are on the manager's clock (time.monotonic by default, the same
+    clock as DeadlineScheduler). `sink(forces, wall_times)` gets NumPy arrays,
+    with wall_times in Unix seconds; with raw=True it is called as
+    sink(forces, wall_times, raw_values), the values from before calibration.
+    Samples are pulled from the device's ring buffer by sequence number, so
+    nothing is polled or resampled: each pump() forwards exactly the samples
+    that arrived since the last one. Call pump() now and then during long
+    windows so the buffer can't wrap.
+    """
+
+    def __init__(self, manager, sink, device_id=None, raw=False):
+        self.manager = manager
+        self.sink = sink
+        self.device_id = device_id
+        self.raw = raw
+        self.start = None
+        self.samples = 0
+        self.lost = 0
+        self._seq = -1
+        self._wall_offset = 0.0
+
+    def open(self, start=None):
+        """Begin a window at `start` (manager clock; default now)."""
+        now = self.manager.clock()
+        self.start = now if start is None else start
+        self._wall_offset = time.time() - now
+        self.samples = 0
+        self.lost = 0
+        # resume from the last sample before the window (it may start in the past)
+        t, seq, _ = self.manager.samples_since(-1, self.device_id)
+        i = np.searchsorted(t, self.start, side="left")
+        self._seq = int(seq[i - 1]) if i else (int(seq[0]) - 1 if len(seq) else -1)
+
+    def pump(self, until=None):
+        """Forward samples that arrived since the last pump (and are no later than `until`)."""
+        t, seq, forces, *raw = self.manager.samples_since(self._seq, self.device_id, raw=self.raw)
+        if len(t) == 0:
+            return 0
+        if until is not None:
+            n = np.searchsorted(t, until, side="right")
+            t, seq, forces, raw = t[:n], seq[:n], forces[:n], [r[:n] for r in raw]
+            if n == 0:
+                return 0
+        # holes in the sequence are samples dropped on the link or overwritten in the buffer
+        self.lost += int(seq[-1] - self._seq) - len(seq)
+        self._seq = int(seq[-1])
+        self.sink(forces, t + self._wall_offset, *raw)
+        self.samples += len(t)
+        return len(t)
+
+    def close(self, end=None, grace=CLOSE_GRACE):
+        """End the window at `end` (default now) and forward what's left. Returns stats."""
+        end = self.manager.clock() if end is None else end
+        wait = end + grace - self.manager.clock()
+        if wait > 0:
+            time.sleep(wait)
+        self.pump(until=end)
+        duration = end - self.start
+        return {
+            "samples": self.samples,
+            "lost": self.lost,
+            "duration_s": round(duration, 3),
+            "rate_hz": round(self.samples / duration, 1) if duration > 0 else 0.0,
+        }
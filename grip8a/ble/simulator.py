@@ -0,0 +1,294 @@
+import asyncio
+import math
+import os
+import random
+import sqlite3
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+import numpy as np
+from .frames import encode_frame
+from grip8a.db.config import DB_FORCE
+
+# ----------------------
+# Bleak-compatible fake backends
+# ----------------------
+#
+# A backend exposes `scanner_cls` (with an async find_device_by_name) and
+# `client_cls` (constructed like BleakClient) and can be handed straight to
+# BLEManager(backend=...). Notifications go through the exact same
+# DeviceSession.notification_handler as a real sensor, as binary frames.
+
+NOTIFY_INTERVAL = 0.02   # seconds between notifications (a typical BLE connection interval)
+MAX_FRAME_SAMPLES = 240  # keeps int16 frames under a 512 byte ATT MTU
+
+
+class HangCurveSource:
+    """Synthesizes a repeater: ramp up, fatiguing plateau with tremor, release, rest."""
+
+    def __init__(self, rate_hz, rng, hang_s=7.0, rest_s=3.0, peak=450.0,
+                 fatigue=0.15, noise=3.0):
+        self.rate_hz = rate_hz
+        self.rng = rng
+        self.hang_s = hang_s
+        self.rest_s = rest_s
+        self.peak = peak
+        self.fatigue = fatigue
+        self.noise = noise
+        self._normal = np.random.default_rng(rng.getrandbits(32))
+        self._t = 0.0          # seconds since the protocol started
+        self._rep_peak = peak
+
+    def next_chunk(self, n):
+        """Return (samples, interval_us, duration_s) for the next `n` samples."""
+        dt = 1.0 / self.rate_hz
+        t = self._t + np.arange(n) * dt
+        cycle = self.hang_s + self.rest_s
+        phase = np.mod(t, cycle)
+
+        # new rep: vary the achieved peak a little
+        if math.floor(self._t / cycle) != math.floor((self._t + n * dt) / cycle):
+            self._rep_peak = self.peak * self.rng.uniform(0.93, 1.05)
+
+        ramp_up = np.clip(phase / 0.3, 0.0, 1.0)
+        ramp_down = np.clip((self.hang_s - phase) / 0.2, 0.0, 1.0)
+        envelope = ramp_up * ramp_up * (3 - 2 * ramp_up) * ramp_down
+        fade = 1.0 - self.fatigue * np.clip(phase / self.hang_s, 0.0, 1.0)
+        tremor = 0.02 * np.sin(2 * np.pi * 9.0 * t)
+        hang = (phase < self.hang_s) * envelope * self._rep_peak * (fade + tremor)
+        noise = self._normal.standard_normal(n) * self.noise
+        self._t += n * dt
+        return np.maximum(hang + noise, 0.0), int(dt * 1e6), n * dt
+
+
+class ReplaySource:
+    """Plays back recorded readings with their original spacing, sped up by `speed`."""
+
+    def __init__(self, timestamps_ms, forces, speed=1.0, loop=False):
+        if len(timestamps_ms) == 0:
+            raise ValueError("nothing to replay")
+        self.t = (np.asarray(timestamps_ms, dtype=np.float64) - timestamps_ms[0]) / 1000.0
+        self.forces = np.asarray(forces, dtype=np.float64)
+        self.speed = speed
+        self.loop = loop
+        self._i = 0
+        diffs = np.diff(self.t)
+        self.interval_s = float(np.median(diffs)) if len(diffs) else 0.0
+
+    def next_chunk(self, n):
+        """Samples recorded during the next notification window (at most `n`)."""
+        if self._i >= len(self.t):
+            if not self.loop:
+                return None
+            self._i = 0
+        start_t = self.t[self._i]
+        window_end = start_t + NOTIFY_INTERVAL * self.speed
+        j = int(np.searchsorted(self.t, window_end, side="left"))
+        j = max(self._i + 1, min(j, self._i + n))
+        samples = self.forces[self._i:j]
+        next_t = self.t[j] if j < len(self.t) else self.t[-1] + self.interval_s
+        self._i = j
+        return samples, int(self.interval_s / self.speed * 1e6), (next_t - start_t) / self.speed
+
+    @classmethod
+    def from_db(cls, db_path=DB_FORCE, user=None, start_ms=None, end_ms=None, **kwargs):
+        """Load a recorded session from the readings table."""
+        where, params = ["timestamp_ms IS NOT NULL"], []
+        if user is not None:
+            where.append("user = ?")
+            params.append(user)
+        if start_ms is not None:
+            where.append("timestamp_ms >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            where.append("timestamp_ms <= ?")
+            params.append(end_ms)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(
+            f"SELECT timestamp_ms, force FROM readings WHERE {' AND '.join(where)} "
+            "ORDER BY timestamp_ms, id", params
+        ).fetchall()
+        conn.close()
+        arr = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return cls(arr[:, 0], arr[:, 1], **kwargs)
+
+
+class _FakeClient:
+    """Just enough of the BleakClient API for DeviceSession."""
+
+    def __init__(self, backend, device, disconnected_callback=None, timeout=10.0):
+        self.backend = backend
+        self.address = getattr(device, "address", device)
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self._task = None
+
+    async def connect(self):
+        await asyncio.sleep(self.backend.connect_latency)
+        if self.backend.rng.random() < self.backend.connect_fail_prob:
+            raise ConnectionError(f"simulated connect failure to {self.address}")
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        self.is_connected = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def start_notify(self, uuid, callback):
+        self._task = asyncio.ensure_future(self._stream(callback))
+
+    async def stop_notify(self, uuid):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _stream(self, callback):
+        backend = self.backend
+        state = backend.device_state(self.address)
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        drop_at = backend.next_disconnect_time(next_at)
+        while self.is_connected:
+            chunk = state["source"].next_chunk(backend.frame_samples)
+            if chunk is None:
+                return  # replay finished; stay connected but quiet
+            samples, interval_us, duration = chunk
+            n = len(samples)
+            if backend.rng.random() >= backend.dropout_prob:
+                frame = encode_frame(state["seq"], samples, backend.dtype, interval_us)
+                callback(None, bytearray(frame))
+            state["seq"] += n
+            backend.samples_sent += n
+
+            next_at += duration
+            jitter = backend.rng.uniform(-backend.jitter, backend.jitter) if backend.jitter else 0.0
+            await asyncio.sleep(max(0.0, next_at - loop.time() + jitter))
+
+            if loop.time() >= drop_at:
+                self.is_connected = False
+                self._task = None
+                backend.disconnects += 1
+                if self.disconnected_callback:
+                    self.disconnected_callback(self)
+                return
+
+
+class _FakeBackend(ABC):
+    """Shared plumbing for the simulated and replay backends."""
+
+    def __init__(self, rate_hz, dtype="<i2", jitter=0.0, dropout_prob=0.0,
+                 disconnect_mean_s=None, connect_latency=0.05, connect_fail_prob=0.0,
+                 seed=0):
+        self.rate_hz = rate_hz
+        self.dtype = dtype
+        self.jitter = jitter
+        self.dropout_prob = dropout_prob
+        self.disconnect_mean_s = disconnect_mean_s
+        self.connect_latency = connect_latency
+        self.connect_fail_prob = connect_fail_prob
+        self.rng = random.Random(seed)
+        self.frame_samples = max(1, min(MAX_FRAME_SAMPLES, round(rate_hz * NOTIFY_INTERVAL)))
+        self.samples_sent = 0
+        self.disconnects = 0
+        self._devices = {}
+        backend = self
+
+        class Scanner:
+            @staticmethod
+            async def find_device_by_name(name, timeout=10.0, **kwargs):
+                await asyncio.sleep(backend.connect_latency)
+                return SimpleNamespace(name=name, address=f"SIM:{name}")
+
+        self.scanner_cls = Scanner
+        self.client_cls = lambda device, **kwargs: _FakeClient(backend, device, **kwargs)
+
+    def device_state(self, address):
+        """Per-device sequence counter and source; survives reconnects like real firmware."""
+        if address not in self._devices:
+            self._devices[address] = {"seq": 0, "source": self.make_source()}
+        return self._devices[address]
+
+    def next_disconnect_time(self, now):
+        if not self.disconnect_mean_s:
+            return math.inf
+        return now + self.rng.expovariate(1.0 / self.disconnect_mean_s)
+
+    @abstractmethod
+    def make_source(self):
+        """A fresh sample source for one simulated device."""
+
+
+class SimulatedBackend(_FakeBackend):
+    """Synthetic hang curves at `rate_hz`, with optional jitter, dropouts and disconnects."""
+
+    def __init__(self, rate_hz=100, hang_s=7.0, rest_s=3.0, peak=450.0, **kwargs):
+        super().__init__(rate_hz, **kwargs)
+        self.curve = dict(hang_s=hang_s, rest_s=rest_s, peak=peak)
+
+    def make_source(self):
+        return HangCurveSource(self.rate_hz, random.Random(self.rng.getrandbits(32)), **self.curve)
+
+
+class ReplayBackend(_FakeBackend):
+    """Replays a recorded session from the database at `speed` x real time."""
+
+    def __init__(self, db_path=DB_FORCE, user=None, start_ms=None, end_ms=None,
+                 speed=1.0, loop=False, **kwargs):
+        self.replay = dict(db_path=db_path, user=user, start_ms=start_ms, end_ms=end_ms,
+                           speed=speed, loop=loop)
+        kwargs.setdefault("dtype", "<f4")
+        source = ReplaySource.from_db(**self.replay)
+        rate = 1.0 / source.interval_s * speed if source.interval_s else 100.0
+        super().__init__(rate, **kwargs)
+
+    def make_source(self):
+        return ReplaySource.from_db(**self.replay)
+
+
+def _parse_value(value):
+    """A spec option as bool, None, int or float where it reads as one, else the string."""
+    lowered = value.strip().lower()
+    if lowered in ("true", "yes", "on"):
+        return True
+    if lowered in ("false", "no", "off"):
+        return False
+    if lowered == "none":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def load_backend(spec=None):
+    """Build a backend from a spec string such as "sim:rate_hz=2000,jitter=0.002".
+
+    "bleak" (or empty) returns None, meaning real hardware. The spec defaults
+    to the GRIP8A_BLE_BACKEND environment variable. Option values may be
+    true/false, none, numbers or plain strings (e.g. loop=false, user=bob).
+    """
+    if spec is None:
+        spec = os.environ.get("GRIP8A_BLE_BACKEND", "")
+    name, _, args = spec.partition(":")
+    if name in ("", "bleak"):
+        return None
+    options = {}
+    for item in filter(None, args.split(",")):
+        key, _, value = item.partition("=")
+        options[key.strip()] = _parse_value(value)
+    if name == "sim":
+        return SimulatedBackend(**options)
+    if name == "replay":
+        return ReplayBackend(**options)
+    raise ValueError(f"unknown BLE backend {name!r}")
@@ -1,10 +1,15 @@
-from grip8a.ble.manager import BLEManager, force
+from grip8a.ble.manager import BLEManager
+from grip8a.ble.simulator import load_backend
+from grip8a.db.config import DB_FORCE
 from grip8a.db.force_db import start_force_writer, stop_force_writer
-from grip8a.utils.timers import complex_timer
+from grip8a.utils.protocols import simple_protocol
+from grip8a.cli.maxhang_cli import ask_protocol
 import time
 
-def force_menu():
-    ble = BLEManager()
+def force_menu(username=None, weight=None):
+    # GRIP8A_BLE_BACKEND=sim (or replay) runs without the physical device
+    # calibration profiles live in the force DB, migrated at start-up (cli/main.py)
+    ble = BLEManager(backend=load_backend(), calibration_db=DB_FORCE)
 
     while True:
         print("""
@@ -34,12 +39,18 @@ def force_menu():
         # Stream (save to DB)
         # -----------------------
         elif c == "2":
-            hang = int(input("Hang time: "))
-            rest = int(input("Rest: "))
-            sets = int(input("Sets: "))
+            # lazy import: the timer brings in rep detection and the workout tables
+            from grip8a.utils.timers import complex_timer
+            protocol = ask_protocol()
+            if protocol is None:
+                hang = int(input("Hang time: "))
+                rest = int(input("Rest: "))
+                sets = int(input("Sets: "))
+                protocol = simple_protocol(hang, rest, sets, 10)
             print("Streaming. Ctrl+C to stop.")
             try:
-                complex_timer(hang, rest, sets, 10, True)
+                complex_timer(record_force=True, user=username, current_weight=weight,
+                              ble=ble, protocol=protocol)
             except KeyboardInterrupt:
                 pass
 
@@ -50,7 +61,7 @@ def force_menu():
             print("Live force. Ctrl+C to stop.")
             try:
                 while True:
-                    print("Force:", force)
+                    print("Force:", ble.latest_force())
                     time.sleep(0.1)
             except KeyboardInterrupt:
                 pass
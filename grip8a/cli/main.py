@@ -1,12 +1,13 @@
 from grip8a.db.maxhang_db import init_maxhang_db
-from grip8a.db.force_db import init_force_db
-from grip8a.cli.maxhang_cli import maxhang_menu
-from grip8a.cli.force_cli import force_menu
 from grip8a.db.user_db import init_user_db, user_exists, add_user, update_user
 
+# The menus (and bleak, numpy, the timer and the force writer behind them)
+# are imported when first opened, so the first prompt comes up quickly.
+# Their tables need no separate init: every grip8a table is in the one
+# schema that migrate() brings up to date (see grip8a/db/migrations.py).
+
 def main():
     init_maxhang_db()
-    init_force_db()
     init_user_db()
 
     username = input("Username: ").strip()
@@ -33,9 +34,11 @@ User: {username} ({weight} lbs)
         c = input("Choose: ")
 
         if c == "1":
+            from grip8a.cli.maxhang_cli import maxhang_menu
             maxhang_menu(username, weight)
         elif c == "2":
-            force_menu()
+            from grip8a.cli.force_cli import force_menu
+            force_menu(username, weight)
         elif c == "3":
             print("Update User Info: ")
             gender = input("Gender: ").strip()
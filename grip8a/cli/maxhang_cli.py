@@ -1,6 +1,18 @@
-from grip8a.utils.timers import complex_timer
+from grip8a.utils.protocols import PRESETS
 from grip8a.db.maxhang_db import init_maxhang_db, log_max_hang, view_logs
 
+def ask_protocol():
+    """Pick a preset protocol, or None to enter hang/rest/sets by hand."""
+    names = list(PRESETS)
+    print("\nProtocol:")
+    print("0. Custom (hang / rest / sets)")
+    for i, name in enumerate(names, 1):
+        print(f"{i}. {PRESETS[name]['name']}")
+    c = input("Choose: ").strip()
+    if c.isdigit() and 1 <= int(c) <= len(names):
+        return PRESETS[names[int(c) - 1]]
+    return None
+
 def maxhang_menu(username, weight):
     while True:
         print("""
@@ -13,10 +25,16 @@ def maxhang_menu(username, weight):
         c = input("Choose: ")
 
         if c == "1":
-            hang = int(input("Hang time: "))
-            rest = int(input("Rest: "))
-            sets = int(input("Sets: "))
-            complex_timer(hang, rest, sets)
+            # lazy import: the timer brings in numpy, rep detection and the force writer
+            from grip8a.utils.timers import complex_timer
+            protocol = ask_protocol()
+            if protocol is not None:
+                complex_timer(protocol=protocol)
+            else:
+                hang = int(input("Hang time: "))
+                rest = int(input("Rest: "))
+                sets = int(input("Sets: "))
+                complex_timer(hang, rest, sets)
 
         elif c == "2":
             log_max_hang(username, weight)
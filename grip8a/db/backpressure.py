@@ -0,0 +1,252 @@
+import os
+import pickle
+import struct
+import threading
+import time
+from collections import deque
+from queue import Empty
+
+POLICIES = ("block", "drop_oldest", "drop_newest", "spill")
+
+# A spill file starts with the offset of the first chunk not yet read back,
+# followed by pickled lists of items, oldest first
+_SPILL_HEADER = struct.Struct("<Q")
+
+
+class BoundedWriteQueue:
+    """FIFO with a hard size limit and a choice of what to do when it is full.
+
+    block        producer waits for room (optionally up to `block_timeout`,
+                 after which the item is dropped and counted)
+    drop_oldest  evict the oldest queued item to make room
+    drop_newest  discard the incoming item
+    spill        append overflow to `spill_path` on disk; it is read back, in
+                 order, once the in-memory queue drains. Past
+                 `spill_max_bytes` the incoming items are dropped instead
+
+    The spill file survives a crash: recover() (or the next spill) picks up
+    whatever a previous run left unread. Only the interface the force writer
+    needs is implemented: put/put_many for producers, get/get_many for the
+    single consumer.
+    """
+
+    def __init__(self, maxsize, policy="block", spill_path=None, block_timeout=None,
+                 spill_max_bytes=None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}; pick one of {POLICIES}")
+        if policy == "spill" and not spill_path:
+            raise ValueError("spill policy needs a spill_path")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.spill_max_bytes = spill_max_bytes
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._spill_file = None
+        self._spill_read_pos = 0
+        self._spill_pending = 0  # items on disk not yet read back
+
+        self.put_count = 0
+        self.high_water = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.spilled = 0
+        self.recovered = 0
+
+    # ----------------------
+    # Producer side
+    # ----------------------
+
+    def put(self, item):
+        self.put_many((item,))
+
+    def put_many(self, items):
+        items = list(items)
+        if not items:
+            return
+        with self._cond:
+            self.put_count += len(items)
+            if self.policy == "spill":
+                self._put_spill(items)
+            elif self.policy == "block":
+                self._put_block(items)
+            else:
+                room = self.maxsize - len(self._items)
+                if self.policy == "drop_newest":
+                    if len(items) > room:
+                        self.dropped_newest += len(items) - max(room, 0)
+                        items = items[:max(room, 0)]
+                    self._items.extend(items)
+                else:  # drop_oldest
+                    overflow = len(self._items) + len(items) - self.maxsize
+                    for _ in range(max(overflow, 0)):
+                        if self._items:
+                            self._items.popleft()
+                    self.dropped_oldest += max(overflow, 0)
+                    self._items.extend(items[-self.maxsize:])
+            self.high_water = max(self.high_water, len(self._items) + self._spill_pending)
+            self._cond.notify()
+
+    def _put_block(self, items):
+        deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+        for i, item in enumerate(items):
+            while len(self._items) >= self.maxsize:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.dropped_newest += len(items) - i
+                    return
+                self._cond.notify()  # make sure the consumer is awake
+                self._cond.wait(remaining)
+            self._items.append(item)
+
+    def _put_spill(self, items):
+        # once anything is on disk, everything new goes behind it to keep FIFO order
+        if self._spill_pending == 0:
+            room = max(0, self.maxsize - len(self._items))
+            self._items.extend(items[:room])
+            items = items[room:]
+        if not items:
+            return
+        if self._spill_file is None:
+            self._open_spill()
+        data = pickle.dumps(items, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_file.seek(0, os.SEEK_END)
+        if self.spill_max_bytes is not None and self._spill_file.tell() + len(data) > self.spill_max_bytes:
+            self.dropped_newest += len(items)
+            return
+        self._spill_file.write(data)
+        self._spill_file.flush()
+        self._spill_pending += len(items)
+        self.spilled += len(items)
+
+    # ----------------------
+    # Spill file
+    # ----------------------
+
+    def _open_spill(self):
+        """Open the spill file, counting chunks a previous run left unread (lock held)."""
+        try:
+            f = open(self.spill_path, "r+b")
+        except FileNotFoundError:
+            f = open(self.spill_path, "w+b")
+        head = f.read(_SPILL_HEADER.size)
+        pos = _SPILL_HEADER.unpack(head)[0] if len(head) == _SPILL_HEADER.size else _SPILL_HEADER.size
+        f.seek(pos)
+        end, leftover = pos, 0
+        while True:
+            try:
+                leftover += len(pickle.load(f))
+            except Exception:  # end of file, or a chunk cut short by a crash
+                break
+            end = f.tell()
+        self._spill_file = f
+        if leftover:
+            f.truncate(end)
+            self._set_read_pos(pos)
+            self._spill_pending += leftover
+            self.recovered += leftover
+        else:
+            self._reset_spill()
+        return leftover
+
+    def _set_read_pos(self, pos):
+        self._spill_read_pos = pos
+        self._spill_file.seek(0)
+        self._spill_file.write(_SPILL_HEADER.pack(pos))
+        self._spill_file.flush()
+
+    def _reset_spill(self):
+        self._spill_file.seek(0)
+        self._spill_file.truncate()
+        self._set_read_pos(_SPILL_HEADER.size)
+
+    def recover(self):
+        """Queue the items a previous run left in the spill file, ahead of new spills. Returns how many."""
+        with self._cond:
+            if self._spill_file is not None or not self.spill_path or not os.path.exists(self.spill_path):
+                return 0
+            n = self._open_spill()
+            self.high_water = max(self.high_water, len(self._items) + self._spill_pending)
+            self._cond.notify()
+            return n
+
+    # ----------------------
+    # Consumer side
+    # ----------------------
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item; raise queue.Empty after `timeout`."""
+        items = self.get_many(1, timeout)
+        return items[0]
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def get_many(self, limit, timeout=0):
+        """Remove up to `limit` items, waiting up to `timeout` for the first one."""
+        with self._cond:
+            if not self._items and not self._spill_pending:
+                if timeout == 0 or not self._cond.wait_for(
+                        lambda: self._items or self._spill_pending, timeout):
+                    raise Empty
+            if not self._items:
+                self._unspill()
+            n = min(limit, len(self._items))
+            out = [self._items.popleft() for _ in range(n)]
+            self._cond.notify_all()  # room for blocked producers
+            return out
+
+    def _unspill(self):
+        """Read the next spilled chunk back into memory (lock held)."""
+        self._spill_file.seek(self._spill_read_pos)
+        chunk = pickle.load(self._spill_file)
+        self._spill_pending -= len(chunk)
+        self._items.extend(chunk)
+        if self._spill_pending == 0:
+            # fully drained: start the file over so it doesn't grow forever
+            self._reset_spill()
+        else:
+            self._set_read_pos(self._spill_file.tell())
+
+    # ----------------------
+    # Introspection
+    # ----------------------
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items) + self._spill_pending
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def stats(self):
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "maxsize": self.maxsize,
+                "depth": len(self._items),
+                "spilled_pending": self._spill_pending,
+                "high_water": self.high_water,
+                "put": self.put_count,
+                "dropped_oldest": self.dropped_oldest,
+                "dropped_newest": self.dropped_newest,
+                "dropped": self.dropped_oldest + self.dropped_newest,
+                "spilled": self.spilled,
+                "recovered": self.recovered,
+            }
+
+    def close(self):
+        """Close the spill file, removing it once drained; otherwise it is kept for recover()."""
+        with self._cond:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+                if self._spill_pending == 0:
+                    try:
+                        os.remove(self.spill_path)
+                    except OSError:
+                        pass
+            self._spill_pending = 0
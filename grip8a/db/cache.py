@@ -0,0 +1,131 @@
+import os
+import time
+from grip8a.db.config import ANALYTICS_CACHE_MAX_ENTRIES, DB_FORCE
+from grip8a.db.connection import get_connection, transaction
+
+DB = DB_FORCE
+
+# ----------------------
+# Data versions (watermarks)
+# ----------------------
+#
+# Writers bump a per-user counter for each source table ("readings",
+# "hangs", "reps", ...) in the same transaction as the rows they commit, and
+# the "*" row for that source, which covers all users. A cached result
+# remembers the counters it was computed at, so checking whether it is
+# still valid is one primary-key lookup per source, however much raw data
+# there is.
+
+ALL_USERS = "*"
+
+
+def init_versions(db=None, conn=None):
+    """Create the data_versions table (safe to call every run)."""
+    if conn is None:
+        with transaction(db or DB) as conn:
+            return init_versions(conn=conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            source TEXT NOT NULL,
+            user TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_ms INTEGER NOT NULL,
+            PRIMARY KEY (source, user)
+        ) WITHOUT ROWID
+    """)
+
+
+def bump_versions(conn, source, users):
+    """Mark `source` as changed for each of `users` (and for all users). Call inside the writing transaction."""
+    now_ms = int(time.time() * 1000)
+    keys = {ALL_USERS} | {ALL_USERS if u is None else str(u) for u in users}
+    conn.executemany("""
+        INSERT INTO data_versions (source, user, version, updated_ms) VALUES (?, ?, 1, ?)
+        ON CONFLICT (source, user) DO UPDATE SET version = version + 1, updated_ms = excluded.updated_ms
+    """, [(source, key, now_ms) for key in keys])
+
+
+def watermark(sources, user=None, db=None):
+    """The versions of `sources` for `user` (None: all users) as one comparable string."""
+    conn = get_connection(db or DB)
+    user = ALL_USERS if user is None else str(user)
+    parts = []
+    for source in sources:
+        row = conn.execute(
+            "SELECT version FROM data_versions WHERE source = ? AND user = ?", (source, user)
+        ).fetchone()
+        parts.append(f"{source}:{row[0] if row else 0}")
+    return ",".join(parts)
+
+
+# ----------------------
+# Analytics cache
+# ----------------------
+#
+# Derived results (pickled) live in a separate file next to the data DB,
+# e.g. force_readings.cache.db, so they can be thrown away at any time.
+# Entries are keyed by kind, user and parameters; the least recently used
+# ones are evicted beyond ANALYTICS_CACHE_MAX_ENTRIES.
+
+_ready = set()  # cache files whose table exists
+
+
+def cache_path(db=None):
+    return os.path.splitext(db or DB)[0] + ".cache.db"
+
+
+def _cache_conn(db):
+    path = cache_path(db)
+    conn = get_connection(path)
+    if path not in _ready:
+        with transaction(path):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_cache (
+                    key TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    computed_ms INTEGER NOT NULL,
+                    used_ms INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analytics_cache_used ON analytics_cache (used_ms)")
+        _ready.add(path)
+    return path, conn
+
+
+def cached(kind, user, sources, compute, params=(), db=None, max_entries=ANALYTICS_CACHE_MAX_ENTRIES):
+    """compute() the first time, then its stored result until `user`'s data in `sources` changes.
+
+    `user` None means a result over all users (valid until anyone's data
+    in `sources` changes). `params` distinguishes results of one kind.
+    """
+    import pickle  # lazy: writers import this module just to bump versions
+    mark = watermark(sources, user, db)  # read before computing, so a write during compute() isn't missed
+    key = f"{kind}|{ALL_USERS if user is None else user}|{params!r}"
+    path, conn = _cache_conn(db)
+    now_ms = int(time.time() * 1000)
+    row = conn.execute("SELECT watermark, value FROM analytics_cache WHERE key = ?", (key,)).fetchone()
+    if row is not None and row[0] == mark:
+        with transaction(path):
+            conn.execute("UPDATE analytics_cache SET used_ms = ? WHERE key = ?", (now_ms, key))
+        return pickle.loads(row[1])
+
+    value = compute()
+    with transaction(path):
+        conn.execute("""
+            INSERT OR REPLACE INTO analytics_cache (key, watermark, value, computed_ms, used_ms)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, mark, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now_ms, now_ms))
+        # evict least recently used
+        conn.execute("""
+            DELETE FROM analytics_cache WHERE key IN (
+                SELECT key FROM analytics_cache ORDER BY used_ms DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+    return value
+
+
+def clear_cache(db=None):
+    path, conn = _cache_conn(db)
+    with transaction(path):
+        conn.execute("DELETE FROM analytics_cache")
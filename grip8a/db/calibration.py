@@ -0,0 +1,236 @@
+import json
+import sqlite3
+import time
+import numpy as np
+from grip8a.db import cache, hang_store, rollups
+from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection, transaction
+
+DB = DB_FORCE
+
+# ----------------------
+# Per-device calibration
+# ----------------------
+#
+# A profile turns a sensor's raw values into force, per device address:
+#
+#   x     = raw - zero_offset
+#   force = scale * x + poly[0] * x**2 + poly[1] * x**3 + ...
+#           + temp_coeff * (temperature - temp_ref)   (only when a temperature is known)
+#
+# Profiles are never edited: recalibrating saves a new one, valid from its
+# `valid_from_ms`, so each reading keeps the profile that was in effect when
+# it was taken. The BLE session applies the device's profile to every batch
+# of samples at ingest (after the filters, which work in sensor units), and
+# the force writer stores both values: readings.raw_force and the calibrated
+# readings.force, with readings.calibration_id naming the profile.
+#
+# recalibrate() rewrites stored readings from raw_force after a profile
+# changes, one UPDATE per profile span, and rebuilds the affected rollups.
+# Hangs packed into hang_samples carry their raw values and profile ids too,
+# so their blobs are redone the same way. Readings archived by retention
+# (raw_force included, see retention.load_archive) keep the values they were
+# stored with.
+
+
+def init_calibration(db=None, conn=None):
+    """Create the calibration_profiles table (safe to call every run)."""
+    if conn is None:
+        with transaction(db or DB) as conn:
+            return init_calibration(conn=conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS calibration_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device TEXT NOT NULL,
+            valid_from_ms INTEGER NOT NULL,
+            zero_offset REAL NOT NULL,
+            scale REAL NOT NULL,
+            poly TEXT,
+            temp_coeff REAL,
+            temp_ref REAL,
+            units TEXT,
+            created_ms INTEGER NOT NULL,
+            notes TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_calibration_device_from "
+                 "ON calibration_profiles (device, valid_from_ms)")
+
+
+def _profile(row):
+    profile = dict(row)
+    profile["poly"] = json.loads(profile["poly"] or "[]")
+    return profile
+
+
+def _rows(conn, sql, params):
+    c = conn.cursor()
+    c.row_factory = sqlite3.Row
+    return [_profile(r) for r in c.execute(sql, params)]
+
+
+def save_profile(device, scale=1.0, zero_offset=0.0, poly=(), temp_coeff=None, temp_ref=None,
+                 units="N", valid_from_ms=None, notes=None, db=None):
+    """Store a new profile for `device` (an address), in effect from `valid_from_ms` (default now). Returns its id.
+
+    `poly` holds the coefficients of x**2, x**3, ... after the linear `scale`.
+    """
+    now_ms = int(time.time() * 1000)
+    with transaction(db or DB) as conn:
+        cur = conn.execute("""
+            INSERT INTO calibration_profiles (device, valid_from_ms, zero_offset, scale, poly,
+                                              temp_coeff, temp_ref, units, created_ms, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (device, now_ms if valid_from_ms is None else int(valid_from_ms), float(zero_offset),
+              float(scale), json.dumps([float(c) for c in poly]), temp_coeff, temp_ref, units,
+              now_ms, notes))
+        return cur.lastrowid
+
+
+def profile_for(device, at_ms=None, db=None):
+    """The profile of `device` in effect at `at_ms` (default now), or None if it has none."""
+    found = _rows(get_connection(db or DB), """
+        SELECT * FROM calibration_profiles WHERE device = ? AND valid_from_ms <= ?
+        ORDER BY valid_from_ms DESC, id DESC LIMIT 1
+    """, (device, int(time.time() * 1000) if at_ms is None else at_ms))
+    return found[0] if found else None
+
+
+def device_profiles(device, db=None):
+    """Every profile of `device`, oldest first."""
+    return _rows(get_connection(db or DB), """
+        SELECT * FROM calibration_profiles WHERE device = ? ORDER BY valid_from_ms, id
+    """, (device,))
+
+
+# ----------------------
+# Applying a profile
+# ----------------------
+
+def _drift(profile, temperature):
+    if temperature is None or not profile.get("temp_coeff"):
+        return 0.0
+    return profile["temp_coeff"] * (temperature - (profile.get("temp_ref") or 0.0))
+
+
+def apply(profile, raw, temperature=None):
+    """Calibrated forces for an array of raw values, in one vectorized step."""
+    x = np.asarray(raw, dtype=np.float64) - profile["zero_offset"]
+    coefs = [profile["scale"], *profile["poly"]]
+    # Horner: x * (c1 + x * (c2 + x * (c3 + ...)))
+    y = np.full_like(x, coefs[-1])
+    for c in reversed(coefs[:-1]):
+        y = c + x * y
+    y = x * y
+    drift = _drift(profile, temperature)
+    return y + drift if drift else y
+
+
+def _sql_expression(profile, temperature=None):
+    """apply() as an SQL expression over readings.raw_force, with its parameters in order."""
+    coefs = [profile["scale"], *profile["poly"]]
+    expr, params = "?", [coefs[-1]]
+    for c in reversed(coefs[:-1]):
+        expr = f"(? + (raw_force - ?) * {expr})"
+        params = [c, profile["zero_offset"]] + params
+    expr = f"(raw_force - ?) * {expr}"
+    params = [profile["zero_offset"]] + params
+    drift = _drift(profile, temperature)
+    if drift:
+        expr += " + ?"
+        params.append(drift)
+    return expr, params
+
+
+def raw_readings(device, start_ms=None, end_ms=None, db=None):
+    """(timestamp_ms, raw_force, force, calibration_id) arrays for `device`'s stored readings, oldest first."""
+    rows = get_connection(db or DB).execute("""
+        SELECT timestamp_ms, raw_force, force, calibration_id FROM readings
+        WHERE device = ? AND timestamp_ms BETWEEN ? AND ? AND raw_force IS NOT NULL
+        ORDER BY timestamp_ms
+    """, (device, start_ms or 0, end_ms if end_ms is not None else 2 ** 62)).fetchall()
+    arr = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    return arr[:, 0].astype(np.int64), arr[:, 1], arr[:, 2], arr[:, 3]
+
+
+def _recalibrate_hangs(conn, device, spans, start_ms, end_ms, temperature=None):
+    """Redo `device`'s packed hangs in [start_ms, end_ms] from their raw streams.
+
+    Returns (samples updated, users touched, hangs skipped for lack of raw values).
+    """
+    starts = np.array([p["valid_from_ms"] for p in spans])
+    updated, users, no_raw = 0, set(), 0
+    hangs = conn.execute("""
+        SELECT id, user, start_ms, samples FROM hang_samples
+        WHERE device_id = ? AND end_ms >= ? AND start_ms <= ?
+    """, (device, max(start_ms, spans[0]["valid_from_ms"]), end_ms)).fetchall()
+    for hang_id, user, first_ms, blob in hangs:
+        samples = hang_store.decode_samples(blob)
+        if np.isnan(samples["raw"]).any():
+            no_raw += 1
+            continue
+        ts_ms = first_ms + samples["t"] * 1000
+        # index of the profile in effect at each sample, -1 outside the range or before the first
+        which = np.searchsorted(starts, ts_ms, side="right") - 1
+        which[(ts_ms < start_ms) | (ts_ms > end_ms)] = -1
+        if not (which >= 0).any():
+            continue
+        for i in np.unique(which[which >= 0]):
+            mask = which == i
+            samples["force"][mask] = apply(spans[i], samples["raw"][mask], temperature)
+            samples["calibration_id"][mask] = spans[i]["id"]
+        hang_store.update_hang_samples(conn, hang_id, samples)
+        updated += int((which >= 0).sum())
+        users.add(user)
+    return updated, users, no_raw
+
+
+def recalibrate(device, start_ms=None, end_ms=None, temperature=None, db=None):
+    """Recompute `device`'s stored readings and packed hangs from their raw values.
+
+    Each sample gets the profile in effect when it was taken. Readings take
+    one UPDATE per profile span, so the arithmetic happens inside SQLite
+    rather than row by row in Python, then the rollups they fed are rebuilt;
+    hang_samples blobs are decoded, recomputed in NumPy and re-encoded.
+    Samples older than the device's first profile are left alone. Returns
+    {"readings": n, "hang_samples": m}, the number of each updated.
+    """
+    start_ms = start_ms or 0
+    end_ms = 2 ** 62 if end_ms is None else end_ms
+    with transaction(db or DB) as conn:
+        spans = _rows(conn, """
+            SELECT * FROM calibration_profiles WHERE device = ? ORDER BY valid_from_ms, id
+        """, (device,))
+        if not spans:
+            return {"readings": 0, "hang_samples": 0}
+        hang_updated, hang_users, no_raw = _recalibrate_hangs(conn, device, spans, start_ms, end_ms,
+                                                              temperature)
+        if no_raw:
+            print(f"Note: {no_raw} packed hang(s) were stored without raw values and keep their old forces")
+        if hang_users:
+            cache.bump_versions(conn, "readings", hang_users)
+        updated = 0
+        for i, profile in enumerate(spans):
+            lo = max(start_ms, profile["valid_from_ms"])
+            hi = end_ms if i + 1 == len(spans) else min(end_ms, spans[i + 1]["valid_from_ms"] - 1)
+            if lo > hi:
+                continue
+            expr, params = _sql_expression(profile, temperature)
+            updated += conn.execute(f"""
+                UPDATE readings SET force = {expr}, calibration_id = ?
+                WHERE device = ? AND timestamp_ms BETWEEN ? AND ? AND raw_force IS NOT NULL
+            """, (*params, profile["id"], device, lo, hi)).rowcount
+        if not updated:
+            return {"readings": 0, "hang_samples": hang_updated}
+
+        ranges = conn.execute("""
+            SELECT user, MIN(timestamp_ms), MAX(timestamp_ms) FROM readings
+            WHERE device = ? AND timestamp_ms BETWEEN ? AND ? AND calibration_id IS NOT NULL
+            GROUP BY user
+        """, (device, max(start_ms, spans[0]["valid_from_ms"]), end_ms)).fetchall()
+        skipped = sum(rollups.rebuild_range(conn, user, first_ms, last_ms) for user, first_ms, last_ms in ranges)
+        if skipped:
+            print(f"Note: {skipped} rollup bucket(s)/session(s) also count packed or archived "
+                  "readings and keep their old values")
+        cache.bump_versions(conn, "readings", [user for user, _, _ in ranges])
+    return {"readings": updated, "hang_samples": hang_updated}
@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+from urllib.parse import quote, unquote
+import numpy as np
+from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection
+
+DB = DB_FORCE
+
+# ----------------------
+# Columnar export layout
+# ----------------------
+#
+#   <out_dir>/<table>/manifest.json
+#   <out_dir>/<table>/user=<name>/month=<YYYY-MM>/<column>.npy
+#
+# One .npy file per column so a loader can np.load(..., mmap_mode="r") just
+# the columns it needs. Missing integers are stored as -1 and missing floats
+# as NaN. Text columns are dictionary-encoded as int32 codes (-1 = NULL);
+# the dictionaries are kept in the manifest. Times are int64 milliseconds
+# since the epoch (UTC).
+
+NULL_USER = "__none__"
+
+TABLES = {
+    "readings": {
+        "select": "SELECT user, id, timestamp_ms, force, current_weight, session_id, set_id, rep_id "
+                  "FROM readings WHERE timestamp_ms IS NOT NULL",
+        "order": "ORDER BY user, timestamp_ms, id",
+        "time": "timestamp_ms",
+        "columns": [
+            ("id", "int"), ("timestamp_ms", "int"), ("force", "float"),
+            ("current_weight", "float"), ("session_id", "int"), ("set_id", "int"),
+            ("rep_id", "int"),
+        ],
+    },
+    "hangs": {
+        "select": "SELECT user, id, date, current_weight, weight_percent, exercise_type, side, "
+                  "edge_size_mm, added_weight, hang_duration_sec, rpe, notes FROM hangs "
+                  "WHERE date IS NOT NULL",
+        "order": "ORDER BY user, date, id",
+        "time": "date",
+        "columns": [
+            ("id", "int"), ("date", "time"), ("current_weight", "float"),
+            ("weight_percent", "float"), ("exercise_type", "text"), ("side", "text"),
+            ("edge_size_mm", "int"), ("added_weight", "float"),
+            ("hang_duration_sec", "float"), ("rpe", "int"), ("notes", "text"),
+        ],
+    },
+}
+
+
+def _user_dir(user):
+    return "user=" + (NULL_USER if user is None else quote(str(user), safe=""))
+
+
+def _to_array(values, kind, dictionary):
+    """Convert one column of a fetched chunk to its stored NumPy form."""
+    if kind == "float":
+        return np.array(values, dtype=np.float64)
+    if kind == "int":
+        arr = np.array(values, dtype=np.float64)
+        return np.where(np.isnan(arr), -1, arr).astype(np.int64)
+    if kind == "time":
+        # hangs.date is local "YYYY-MM-DD HH:MM" text
+        return np.array(values, dtype="datetime64[m]").astype("datetime64[ms]").astype(np.int64)
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            codes[i] = -1
+        else:
+            codes[i] = dictionary.setdefault(v, len(dictionary))
+    return codes
+
+
+class _PartitionWriter:
+    """Appends column chunks to raw files, then wraps them as .npy on close."""
+
+    def __init__(self, path, columns):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self.files = {}
+        self.dtypes = {}
+        for name, _ in columns:
+            self.files[name] = open(os.path.join(path, name + ".bin"), "wb")
+
+    def write(self, arrays, lo, hi):
+        for name, arr in arrays.items():
+            part = arr[lo:hi]
+            self.dtypes[name] = part.dtype
+            self.files[name].write(part.tobytes())
+        self.rows += int(hi - lo)
+
+    def close(self):
+        for name, f in self.files.items():
+            f.close()
+            raw = os.path.join(self.path, name + ".bin")
+            with open(os.path.join(self.path, name + ".npy"), "wb") as out, open(raw, "rb") as src:
+                np.lib.format.write_array_header_1_0(out, {
+                    "descr": np.lib.format.dtype_to_descr(self.dtypes[name]),
+                    "fortran_order": False,
+                    "shape": (self.rows,),
+                })
+                shutil.copyfileobj(src, out, 1 << 20)
+            os.remove(raw)
+
+
+def export_table(out_dir, table="readings", user=None, db=None, chunk_size=50000):
+    """Stream one table into user/month partitions of .npy columns. Returns rows written."""
+    spec = TABLES[table]
+    columns = spec["columns"]
+    table_dir = os.path.join(out_dir, table)
+    if user is None:
+        shutil.rmtree(table_dir, ignore_errors=True)
+    else:
+        shutil.rmtree(os.path.join(table_dir, _user_dir(user)), ignore_errors=True)
+    os.makedirs(table_dir, exist_ok=True)
+
+    manifest_path = os.path.join(table_dir, "manifest.json")
+    manifest = {"table": table, "columns": dict(columns), "dictionaries": {}, "partitions": {}}
+    if user is not None and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["partitions"] = {k: v for k, v in manifest["partitions"].items()
+                                  if not k.startswith(_user_dir(user) + "/")}
+    dictionaries = {name: {v: i for i, v in enumerate(manifest["dictionaries"].get(name, []))}
+                    for name, kind in columns if kind == "text"}
+
+    sql, params = spec["select"], []
+    if user is not None:
+        sql += " AND user = ?"
+        params.append(user)
+    cur = get_connection(db or DB).cursor()
+    cur.execute(f"{sql} {spec['order']}", params)
+
+    writer, current = None, None
+    total = 0
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        values = list(zip(*rows))
+        users = values[0]
+        arrays = {name: _to_array(values[i + 1], kind, dictionaries.get(name))
+                  for i, (name, kind) in enumerate(columns)}
+        months = arrays[spec["time"]].astype("datetime64[ms]").astype("datetime64[M]").astype(str)
+
+        # rows arrive sorted by user then time, so partitions are contiguous runs
+        user_arr = np.array([NULL_USER if u is None else u for u in users], dtype=object)
+        change = np.flatnonzero((user_arr[1:] != user_arr[:-1]) | (months[1:] != months[:-1])) + 1
+        bounds = np.concatenate(([0], change, [len(rows)]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            key = (users[lo], months[lo])
+            if key != current:
+                if writer is not None:
+                    writer.close()
+                rel = f"{_user_dir(key[0])}/month={key[1]}"
+                writer = _PartitionWriter(os.path.join(table_dir, rel), columns)
+                manifest["partitions"][rel] = 0
+                current = key
+            writer.write(arrays, lo, hi)
+            manifest["partitions"][rel] += int(hi - lo)
+        total += len(rows)
+    if writer is not None:
+        writer.close()
+
+    manifest["dictionaries"] = {name: list(d) for name, d in dictionaries.items()}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    return total
+
+
+def export_columnar(out_dir, tables=("readings", "hangs"), user=None, db=None, chunk_size=50000):
+    """Export several tables; returns {table: rows written}."""
+    return {t: export_table(out_dir, t, user=user, db=db, chunk_size=chunk_size) for t in tables}
+
+
+# ----------------------
+# Memory-mapped loading
+# ----------------------
+
+def open_partitions(out_dir, table="readings", user=None, months=None, columns=None):
+    """Yield (user, month, {column: memmap}) without reading any data into RAM.
+
+    `months` is an optional (first, last) pair of "YYYY-MM" strings.
+    """
+    table_dir = os.path.join(out_dir, table)
+    with open(os.path.join(table_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    wanted = columns or list(manifest["columns"])
+    for rel in sorted(manifest["partitions"]):
+        user_part, month_part = rel.split("/")
+        name = unquote(user_part[len("user="):])
+        part_user = None if name == NULL_USER else name
+        month = month_part[len("month="):]
+        if user is not None and part_user != user:
+            continue
+        if months is not None and not (months[0] <= month <= months[1]):
+            continue
+        path = os.path.join(table_dir, rel)
+        yield part_user, month, {
+            c: np.load(os.path.join(path, c + ".npy"), mmap_mode="r") for c in wanted
+        }
+
+
+def load_columns(out_dir, table="readings", user=None, months=None, columns=None):
+    """Concatenate the selected partitions' columns into regular arrays."""
+    parts = [cols for _, _, cols in open_partitions(out_dir, table, user, months, columns)]
+    if not parts:
+        return {}
+    return {c: np.concatenate([p[c] for p in parts]) for c in parts[0]}
+
+
+def dictionary(out_dir, table, column):
+    """Decoded values for a dictionary-encoded text column (index = stored code)."""
+    with open(os.path.join(out_dir, table, "manifest.json")) as f:
+        return json.load(f)["dictionaries"][column]
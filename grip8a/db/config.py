@@ -1,2 +1,36 @@
 DB_FORCE = "force_readings.db"
 DB_MAXHANG = "force_readings.db"   # SAME FILE, TWO TABLES
+
+# Force writer batching: flush after this many rows or this many seconds
+WRITER_BATCH_SIZE = 1000
+WRITER_FLUSH_INTERVAL = 0.25
+
+# Force writer queue: hard cap on queued readings and what to do when full
+# ("block", "drop_oldest", "drop_newest" or "spill" to WRITE_QUEUE_SPILL_PATH,
+# up to WRITE_QUEUE_SPILL_MAX_BYTES, then drop; a spill file left by a crash
+# is written out when the writer next starts)
+WRITE_QUEUE_MAXSIZE = 50000
+WRITE_QUEUE_POLICY = "spill"
+WRITE_QUEUE_SPILL_PATH = "force_queue.spill"
+WRITE_QUEUE_SPILL_MAX_BYTES = 256 * 1024 * 1024
+
+# Forces in per-hang sample blobs are stored rounded to this step
+HANG_FORCE_RESOLUTION = 0.01
+
+# Rollup bucket sizes maintained by the force writer, finest first
+ROLLUP_RESOLUTIONS_MS = (1000, 10_000, 60_000, 3_600_000)
+
+# Per-thread connections opened by grip8a.db.connection get these PRAGMAs
+DB_CACHE_SIZE_KB = 20_000          # page cache per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024   # bytes of the file read through mmap
+DB_BUSY_TIMEOUT_MS = 5000          # wait this long on a locked DB before failing
+DB_STATEMENT_CACHE = 256           # prepared statements kept per connection
+
+# Maintenance: raw readings older than this move to compressed files in ARCHIVE_DIR
+RETENTION_DAYS = 90
+ARCHIVE_DIR = "archive"
+# ... and readings older than this are packed into per-hang blobs (hang_samples) first
+PACK_AFTER_DAYS = 7
+
+# Derived analytics are cached next to the DB (<db>.cache.db); least recently used beyond this are evicted
+ANALYTICS_CACHE_MAX_ENTRIES = 2000
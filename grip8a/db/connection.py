@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from grip8a.db.config import (DB_FORCE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+                              DB_BUSY_TIMEOUT_MS, DB_STATEMENT_CACHE)
+
+# ----------------------
+# Shared connections
+# ----------------------
+#
+# sqlite3 connections can't be shared between threads, so every thread gets
+# one long-lived connection per database file, opened on first use with the
+# same PRAGMAs everywhere. sqlite3 keeps compiled statements per connection
+# keyed by SQL text, so reusing the connection also reuses the prepared
+# statements of every query we run repeatedly.
+#
+# Writes go through transaction(); reads can use get_connection() directly.
+# Don't close() a shared connection yourself, use close_connections().
+
+_local = threading.local()
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=DB_STATEMENT_CACHE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection(db=None):
+    """This thread's connection to `db` (default: the main DB file)."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+        _local.depth = {}
+    path = db or DB_FORCE
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+        _local.depth[path] = 0
+    return conn
+
+
+@contextmanager
+def transaction(db=None):
+    """Run a block in one transaction on this thread's connection; yields the connection.
+
+    Commits on success and rolls back on error. Nested blocks become
+    savepoints, so a helper can open its own transaction() and still be
+    called from inside a caller's.
+    """
+    conn = get_connection(db)
+    path = db or DB_FORCE
+    depth = _local.depth[path]
+    name = f"sp{depth}"
+    if depth == 0:
+        if conn.in_transaction:  # left open by an implicit DML statement
+            conn.commit()
+        conn.execute("BEGIN")
+    else:
+        conn.execute(f"SAVEPOINT {name}")
+    _local.depth[path] = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        else:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+        raise
+    else:
+        if depth == 0:
+            conn.commit()
+        else:
+            conn.execute(f"RELEASE {name}")
+    finally:
+        _local.depth[path] = depth
+
+
+def close_connections():
+    """Close every connection this thread opened (e.g. at the end of a worker thread)."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+    _local.depth = {}
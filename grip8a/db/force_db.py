@@ -1,82 +1,177 @@
-import sqlite3
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from threading import Thread
-from queue import Queue, Empty
-from grip8a.db.config import DB_FORCE
+from queue import Empty
+from grip8a.db.backpressure import BoundedWriteQueue
+from grip8a.db import cache, rollups
+from grip8a.db.migrations import migrate
+from grip8a.db.connection import close_connections, transaction
+from grip8a.db.config import (DB_FORCE, WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL,
+                              WRITE_QUEUE_MAXSIZE, WRITE_QUEUE_POLICY, WRITE_QUEUE_SPILL_PATH,
+                              WRITE_QUEUE_SPILL_MAX_BYTES)
 
 DB = DB_FORCE
-write_queue = Queue()
+write_queue = BoundedWriteQueue(WRITE_QUEUE_MAXSIZE, WRITE_QUEUE_POLICY,
+                                spill_path=WRITE_QUEUE_SPILL_PATH,
+                                spill_max_bytes=WRITE_QUEUE_SPILL_MAX_BYTES)
 _writer_thread = None
 _writer_running = False
+writer_stats = {"rows": 0, "batches": 0, "last_batch": 0}
 
+# (user, current_weight, session_id, set_id, rep_id) stamped onto every queued
+# reading; set by the timer as it moves through a workout
+_context = (None, None, None, None, None)
 
 def init_force_db():
-    """Create the DB table (safe to call every run)."""
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            user TEXT,
-            current_weight REAL,
-            weight_percent REAL,
-            timestamp_ms INTEGER,
-            timestamp_iso TEXT,
-            force REAL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    """Create or upgrade the DB schema (safe to call every run)."""
+    migrate(DB)
+
+
+def set_recording_context(user=None, current_weight=None, session_id=None, set_id=None, rep_id=None):
+    """Tag readings queued from now on with this user / session / set / rep."""
+    global _context
+    _context = (user, current_weight, session_id, set_id, rep_id)
+
+
+def clear_recording_context(keep_user=True):
+    """Stop tagging readings with a set/rep (the user stays unless keep_user=False)."""
+    global _context
+    user, weight = _context[:2] if keep_user else (None, None)
+    _context = (user, weight, None, None, None)
+
+
+def recording_context():
+    return _context
+
+
+def _to_row(item):
+    # (ts, force, context[, raw, device, calibration_id]); spill files may hold the short form
+    ts, force_value, (user, weight, session_id, set_id, rep_id), *source = item
+    raw, device, calibration_id = source or (None, None, None)
+    date = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")  # same format as hangs.date
+    ts_iso = datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+    return (date, user, weight, int(ts * 1000), ts_iso, force_value, session_id, set_id, rep_id,
+            raw, device, calibration_id)
+
+
+def _flush(batch):
+    """Write a batch of (timestamp, force, context) items, its rollups and data versions in one transaction."""
+    if not batch:
+        return
+    rows = [_to_row(item) for item in batch]
+    # WAL (set on every shared connection) lets readers keep going while we write
+    with transaction(DB) as conn:
+        conn.executemany("""
+            INSERT INTO readings (date, user, current_weight, timestamp_ms, timestamp_iso, force,
+                                  session_id, set_id, rep_id, raw_force, device, calibration_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        users, _, ts_ms, _, forces, session_ids = zip(*(r[1:7] for r in rows))
+        rollups.apply_batch(conn, users, ts_ms, forces, session_ids)
+        cache.bump_versions(conn, "readings", set(users))
+    writer_stats["rows"] += len(batch)
+    writer_stats["batches"] += 1
+    writer_stats["last_batch"] = len(batch)
+
+
+def _drain(batch, limit):
+    """Move whatever is already queued into `batch` without blocking."""
+    while len(batch) < limit:
+        try:
+            batch.extend(write_queue.get_many(limit - len(batch)))
+        except Empty:
+            return
 
 
 def _writer_loop():
-    """Runs in background. Pulls force readings off the queue and writes them."""
-    global _writer_running
-    _writer_running = True
+    """Runs in background. Pulls force readings off the queue and writes them in batches.
 
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+    A batch is flushed once it reaches WRITER_BATCH_SIZE or its oldest item
+    has waited WRITER_FLUSH_INTERVAL seconds, whichever comes first.
+    """
+    batch = []
+    batch_started = None
 
     while _writer_running:
+        timeout = WRITER_FLUSH_INTERVAL
+        if batch_started is not None:
+            timeout = max(0.0, batch_started + WRITER_FLUSH_INTERVAL - time.monotonic())
         try:
-            force_value = write_queue.get(timeout=0.2)
+            item = write_queue.get(timeout=timeout)
         except Empty:
-            continue  # loop again; allows thread to exit cleanly
+            item = None  # loop again; allows thread to exit cleanly
 
-        ts = time.time()
-        ts_ms = int(ts * 1000)
-        ts_iso = datetime.utcfromtimestamp(ts).isoformat()
+        if item is not None:
+            if batch_started is None:
+                batch_started = time.monotonic()
+            batch.append(item)
+            _drain(batch, WRITER_BATCH_SIZE)
 
-        c.execute("""
-            INSERT INTO readings (date, user, current_weight, timestamp_ms, timestamp_iso, force)
-            VALUES (?, ?, ?)
-        """, (ts_ms, ts_iso, force_value))
-        conn.commit()
+        if batch and (len(batch) >= WRITER_BATCH_SIZE
+                      or time.monotonic() - batch_started >= WRITER_FLUSH_INTERVAL):
+            _flush(batch)
+            batch = []
+            batch_started = None
 
-    conn.close()
+    # final flush: whatever is pending plus anything still queued
+    _drain(batch, float("inf"))
+    _flush(batch)
+    close_connections()
+    if write_queue.empty():
+        write_queue.close()  # removes the spill file, if any
 
 
 def start_force_writer():
-    """Start background write thread (idempotent)."""
+    """Start background write thread (idempotent), first queueing readings a crashed run left spilled."""
     global _writer_thread, _writer_running
     if _writer_thread is not None and _writer_thread.is_alive():
         return
+    recovered = write_queue.recover()
+    if recovered:
+        print(f"Recovered {recovered} unwritten readings from {write_queue.spill_path}")
 
     _writer_running = True
     _writer_thread = Thread(target=_writer_loop, daemon=True)
     _writer_thread.start()
 
 
-def stop_force_writer():
-    """Stop background writer thread gracefully."""
-    global _writer_running
+def stop_force_writer(timeout=10):
+    """Stop background writer thread gracefully, flushing everything queued."""
+    global _writer_running, _writer_thread
     _writer_running = False
+    if _writer_thread is not None:
+        _writer_thread.join(timeout=timeout)
+        _writer_thread = None
 
 
-def queue_force_reading(force_value):
+def queue_force_reading(force_value, ts=None):
     """
     Called by BLE loop. Extremely fast — just pushes a number into the queue.
+    `ts` is the wall-clock time of the sample (defaults to now). What happens
+    when the queue is full is set by WRITE_QUEUE_POLICY.
+    """
+    write_queue.put((time.time() if ts is None else ts, force_value, _context))
+
+
+def queue_force_readings(force_values, timestamps, context=None, raw=None, device=None,
+                         calibration_id=None):
+    """Queue a batch of samples with their wall-clock timestamps.
+
+    `context` overrides the current recording context for this batch.
+    `raw` holds the sensor values from before calibration (see
+    db/calibration.py), stored next to the calibrated ones with the
+    device's address and the profile used.
     """
-    write_queue.put(force_value)
+    ctx = _context if context is None else context
+    if raw is None:
+        write_queue.put_many((ts, value, ctx) for ts, value in zip(timestamps, force_values))
+    else:
+        write_queue.put_many((ts, value, ctx, r, device, calibration_id)
+                             for ts, value, r in zip(timestamps, force_values, raw))
+
+
+def queue_stats():
+    """Queue depth, high-water mark, dropped/spilled counters and writer totals."""
+    stats = write_queue.stats()
+    stats.update(writer_stats)
+    return stats
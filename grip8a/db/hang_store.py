@@ -0,0 +1,309 @@
+import sqlite3
+import struct
+import time
+import zlib
+from contextlib import nullcontext
+import numpy as np
+from grip8a.db import cache
+from grip8a.db.config import DB_FORCE, HANG_FORCE_RESOLUTION, PACK_AFTER_DAYS
+from grip8a.db.connection import get_connection, transaction
+from grip8a.db.migrations import migrate
+
+DB = DB_FORCE
+
+# maintenance_state row holding the last readings id pack_readings() covered
+PACK_STATE = "packed_readings_id"
+
+# ----------------------
+# Sample blob codec
+# ----------------------
+#
+# One hang is stored as a single zlib-compressed blob:
+#
+#   header  <BBBBBxId  version, time / force / raw / profile widths, count, force resolution
+#   times   delta-of-delta of microsecond offsets from the first sample, zigzag
+#   forces  delta of force / resolution (rounded), zigzag
+#   raw     delta of raw sensor value / resolution (rounded), zigzag
+#   profile delta of calibration profile id + 1 (0: none), zigzag
+#
+# Each integer stream is stored at the narrowest unsigned width (1/2/4/8
+# bytes) that fits it. A steady sample rate makes the time stream almost all
+# zeros and force deltas are small, so zlib does the rest. The raw and
+# profile streams keep what calibration.recalibrate() needs to redo a hang;
+# they are left out (width 0) for samples stored without raw values.
+# Version 1 blobs (header <BBBxId, times and forces only) still decode.
+
+CODEC_VERSION = 2
+_HEADER = struct.Struct("<BBBBBxId")
+_HEADER_V1 = struct.Struct("<BBBxId")
+_WIDTHS = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+# raw is NaN and calibration_id -1 where the blob holds no raw values
+SAMPLE_DTYPE = np.dtype([("t", np.float64), ("force", np.float64),
+                         ("raw", np.float64), ("calibration_id", np.int64)])
+
+
+def _zigzag(x):
+    x = x.astype(np.int64)
+    return ((x << 1) ^ (x >> 63)).astype(np.uint64)
+
+
+def _unzigzag(u):
+    u = u.astype(np.uint64)
+    return ((u >> np.uint64(1)).astype(np.int64)) ^ -((u & np.uint64(1)).astype(np.int64))
+
+
+def _narrow(u):
+    top = int(u.max()) if len(u) else 0
+    for width, dtype in _WIDTHS.items():
+        if top <= np.iinfo(dtype).max:
+            return width, u.astype(dtype).tobytes()
+
+
+def encode_samples(t, forces, resolution=HANG_FORCE_RESOLUTION, raw=None, calibration_ids=None):
+    """Encode sample times (seconds) and forces into a compressed blob.
+
+    Times keep microsecond precision; forces (and `raw`, the sensor values
+    from before calibration) are rounded to `resolution`. `calibration_ids`
+    names each sample's profile (NaN / -1: none) and is only stored with
+    `raw`.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    forces = np.asarray(forces, dtype=np.float64)
+    n = len(t)
+    t_us = np.round((t - t[0]) * 1e6).astype(np.int64) if n else np.zeros(0, np.int64)
+    dod = np.diff(np.diff(t_us, prepend=0), prepend=0)
+    q = np.round(forces / resolution).astype(np.int64)
+    dq = np.diff(q, prepend=0)
+
+    t_width, t_bytes = _narrow(_zigzag(dod))
+    f_width, f_bytes = _narrow(_zigzag(dq))
+    r_width = c_width = 0
+    r_bytes = c_bytes = b""
+    if raw is not None:
+        qr = np.round(np.asarray(raw, dtype=np.float64) / resolution).astype(np.int64)
+        r_width, r_bytes = _narrow(_zigzag(np.diff(qr, prepend=0)))
+        ids = np.full(n, np.nan) if calibration_ids is None else np.asarray(calibration_ids, dtype=np.float64)
+        ids = np.where(np.isnan(ids) | (ids < 0), 0, ids + 1).astype(np.int64)
+        c_width, c_bytes = _narrow(_zigzag(np.diff(ids, prepend=0)))
+    header = _HEADER.pack(CODEC_VERSION, t_width, f_width, r_width, c_width, n, resolution)
+    return zlib.compress(header + t_bytes + f_bytes + r_bytes + c_bytes, 6)
+
+
+def decode_samples(blob):
+    """Inverse of encode_samples: returns a SAMPLE_DTYPE array, t in seconds from the first sample."""
+    data = zlib.decompress(blob)
+    version = data[0]
+    if version == CODEC_VERSION:
+        _, t_width, f_width, r_width, c_width, n, resolution = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+    elif version == 1:
+        _, t_width, f_width, n, resolution = _HEADER_V1.unpack_from(data)
+        r_width = c_width = 0
+        offset = _HEADER_V1.size
+    else:
+        raise ValueError(f"unsupported hang blob version {version}")
+
+    def stream(width):
+        nonlocal offset
+        deltas = np.frombuffer(data, dtype=_WIDTHS[width], count=n, offset=offset)
+        offset += n * width
+        return np.cumsum(_unzigzag(deltas))
+
+    out = np.empty(n, dtype=SAMPLE_DTYPE)
+    out["t"] = np.cumsum(stream(t_width)) / 1e6
+    out["force"] = stream(f_width) * resolution
+    out["raw"] = stream(r_width) * resolution if r_width else np.nan
+    out["calibration_id"] = stream(c_width) - 1 if r_width else -1
+    return out
+
+
+# ----------------------
+# Storage
+# ----------------------
+
+def init_hang_store(db=None):
+    """Create or upgrade the DB schema, including hang_samples (safe to call every run)."""
+    migrate(db or DB)
+
+
+def save_hang(t, forces, user=None, device_id=None, db=None, conn=None,
+              session_id=None, set_id=None, rep_id=None, raw=None, calibration_ids=None):
+    """Store one hang's samples (t = wall-clock seconds) as a single row. Returns its id.
+
+    `raw` and `calibration_ids` keep the values from before calibration and
+    each sample's profile (see encode_samples). With `conn` the insert joins
+    the caller's open transaction instead of committing on its own.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    forces = np.asarray(forces, dtype=np.float64)
+    if len(t) == 0:
+        raise ValueError("a hang needs at least one sample")
+    duration = t[-1] - t[0]
+    rate = (len(t) - 1) / duration if duration > 0 else None
+    row = (
+        user, device_id, int(round(t[0] * 1000)), int(round(t[-1] * 1000)), rate, len(t),
+        float(forces.max()), float(forces.mean()), float(forces.min()),
+        CODEC_VERSION, encode_samples(t, forces, raw=raw, calibration_ids=calibration_ids),
+        session_id, set_id, rep_id,
+    )
+
+    with (transaction(db or DB) if conn is None else nullcontext(conn)) as conn:
+        return conn.execute("""
+            INSERT INTO hang_samples (user, device_id, start_ms, end_ms, sample_rate_hz,
+                sample_count, peak_force, mean_force, min_force, codec, samples,
+                session_id, set_id, rep_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, row).lastrowid
+
+
+def update_hang_samples(conn, hang_id, samples):
+    """Replace one hang's blob with `samples` (a SAMPLE_DTYPE array) and refresh its force summary."""
+    forces = samples["force"]
+    has_raw = not np.isnan(samples["raw"]).any()
+    blob = encode_samples(samples["t"], forces, raw=samples["raw"] if has_raw else None,
+                          calibration_ids=samples["calibration_id"])
+    conn.execute("""
+        UPDATE hang_samples SET peak_force = ?, mean_force = ?, min_force = ?, codec = ?, samples = ?
+        WHERE id = ?
+    """, (float(forces.max()), float(forces.mean()), float(forces.min()), CODEC_VERSION, blob, hang_id))
+
+
+def load_hang(hang_id, db=None, absolute=False):
+    """Samples of one hang as a SAMPLE_DTYPE array (single-row fetch).
+
+    `t` is seconds since the first sample, or Unix seconds with absolute=True.
+    """
+    row = get_connection(db or DB).execute(
+        "SELECT start_ms, samples FROM hang_samples WHERE id = ?", (hang_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"no hang with id {hang_id}")
+    samples = decode_samples(row[1])
+    if absolute:
+        samples["t"] += row[0] / 1000.0
+    return samples
+
+
+def list_hangs(user=None, start_ms=None, end_ms=None, db=None):
+    """Summary rows (no sample blobs) for hangs, newest first."""
+    where, params = [], []
+    if user is not None:
+        where.append("user = ?")
+        params.append(user)
+    if start_ms is not None:
+        where.append("start_ms >= ?")
+        params.append(start_ms)
+    if end_ms is not None:
+        where.append("start_ms <= ?")
+        params.append(end_ms)
+    sql = """
+        SELECT id, user, device_id, start_ms, end_ms, sample_rate_hz, sample_count,
+               peak_force, mean_force, min_force, session_id, set_id, rep_id
+        FROM hang_samples
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY start_ms DESC"
+
+    c = get_connection(db or DB).cursor()
+    c.row_factory = sqlite3.Row
+    rows = [dict(r) for r in c.execute(sql, params)]
+    return rows
+
+
+def _segments(ts, links, raw, devices, gap_s):
+    """Start index of every hang in one user's time-ordered rows, plus the end."""
+    same_link = (links[1:] == links[:-1]) | (np.isnan(links[1:]) & np.isnan(links[:-1]))
+    has_raw = ~np.isnan(raw)
+    change = ((np.diff(ts) > gap_s) | ~same_link.all(axis=1) | (devices[1:] != devices[:-1])
+              | (has_raw[1:] != has_raw[:-1]))
+    return np.concatenate(([0], np.flatnonzero(change) + 1, [len(ts)]))
+
+
+def _link(value):
+    return None if np.isnan(value) else int(value)
+
+
+def pack_readings(older_than_days=PACK_AFTER_DAYS, gap_s=1.0, delete=False, db=None,
+                  chunk_size=100_000, dry_run=False):
+    """Convert one-row-per-sample `readings` older than `older_than_days` into hang_samples rows.
+
+    Each user's readings are streamed in time order, `chunk_size` rows at a
+    time, and split into hangs at every gap longer than `gap_s` and every
+    change of device / session / set / rep, which the hang keeps. Raw sensor
+    values and calibration profile ids are packed along with the forces (a
+    hang also ends where readings without raw values start). Packing
+    covers one contiguous range of readings ids and records where it
+    stopped, so a second run only packs newer rows. With delete=True the
+    packed rows are removed from `readings` (rollups stay). Returns
+    {"hangs": n, "rows": m}; with dry_run=True nothing is written.
+    """
+    db = db or DB
+    cutoff = int((time.time() - older_than_days * 86400) * 1000)
+    with (nullcontext(get_connection(db)) if dry_run else transaction(db)) as conn:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE name = ?", (PACK_STATE,)).fetchone()
+        last = row[0] if row else 0
+        # stop before the first reading that is still too new, so the packed ids stay one range
+        newer = conn.execute("SELECT MIN(id) FROM readings WHERE id > ? AND timestamp_ms >= ?",
+                             (last, cutoff)).fetchone()[0]
+        upto = newer - 1 if newer is not None else conn.execute("SELECT MAX(id) FROM readings").fetchone()[0]
+        if upto is None or upto <= last:
+            return {"hangs": 0, "rows": 0}
+
+        users = [u for (u,) in conn.execute(
+            "SELECT DISTINCT user FROM readings WHERE id > ? AND id <= ?", (last, upto))]
+        hangs = rows = 0
+        for user in users:
+            cur = conn.execute("""
+                SELECT timestamp_ms, force, session_id, set_id, rep_id, raw_force, calibration_id, device
+                FROM readings
+                WHERE user IS ? AND timestamp_ms < ? AND id > ? AND id <= ? AND force IS NOT NULL
+                ORDER BY timestamp_ms, id
+            """, (user, cutoff, last, upto))
+            # the last hang of a chunk may go on in the next one, so it's carried over
+            # columns: seconds, force, session / set / rep, raw, profile id
+            values = devices = None
+            while True:
+                chunk = cur.fetchmany(chunk_size)
+                done = not chunk
+                if chunk:
+                    arr = np.array([r[:7] for r in chunk], dtype=np.float64)  # NULL -> NaN
+                    arr[:, 0] /= 1000.0
+                    dev = np.array([r[7] for r in chunk], dtype=object)
+                    if values is None:
+                        values, devices = arr, dev
+                    else:
+                        values = np.concatenate((values, arr))
+                        devices = np.concatenate((devices, dev))
+                if values is None:
+                    break
+                ts, forces, links, raw = values[:, 0], values[:, 1], values[:, 2:5], values[:, 5]
+                bounds = _segments(ts, links, raw, devices, gap_s)
+                closed = len(bounds) - 1 if done else len(bounds) - 2
+                for lo, hi in zip(bounds[:closed], bounds[1:closed + 1]):
+                    if not dry_run:
+                        session_id, set_id, rep_id = (_link(v) for v in links[lo])
+                        has_raw = not np.isnan(raw[lo])
+                        save_hang(ts[lo:hi], forces[lo:hi], user=user, device_id=devices[lo],
+                                  conn=conn, session_id=session_id, set_id=set_id, rep_id=rep_id,
+                                  raw=raw[lo:hi] if has_raw else None,
+                                  calibration_ids=values[lo:hi, 6] if has_raw else None)
+                    hangs += 1
+                    rows += int(hi - lo)
+                if done:
+                    break
+                values, devices = values[bounds[closed]:], devices[bounds[closed]:]
+
+        if not dry_run:
+            conn.execute("""
+                INSERT INTO maintenance_state (name, value, updated_ms) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_ms = excluded.updated_ms
+            """, (PACK_STATE, upto, int(time.time() * 1000)))
+            if delete:
+                conn.execute("""
+                    DELETE FROM readings
+                    WHERE id > ? AND id <= ? AND timestamp_ms < ? AND force IS NOT NULL
+                """, (last, upto, cutoff))
+                cache.bump_versions(conn, "readings", users)
+    return {"hangs": hangs, "rows": rows}
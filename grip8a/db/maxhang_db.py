@@ -1,31 +1,14 @@
+from grip8a.db import cache
 from grip8a.db.config import DB_MAXHANG
-import sqlite3
+from grip8a.db.connection import get_connection, transaction
+from grip8a.db.migrations import migrate
 from datetime import datetime
 import csv
 
 DB = DB_MAXHANG
 
 def init_maxhang_db():
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS hangs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            user TEXT,
-            current_weight REAL,
-            weight_percent REAL,
-            exercise_type TEXT,
-            side TEXT,
-            edge_size_mm INTEGER,
-            added_weight REAL,
-            hang_duration_sec INTEGER,
-            rpe INTEGER,
-            notes TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    migrate(DB)
 
 def log_max_hang(username, current_weight):
     print("\nSelect Exercise Type:")
@@ -55,17 +38,14 @@ def log_max_hang(username, current_weight):
 
     percent_body_weight = (weight / current_weight) * 100 if exercise_type == "hangboard" else (weight / (current_weight / 2)) * 100
     print(f"\nYou hung for {duration} sec with {weight} lbs ({percent_body_weight:.1f}% body weight) on a {edge} mm edge.")
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+    with transaction(DB) as conn:
+        conn.execute("""
+            INSERT INTO hangs (date, user, current_weight, weight_percent, exercise_type, side, edge_size_mm, added_weight, hang_duration_sec, rpe, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (datetime.now().strftime("%Y-%m-%d %H:%M"),
+              username, current_weight, percent_body_weight, exercise_type, side, edge, weight, duration, rpe, notes))
+        cache.bump_versions(conn, "hangs", [username])
 
-    c.execute("""
-        INSERT INTO hangs (date, user, current_weight, weight_percent, exercise_type, side, edge_size_mm, added_weight, hang_duration_sec, rpe, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (datetime.now().strftime("%Y-%m-%d %H:%M"),
-          username, current_weight, percent_body_weight, exercise_type, side, edge, weight, duration, rpe, notes))
-
-    conn.commit()
-    conn.close()
     print("\nSaved!\n")
 
 def export_logs(username, rows):
@@ -102,9 +82,15 @@ def export_logs_to_csv(username, rows):
             writer.writerow(row)
     print(f"\nLogs exported to {filename}\n")
 
+def export_logs_columnar(username, out_dir="grip8a_export"):
+    # lazy import so the menu doesn't need numpy until it's used
+    from grip8a.db.columnar import export_columnar
+    counts = export_columnar(out_dir, user=username, db=DB)
+    print(f"\nExported {counts['hangs']} hangs and {counts['readings']} readings to {out_dir}/\n")
+
 def view_logs(username):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+    c = get_connection(DB).cursor()
+    rows = []
 
     while True:
         print(f"""
@@ -163,10 +149,11 @@ Notes: {row[11]}
         print("\nExport Type:")
         print("1. .txt file")
         print("2. .csv file")
-        export_choice = input("Choose (1 or 2): ")
+        print("3. columnar (.npy) folder")
+        export_choice = input("Choose (1, 2 or 3): ")
         if export_choice == '1':
             export_logs(username, rows)
         elif export_choice == '2':
             export_logs_to_csv(username, rows)
-
-    conn.close()
+        elif export_choice == '3':
+            export_logs_columnar(username)
@@ -0,0 +1,301 @@
+import time
+from grip8a.db import cache
+from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection, transaction
+
+DB = DB_FORCE
+
+# ----------------------
+# Versioned schema
+# ----------------------
+#
+# schema_version records which numbered steps have run on a database file,
+# per component (grip8a's own tables, the Flask app's tables, ...). migrate()
+# applies the missing steps in order, each in its own transaction, so an old
+# database is brought up to date in place instead of being deleted.
+#
+# Never edit a step that has shipped; append a new one. Steps must cope with
+# tables that already exist, since databases from before versioning have the
+# tables but no schema_version rows.
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            component TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            name TEXT,
+            applied_ms INTEGER NOT NULL,
+            PRIMARY KEY (component, version)
+        )
+    """)
+
+
+def current_version(db=None, component="grip8a"):
+    conn = get_connection(db or DB)
+    with transaction(db or DB):
+        _ensure_version_table(conn)
+    row = conn.execute(
+        "SELECT MAX(version) FROM schema_version WHERE component = ?", (component,)
+    ).fetchone()
+    return row[0] or 0
+
+
+def add_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for each {name: sql_type} the table doesn't have yet."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+
+def migrate(db=None, migrations=None, component="grip8a"):
+    """Apply every step of `migrations` newer than the DB's version. Returns the versions applied."""
+    migrations = MIGRATIONS if migrations is None else migrations
+    have = current_version(db, component)
+    latest = migrations[-1][0] if migrations else 0
+    if have > latest:
+        print(f"Warning: {db or DB} has {component} schema v{have}, this code knows up to v{latest}")
+        return []
+
+    applied = []
+    for version, name, step in migrations:
+        if version <= have:
+            continue
+        with transaction(db or DB) as conn:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (component, version, name, applied_ms) VALUES (?, ?, ?, ?)",
+                (component, version, name, int(time.time() * 1000)),
+            )
+        applied.append(version)
+    if applied:
+        # refresh planner statistics for the new indexes
+        get_connection(db or DB).execute("PRAGMA optimize")
+    return applied
+
+
+# ----------------------
+# grip8a steps
+# ----------------------
+
+def _v1_baseline(c):
+    """Every table as of the first versioned release, upgrading older layouts in place."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS user_table (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_created TEXT,
+            user TEXT,
+            gender TEXT,
+            age INTEGER,
+            max_grade TEXT
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS hangs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            user TEXT,
+            current_weight REAL,
+            weight_percent REAL,
+            exercise_type TEXT,
+            side TEXT,
+            edge_size_mm INTEGER,
+            added_weight REAL,
+            hang_duration_sec INTEGER,
+            rpe INTEGER,
+            notes TEXT
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            user TEXT,
+            current_weight REAL,
+            weight_percent REAL,
+            timestamp_ms INTEGER,
+            timestamp_iso TEXT,
+            force REAL,
+            session_id INTEGER,
+            set_id INTEGER,
+            rep_id INTEGER
+        )
+    """)
+    # readings from before workout linking
+    add_columns(c, "readings", {"session_id": "INTEGER", "set_id": "INTEGER", "rep_id": "INTEGER"})
+    c.execute("CREATE INDEX IF NOT EXISTS idx_readings_rep_ts ON readings (rep_id, timestamp_ms)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_readings_session_ts ON readings (session_id, timestamp_ms)")
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS hang_samples (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT,
+            device_id TEXT,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER NOT NULL,
+            sample_rate_hz REAL,
+            sample_count INTEGER NOT NULL,
+            peak_force REAL,
+            mean_force REAL,
+            min_force REAL,
+            codec INTEGER NOT NULL,
+            samples BLOB NOT NULL,
+            session_id INTEGER,
+            set_id INTEGER,
+            rep_id INTEGER
+        )
+    """)
+    add_columns(c, "hang_samples", {"session_id": "INTEGER", "set_id": "INTEGER", "rep_id": "INTEGER"})
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hang_samples_rep ON hang_samples (rep_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hang_samples_session ON hang_samples (session_id, start_ms)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hang_samples_user_start ON hang_samples (user, start_ms)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hang_samples_start ON hang_samples (start_ms)")
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS workout_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            user TEXT,
+            protocol TEXT,
+            started_ms INTEGER NOT NULL,
+            ended_ms INTEGER
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS workout_sets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL REFERENCES workout_sessions(id),
+            set_number INTEGER NOT NULL,
+            started_ms INTEGER NOT NULL,
+            ended_ms INTEGER
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS workout_reps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL REFERENCES workout_sessions(id),
+            set_id INTEGER NOT NULL REFERENCES workout_sets(id),
+            rep_number INTEGER NOT NULL,
+            phase TEXT,
+            started_ms INTEGER NOT NULL,
+            ended_ms INTEGER
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_started ON workout_sessions (user, started_ms)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sets_session_number ON workout_sets (session_id, set_number)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reps_set_number ON workout_reps (set_id, rep_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reps_session ON workout_reps (session_id, rep_number)")
+
+    # the force writer keeps these up to date alongside readings
+    # (lazy import: checking the schema version at start-up shouldn't load numpy)
+    from grip8a.db import rollups
+    rollups.init_rollups(conn=c)
+
+
+def _v2_query_indexes(c):
+    """Indexes for the lookups the CLI and writers actually run."""
+    # user_exists / update_user
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_table_user ON user_table (user)")
+    # view_logs: by date, by exercise type, by side (each for one user, newest first)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hangs_user_date ON hangs (user, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hangs_user_type_date ON hangs (user, exercise_type, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hangs_user_side_date ON hangs (user, side, date)")
+    # per-user time ranges: replay, pack_readings, columnar export, rollup rebuilds
+    c.execute("CREATE INDEX IF NOT EXISTS idx_readings_user_ts ON readings (user, timestamp_ms)")
+
+
+def _v3_retention_index(c):
+    """Lets the retention job walk old readings oldest-first without a table scan."""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_readings_ts ON readings (timestamp_ms)")
+
+
+def _v4_rep_bounds(c):
+    """Rep onset/offset as detected in the force stream (ms, fractional), next to the timer's bounds."""
+    add_columns(c, "workout_reps", {"onset_ms": "REAL", "offset_ms": "REAL"})
+
+
+def _v5_rep_metrics(c):
+    """Per-rep force metrics (see grip8a/analysis/metrics.py), filled in as each rep ends."""
+    add_columns(c, "workout_reps", {
+        "peak_force": "REAL", "time_to_peak_s": "REAL", "max_rfd": "REAL",
+        "impulse": "REAL", "mean_force": "REAL", "drop_off": "REAL",
+    })
+
+
+def _v6_progression_forecasts(c):
+    """Nightly output of max_hang_analysis.py --all: one row per user, ROI level and week."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS progression_forecasts (
+            forecast_date TEXT NOT NULL,
+            user TEXT NOT NULL,
+            current_max REAL,
+            bodyweight REAL,
+            progression TEXT NOT NULL,
+            roi REAL,
+            week INTEGER NOT NULL,
+            to_pull REAL,
+            bodyweight_percent REAL,
+            PRIMARY KEY (forecast_date, user, progression, week)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_forecasts_user_date ON progression_forecasts (user, forecast_date)")
+
+
+def _v7_critical_force(c):
+    """Critical force / W' per all-out test session (grip8a/analysis/critical_force.py)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS critical_force_tests (
+            session_id INTEGER PRIMARY KEY REFERENCES workout_sessions(id),
+            user TEXT,
+            started_ms INTEGER NOT NULL,
+            reps INTEGER NOT NULL,
+            critical_force REAL,
+            w_prime REAL,
+            plateau_cv REAL,
+            computed_ms INTEGER NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cf_tests_user_started ON critical_force_tests (user, started_ms)")
+    # finding the test sessions among all workouts
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_protocol ON workout_sessions (protocol)")
+
+
+def _v8_data_versions(c):
+    """Per-user change counters the writers bump, so cached analytics know when they're stale."""
+    cache.init_versions(conn=c)
+
+
+def _v9_calibration(c):
+    """Per-device calibration profiles, and the raw value / device / profile behind each reading."""
+    # lazy import: see _v1_baseline
+    from grip8a.db import calibration
+    calibration.init_calibration(conn=c)
+    add_columns(c, "readings", {"raw_force": "REAL", "device": "TEXT", "calibration_id": "INTEGER"})
+    # recalibrate(): one device's readings over a time range
+    c.execute("CREATE INDEX IF NOT EXISTS idx_readings_device_ts ON readings (device, timestamp_ms)")
+
+
+def _v10_maintenance_state(c):
+    """Progress markers of maintenance jobs, e.g. how far pack_readings() got."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL,
+            updated_ms INTEGER NOT NULL
+        )
+    """)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _v1_baseline),
+    (2, "query indexes", _v2_query_indexes),
+    (3, "retention index", _v3_retention_index),
+    (4, "detected rep bounds", _v4_rep_bounds),
+    (5, "rep metrics", _v5_rep_metrics),
+    (6, "progression forecasts", _v6_progression_forecasts),
+    (7, "critical force tests", _v7_critical_force),
+    (8, "data versions", _v8_data_versions),
+    (9, "calibration profiles", _v9_calibration),
+    (10, "maintenance state", _v10_maintenance_state),
+]
@@ -0,0 +1,187 @@
+import glob
+import os
+import time
+import numpy as np
+from grip8a.db.config import DB_FORCE, RETENTION_DAYS, ARCHIVE_DIR, PACK_AFTER_DAYS
+from grip8a.db.connection import get_connection, transaction
+from grip8a.db.hang_store import pack_readings
+
+DB = DB_FORCE
+
+# ----------------------
+# Archiving raw readings
+# ----------------------
+#
+# Old raw rows leave SQLite in chunks, oldest first. Each chunk becomes one
+# compressed .npz in the archive directory, named <table>_<first ms>_<last ms>,
+# holding one array per column:
+#
+#   INTEGER columns  int64, NULL -> -1
+#   REAL columns     float64, NULL -> NaN
+#   TEXT columns     unicode strings, NULL -> ""
+#
+# The file is written and fsynced before the rows are deleted, so a crash can
+# at worst archive a chunk twice; load_archive() drops duplicate ids.
+# Rollups, hang_samples and workout tables are left alone, so history charts
+# and per-hang data keep working after the raw rows are gone. run_maintenance()
+# packs readings into hang_samples well before they are old enough to archive,
+# so every hang outlives its raw rows.
+
+
+def _column_kinds(conn, table):
+    kinds = {}
+    for _, name, sql_type, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        sql_type = (sql_type or "").upper()
+        if "INT" in sql_type:
+            kinds[name] = "int"
+        elif any(t in sql_type for t in ("REAL", "FLOA", "DOUB")):
+            kinds[name] = "float"
+        else:
+            kinds[name] = "text"
+    return kinds
+
+
+def _to_array(values, kind):
+    if kind == "int":
+        return np.array([-1 if v is None else v for v in values], dtype=np.int64)
+    if kind == "float":
+        return np.array(values, dtype=np.float64)  # None -> nan
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _write_archive(path, arrays):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def archive_readings(older_than_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, db=None,
+                     table="readings", chunk_size=200_000, dry_run=False):
+    """Move rows of `table` older than `older_than_days` into .npz archives.
+
+    Works on any table with a timestamp_ms column (grip8a `readings`, the
+    Flask app's `reading`). Returns {"rows": n, "files": [...]}; with
+    dry_run=True only counts what would move.
+    """
+    db = db or DB
+    cutoff = int((time.time() - older_than_days * 86400) * 1000)
+    conn = get_connection(db)
+    if dry_run:
+        n = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE timestamp_ms < ?", (cutoff,)).fetchone()[0]
+        return {"rows": n, "files": []}
+
+    os.makedirs(archive_dir, exist_ok=True)
+    kinds = _column_kinds(conn, table)
+    names = list(kinds)
+    total, files = 0, []
+    while True:
+        rows = conn.execute(
+            f"SELECT {', '.join(names)} FROM {table} WHERE timestamp_ms < ? "
+            f"ORDER BY timestamp_ms, id LIMIT ?", (cutoff, chunk_size)
+        ).fetchall()
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        arrays = {name: _to_array(columns[i], kinds[name]) for i, name in enumerate(names)}
+        ts = arrays["timestamp_ms"]
+        path = os.path.join(archive_dir, f"{table}_{ts[0]}_{ts[-1]}.npz")
+        _write_archive(path, arrays)
+        # the chunk is everything up to its last (timestamp_ms, id) that existed
+        # when it was read, so one range DELETE removes exactly those rows
+        last_ts, last_id, max_id = int(ts[-1]), int(arrays["id"][-1]), int(arrays["id"].max())
+        with transaction(db) as c:
+            c.execute(f"""
+                DELETE FROM {table}
+                WHERE timestamp_ms <= ? AND (timestamp_ms < ? OR id <= ?) AND id <= ?
+            """, (last_ts, last_ts, last_id, max_id))
+        total += len(rows)
+        files.append(path)
+    return {"rows": total, "files": files}
+
+
+def load_archive(archive_dir=ARCHIVE_DIR, table="readings", start_ms=None, end_ms=None):
+    """Archived rows of `table` overlapping [start_ms, end_ms] as one dict of column arrays."""
+    parts = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, f"{table}_*.npz"))):
+        first, last = (int(x) for x in os.path.basename(path)[len(table) + 1:-4].split("_"))
+        if (start_ms is not None and last < start_ms) or (end_ms is not None and first > end_ms):
+            continue
+        with np.load(path) as npz:
+            parts.append({k: npz[k] for k in npz.files})
+    if not parts:
+        return {}
+    out = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    _, keep = np.unique(out["id"], return_index=True)
+    mask = np.ones(len(out["id"]), dtype=bool) if start_ms is None else out["timestamp_ms"] >= start_ms
+    if end_ms is not None:
+        mask &= out["timestamp_ms"] <= end_ms
+    keep = keep[mask[keep]]
+    keep = keep[np.argsort(out["timestamp_ms"][keep], kind="stable")]
+    return {k: v[keep] for k, v in out.items()}
+
+
+# ----------------------
+# Compaction
+# ----------------------
+
+def _file_bytes(db):
+    return sum(os.path.getsize(p) for p in (db, db + "-wal") if os.path.exists(p))
+
+
+def compact(db=None):
+    """Checkpoint the WAL and return free pages to the OS. Returns bytes reclaimed.
+
+    The first run on a database switches it to incremental auto-vacuum, which
+    needs one full VACUUM; after that only freed pages are released.
+    """
+    db = db or DB
+    conn = get_connection(db)
+    before = _file_bytes(db)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    else:
+        conn.execute("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before - _file_bytes(db)
+
+
+def run_maintenance(older_than_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, db=None,
+                    table="readings", vacuum=True, dry_run=False, pack_days=PACK_AFTER_DAYS,
+                    keep_packed=True):
+    """Pack, archive old raw rows, then compact. Returns a report dict.
+
+    grip8a `readings` older than `pack_days` are first packed into one
+    hang_samples blob per hang (see hang_store.pack_readings). The raw rows
+    stay in `readings`, where session/rep sample reads, the columnar export
+    and recalibration find them, until the archive step moves them out;
+    keep_packed=False drops them right after packing. pack_days=None skips
+    packing.
+    """
+    db = db or DB
+    started = time.perf_counter()
+    size_before = _file_bytes(db)
+    packed = {"hangs": 0, "rows": 0}
+    if table == "readings" and pack_days is not None:
+        # whatever the archive step is about to move out gets packed first
+        packed = pack_readings(min(pack_days, older_than_days), delete=not keep_packed, db=db,
+                               dry_run=dry_run)
+    archived = archive_readings(older_than_days, archive_dir, db, table, dry_run=dry_run)
+    reclaimed = compact(db) if vacuum and not dry_run else 0
+    conn = get_connection(db)
+    return {
+        "db": db,
+        "table": table,
+        "packed_hangs": packed["hangs"],
+        "packed_rows": packed["rows"],
+        "archived_rows": archived["rows"],
+        "archive_files": archived["files"],
+        "remaining_rows": conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0],
+        "size_before": size_before,
+        "size_after": _file_bytes(db),
+        "reclaimed_bytes": reclaimed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,304 @@
+import sqlite3
+import numpy as np
+from grip8a.db.config import DB_FORCE, ROLLUP_RESOLUTIONS_MS
+from grip8a.db.connection import get_connection, transaction
+
+DB = DB_FORCE
+
+# ----------------------
+# Multi-resolution force rollups
+# ----------------------
+#
+# force_rollups holds count/min/max/sum per (resolution, user, time bucket)
+# and session_rollups the same per workout session. The force writer folds
+# every batch into them inside the same transaction as the raw insert, so
+# they are always consistent with `readings`. Readers then pick a resolution
+# whose bucket count fits their point budget instead of scanning raw rows.
+#
+# A missing user is stored as '' so it can be part of the primary key.
+
+
+def init_rollups(db=None, conn=None):
+    """Create the rollup tables (safe to call every run). Returns True if they were new."""
+    if conn is None:
+        with transaction(db or DB) as conn:
+            return init_rollups(conn=conn)
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='force_rollups'"
+    ).fetchone() is not None
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS force_rollups (
+            resolution_ms INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            bucket_ms INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            min_force REAL,
+            max_force REAL,
+            sum_force REAL,
+            PRIMARY KEY (resolution_ms, user, bucket_ms)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_rollups (
+            session_id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            first_ms INTEGER,
+            last_ms INTEGER,
+            count INTEGER NOT NULL,
+            min_force REAL,
+            max_force REAL,
+            sum_force REAL
+        )
+    """)
+    return not existed
+
+
+def _group(keys, ts_ms, forces):
+    """Aggregate forces per unique row of `keys` (an (n, k) int64 array)."""
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    m = len(uniq)
+    count = np.bincount(inverse, minlength=m)
+    total = np.bincount(inverse, weights=forces, minlength=m)
+    lo = np.full(m, np.inf)
+    hi = np.full(m, -np.inf)
+    np.minimum.at(lo, inverse, forces)
+    np.maximum.at(hi, inverse, forces)
+    first = np.full(m, np.iinfo(np.int64).max)
+    last = np.full(m, np.iinfo(np.int64).min)
+    np.minimum.at(first, inverse, ts_ms)
+    np.maximum.at(last, inverse, ts_ms)
+    return uniq, count, lo, hi, total, first, last
+
+
+def apply_batch(conn, users, ts_ms, forces, session_ids=None):
+    """Fold a batch of samples into every rollup. Call inside the writer's transaction.
+
+    `users` and `session_ids` are per-sample sequences (None allowed).
+    """
+    n = len(ts_ms)
+    if n == 0:
+        return
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    forces = np.asarray(forces, dtype=np.float64)
+    names = ["" if u is None else str(u) for u in users]
+    user_table, user_codes = np.unique(names, return_inverse=True)
+    user_codes = user_codes.reshape(-1).astype(np.int64)
+
+    rows = []
+    for res in ROLLUP_RESOLUTIONS_MS:
+        keys = np.column_stack((user_codes, ts_ms // res * res))
+        uniq, count, lo, hi, total, _, _ = _group(keys, ts_ms, forces)
+        rows.extend(
+            (res, user_table[u], int(b), int(c), float(a), float(z), float(s))
+            for (u, b), c, a, z, s in zip(uniq, count, lo, hi, total)
+        )
+    conn.executemany("""
+        INSERT INTO force_rollups (resolution_ms, user, bucket_ms, count, min_force, max_force, sum_force)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (resolution_ms, user, bucket_ms) DO UPDATE SET
+            count = count + excluded.count,
+            min_force = MIN(min_force, excluded.min_force),
+            max_force = MAX(max_force, excluded.max_force),
+            sum_force = sum_force + excluded.sum_force
+    """, rows)
+
+    if session_ids is None:
+        return
+    sessions = np.array([-1 if s is None else s for s in session_ids], dtype=np.int64)
+    tagged = sessions >= 0
+    if not tagged.any():
+        return
+    keys = np.column_stack((sessions[tagged], user_codes[tagged]))
+    uniq, count, lo, hi, total, first, last = _group(keys, ts_ms[tagged], forces[tagged])
+    conn.executemany("""
+        INSERT INTO session_rollups (session_id, user, first_ms, last_ms, count, min_force, max_force, sum_force)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (session_id) DO UPDATE SET
+            first_ms = MIN(first_ms, excluded.first_ms),
+            last_ms = MAX(last_ms, excluded.last_ms),
+            count = count + excluded.count,
+            min_force = MIN(min_force, excluded.min_force),
+            max_force = MAX(max_force, excluded.max_force),
+            sum_force = sum_force + excluded.sum_force
+    """, [
+        (int(sid), user_table[u], int(f), int(l), int(c), float(a), float(z), float(s))
+        for (sid, u), c, a, z, s, f, l in zip(uniq, count, lo, hi, total, first, last)
+    ])
+
+
+def rebuild_rollups(db=None, source_sql="SELECT user, timestamp_ms, force, session_id FROM readings",
+                    chunk_size=100000):
+    """Recompute all rollups from raw rows, streaming `source_sql` in chunks.
+
+    `source_sql` must select (user, timestamp_ms, force, session_id).
+    """
+    with transaction(db or DB) as conn:
+        init_rollups(conn=conn)
+        conn.execute("DELETE FROM force_rollups")
+        conn.execute("DELETE FROM session_rollups")
+        cur = conn.cursor()
+        cur.execute(source_sql + " WHERE timestamp_ms IS NOT NULL AND force IS NOT NULL")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            users, ts, forces, sessions = zip(*rows)
+            apply_batch(conn, users, ts, forces, sessions)
+
+
+def _runs(buckets, width):
+    """Merge sorted bucket starts into contiguous [start, end) ranges."""
+    runs = []
+    for b in buckets:
+        if runs and runs[-1][1] == b:
+            runs[-1][1] = b + width
+        else:
+            runs.append([b, b + width])
+    return runs
+
+
+def rebuild_range(conn, user, start_ms, end_ms):
+    """Recompute one user's rollups around [start_ms, end_ms] after readings there changed.
+
+    Every bucket overlapping the range (widened to whole buckets of the
+    coarsest resolution) and every session with readings in it is rebuilt
+    from `readings`. Buckets and sessions that still count readings since
+    packed into hang_samples or archived are left as they were, since they
+    can't be recomputed. Call inside the transaction that changed the
+    readings. Returns how many buckets and sessions were left.
+    """
+    coarsest = max(ROLLUP_RESOLUTIONS_MS)
+    lo, hi = start_ms // coarsest * coarsest, (end_ms // coarsest + 1) * coarsest
+    key = "" if user is None else str(user)
+    # NULL and '' share the '' rollups
+    names = (None, "") if key == "" else (key,)
+
+    # one pass over the index, in time order; a NULL session comes back as NaN
+    arr = np.concatenate([np.array(conn.execute("""
+        SELECT timestamp_ms, force, session_id FROM readings
+        WHERE user IS ? AND timestamp_ms >= ? AND timestamp_ms < ? AND force IS NOT NULL
+        ORDER BY timestamp_ms
+    """, (name, lo, hi)).fetchall(), dtype=np.float64).reshape(-1, 3) for name in names])
+    if len(names) > 1:
+        arr = arr[np.argsort(arr[:, 0], kind="stable")]
+    ts, forces = arr[:, 0].astype(np.int64), arr[:, 1]
+    in_range = (ts >= start_ms) & (ts <= end_ms) & ~np.isnan(arr[:, 2])
+    sessions = np.unique(arr[in_range, 2]).astype(np.int64).tolist()
+
+    # a coarse bucket can be rebuilt when readings still hold all it counted
+    buckets, have = np.unique(ts // coarsest * coarsest, return_counts=True)
+    have = dict(zip(buckets.tolist(), have.tolist()))
+    counted = dict(conn.execute("""
+        SELECT bucket_ms, count FROM force_rollups
+        WHERE resolution_ms = ? AND user = ? AND bucket_ms >= ? AND bucket_ms < ?
+    """, (coarsest, key, lo, hi)))
+    stale = {b for b, n in counted.items() if have.get(b, 0) < n}
+    if stale:
+        keep = ~np.isin(ts // coarsest * coarsest, list(stale))
+        ts, forces = ts[keep], forces[keep]
+    for start, end in _runs(sorted((set(have) | set(counted)) - stale), coarsest):
+        conn.execute("DELETE FROM force_rollups WHERE user = ? AND bucket_ms >= ? AND bucket_ms < ?",
+                     (key, start, end))
+    if len(ts):
+        rows = []
+        for res in ROLLUP_RESOLUTIONS_MS:
+            bucket = ts // res * res
+            # ts is sorted, so each bucket is one contiguous run
+            first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            count = np.diff(np.r_[first, len(ts)])
+            rows.extend(zip(
+                [res] * len(first), [key] * len(first), bucket[first].tolist(), count.tolist(),
+                np.minimum.reduceat(forces, first).tolist(), np.maximum.reduceat(forces, first).tolist(),
+                np.add.reduceat(forces, first).tolist(),
+            ))
+        conn.executemany("""
+            INSERT INTO force_rollups (resolution_ms, user, bucket_ms, count, min_force, max_force, sum_force)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    skipped = len(stale)
+    for session_id in sessions:
+        n = conn.execute("""
+            SELECT COUNT(*) FROM readings
+            WHERE session_id = ? AND timestamp_ms IS NOT NULL AND force IS NOT NULL
+        """, (session_id,)).fetchone()[0]
+        row = conn.execute("SELECT count FROM session_rollups WHERE session_id = ?", (session_id,)).fetchone()
+        if row is not None and n < row[0]:
+            skipped += 1
+            continue
+        conn.execute("DELETE FROM session_rollups WHERE session_id = ?", (session_id,))
+        conn.execute("""
+            INSERT INTO session_rollups (session_id, user, first_ms, last_ms, count, min_force, max_force, sum_force)
+            SELECT session_id, COALESCE(MIN(user), ''), MIN(timestamp_ms), MAX(timestamp_ms), COUNT(*),
+                   MIN(force), MAX(force), SUM(force)
+            FROM readings
+            WHERE session_id = ? AND timestamp_ms IS NOT NULL AND force IS NOT NULL
+            GROUP BY session_id
+        """, (session_id,))
+    return skipped
+
+
+# ----------------------
+# Queries
+# ----------------------
+
+def pick_resolution(start_ms, end_ms, max_points):
+    """Finest rollup resolution whose bucket count over the range fits `max_points`."""
+    span = max(1, end_ms - start_ms)
+    for res in ROLLUP_RESOLUTIONS_MS:
+        if span / res <= max_points:
+            return res
+    return ROLLUP_RESOLUTIONS_MS[-1]
+
+
+def query_rollups(user, start_ms, end_ms, max_points=500, db=None):
+    """Force history for charts: one point per bucket at an automatically chosen resolution.
+
+    Returns a dict of NumPy arrays (bucket_ms, count, min, max, mean) plus
+    the resolution used.
+    """
+    res = pick_resolution(start_ms, end_ms, max_points)
+    rows = get_connection(db or DB).execute("""
+        SELECT bucket_ms, count, min_force, max_force, sum_force FROM force_rollups
+        WHERE resolution_ms = ? AND user = ? AND bucket_ms >= ? AND bucket_ms <= ?
+        ORDER BY bucket_ms
+    """, (res, user or "", start_ms // res * res, end_ms)).fetchall()
+    arr = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return {
+        "resolution_ms": res,
+        "bucket_ms": arr[:, 0].astype(np.int64),
+        "count": arr[:, 1].astype(np.int64),
+        "min": arr[:, 2],
+        "max": arr[:, 3],
+        "mean": arr[:, 4] / np.maximum(arr[:, 1], 1),
+    }
+
+
+def user_summary(user, db=None):
+    """count / total / avg / min / max force over all of a user's readings, from the coarsest rollup."""
+    row = get_connection(db or DB).execute("""
+        SELECT SUM(count), SUM(sum_force), MIN(min_force), MAX(max_force) FROM force_rollups
+        WHERE resolution_ms = ? AND user = ?
+    """, (ROLLUP_RESOLUTIONS_MS[-1], user or "")).fetchone()
+    count, total, lo, hi = row
+    count = int(count or 0)
+    return {
+        "count": count,
+        "total_force": float(total or 0.0),
+        "avg_force": float(total) / count if count else 0.0,
+        "min_force": float(lo) if lo is not None else 0.0,
+        "max_force": float(hi) if hi is not None else 0.0,
+    }
+
+
+def session_summaries(user, db=None):
+    """Per-session count/min/max/mean for a user, newest first."""
+    c = get_connection(db or DB).cursor()
+    c.row_factory = sqlite3.Row
+    rows = [dict(r) for r in c.execute("""
+        SELECT session_id, first_ms, last_ms, count, min_force, max_force,
+               sum_force / count AS mean_force
+        FROM session_rollups WHERE user = ? ORDER BY first_ms DESC
+    """, (user or "",))]
+    return rows
@@ -0,0 +1,167 @@
+import sqlite3
+import time
+from datetime import datetime
+import numpy as np
+from grip8a.analysis.metrics import METRIC_FIELDS
+from grip8a.db import cache
+from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection, transaction
+from grip8a.db.migrations import migrate
+
+DB = DB_FORCE
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def init_workout_db():
+    """Create or upgrade the DB schema, including session / set / rep tables (safe to call every run)."""
+    migrate(DB)
+
+
+def _insert(sql, params):
+    with transaction(DB) as conn:
+        return conn.execute(sql, params).lastrowid
+
+
+def _finish(table, row_id, ended_ms=None):
+    with transaction(DB) as conn:
+        conn.execute(f"UPDATE {table} SET ended_ms = ? WHERE id = ?",
+                     (ended_ms or _now_ms(), row_id))
+
+
+# ----------------------
+# Written by the timer as the protocol runs
+# ----------------------
+
+def start_session(user=None, protocol=None):
+    """Open a workout session; `protocol` is a short description, e.g. "7/3 x6"."""
+    return _insert(
+        "INSERT INTO workout_sessions (date, user, protocol, started_ms) VALUES (?, ?, ?, ?)",
+        (datetime.now().strftime("%Y-%m-%d %H:%M"), user, protocol, _now_ms()),
+    )
+
+
+def end_session(session_id):
+    _finish("workout_sessions", session_id)
+
+
+def start_set(session_id, set_number):
+    return _insert(
+        "INSERT INTO workout_sets (session_id, set_number, started_ms) VALUES (?, ?, ?)",
+        (session_id, set_number, _now_ms()),
+    )
+
+
+def end_set(set_id):
+    _finish("workout_sets", set_id)
+
+
+def start_rep(session_id, set_id, rep_number, phase="HANG"):
+    return _insert(
+        "INSERT INTO workout_reps (session_id, set_id, rep_number, phase, started_ms) VALUES (?, ?, ?, ?, ?)",
+        (session_id, set_id, rep_number, phase, _now_ms()),
+    )
+
+
+def end_rep(rep_id):
+    _finish("workout_reps", rep_id)
+
+
+def set_rep_bounds(rep_id, onset_ms, offset_ms, metrics=None):
+    """Store where the rep was detected in the force stream and its metrics (None clears them)."""
+    set_rep_bounds_many([(rep_id, onset_ms, offset_ms, metrics)])
+
+
+def set_rep_bounds_many(rows):
+    """Bulk set_rep_bounds for (rep_id, onset_ms, offset_ms, metrics) rows, in one transaction."""
+    columns = ", ".join(f"{name} = ?" for name in METRIC_FIELDS)
+    rows = [(onset, offset, *(metrics.get(name) if metrics else None for name in METRIC_FIELDS), rep_id)
+            for rep_id, onset, offset, metrics in rows]
+    if not rows:
+        return
+    with transaction(DB) as conn:
+        conn.executemany(f"UPDATE workout_reps SET onset_ms = ?, offset_ms = ?, {columns} WHERE id = ?", rows)
+        users = conn.execute(f"""
+            SELECT DISTINCT ws.user FROM workout_reps r JOIN workout_sessions ws ON ws.id = r.session_id
+            WHERE r.id IN ({', '.join('?' * len(rows))})
+        """, [row[-1] for row in rows]).fetchall()
+        cache.bump_versions(conn, "reps", [u for u, in users])
+
+
+# ----------------------
+# Queries
+# ----------------------
+
+def latest_session(user, since_ms=None):
+    """Id of the user's most recent session (optionally started after `since_ms`)."""
+    row = get_connection(DB).execute("""
+        SELECT id FROM workout_sessions
+        WHERE user = ? AND started_ms >= ?
+        ORDER BY started_ms DESC LIMIT 1
+    """, (user, since_ms or 0)).fetchone()
+    return row[0] if row else None
+
+
+def rep_id_for(session_id, set_number, rep_number=1):
+    row = get_connection(DB).execute("""
+        SELECT r.id FROM workout_reps r
+        JOIN workout_sets s ON s.id = r.set_id
+        WHERE s.session_id = ? AND s.set_number = ? AND r.rep_number = ?
+    """, (session_id, set_number, rep_number)).fetchone()
+    return row[0] if row else None
+
+
+def rep_samples(rep_id):
+    """(timestamp_ms, force) arrays for every reading of one rep (index range scan)."""
+    rows = get_connection(DB).execute(
+        "SELECT timestamp_ms, force FROM readings WHERE rep_id = ? ORDER BY timestamp_ms",
+        (rep_id,),
+    ).fetchall()
+    arr = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    return arr[:, 0].astype(np.int64), arr[:, 1]
+
+
+def session_samples(session_id):
+    """(timestamp_ms, force) arrays for a whole session in time order, pre/post-roll included."""
+    rows = get_connection(DB).execute(
+        "SELECT timestamp_ms, force FROM readings WHERE session_id = ? ORDER BY timestamp_ms",
+        (session_id,),
+    ).fetchall()
+    arr = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    return arr[:, 0].astype(np.int64), arr[:, 1]
+
+
+def session_bodyweight(session_id):
+    """The bodyweight recorded with a session's readings, or None."""
+    row = get_connection(DB).execute(
+        "SELECT current_weight FROM readings WHERE session_id = ? AND current_weight IS NOT NULL LIMIT 1",
+        (session_id,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def session_ids(user=None):
+    """Ids of every session (or every session of `user`), oldest first."""
+    if user is None:
+        rows = get_connection(DB).execute("SELECT id FROM workout_sessions ORDER BY started_ms")
+    else:
+        rows = get_connection(DB).execute(
+            "SELECT id FROM workout_sessions WHERE user = ? ORDER BY started_ms", (user,))
+    return [r[0] for r in rows]
+
+
+def session_reps(session_id):
+    """Set/rep layout of a session: list of dicts ordered by set and rep."""
+    c = get_connection(DB).cursor()
+    c.row_factory = sqlite3.Row
+    rows = [dict(r) for r in c.execute("""
+        SELECT r.id AS rep_id, s.set_number, r.rep_number, r.phase, r.started_ms, r.ended_ms,
+               r.onset_ms, r.offset_ms, r.peak_force, r.time_to_peak_s, r.max_rfd,
+               r.impulse, r.mean_force, r.drop_off
+        FROM workout_reps r JOIN workout_sets s ON s.id = r.set_id
+        WHERE r.session_id = ?
+        ORDER BY s.set_number, r.rep_number
+    """, (session_id,))]
+    return rows
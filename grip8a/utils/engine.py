@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from grip8a.analysis.metrics import RepMetrics
+from grip8a.analysis.reps import RepDetector
+from grip8a.ble.recorder import CLOSE_GRACE, WindowRecorder
+from grip8a.utils.protocols import compile_protocol, total_duration
+
+# ----------------------
+# Async protocol runner
+# ----------------------
+#
+# A runner walks a compiled timeline (see protocols.py) on an asyncio loop,
+# sleeping until absolute deadlines from one monotonic start time, and emits
+# an event dict to every subscriber:
+#
+#   {"type": "phase_start" | "tick" | "phase_end" | "done" | "cancelled",
+#    "runner": name, "at": scheduled offset (s), "late_ms": how late it fired,
+#    "remaining": whole seconds left in the phase, "phase": Phase._asdict()}
+#
+# publish() adds events of other kinds (e.g. "rep" with the metrics of a rep
+# that just ended) to the same stream.
+#
+# Subscribers are plain callables run on the loop; keep them quick. If one
+# returns a coroutine it is scheduled as a task so it can't hold up the
+# timer. Any number of runners can share one loop; ProtocolHost gives the
+# web app such a loop on a background thread.
+
+EVENT_HISTORY = 256  # recent events kept per runner for pollers
+
+
+class ProtocolRunner:
+    def __init__(self, protocol, name=None, clock=time.monotonic):
+        self.protocol = protocol
+        self.timeline = compile_protocol(protocol)
+        self.name = name or protocol.get("name", "protocol")
+        self.clock = clock
+        self.start = None
+        self.phase = None
+        self.finished = False
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.event_count = 0
+        self._events_lock = threading.Lock()  # pollers read from other threads
+        self._subscribers = []
+        self._task = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def _emit(self, kind, at, phase=None, remaining=None, **fields):
+        event = {
+            "type": kind,
+            "runner": self.name,
+            "at": round(at, 3),
+            "late_ms": round((self.clock() - self.start - at) * 1000, 3),
+            "remaining": remaining,
+            "phase": phase._asdict() if phase is not None else None,
+            **fields,
+        }
+        with self._events_lock:
+            self.events.append((self.event_count, event))
+            self.event_count += 1
+        for callback in list(self._subscribers):
+            try:
+                result = callback(event)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                print(f"Protocol subscriber error: {e}")
+
+    async def _sleep_until(self, offset):
+        delay = self.start + offset - self.clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def run(self, start=None):
+        """Run the whole timeline. `start` (clock time) lets several runners share one origin."""
+        self._task = asyncio.current_task()
+        self.start = self.clock() if start is None else start
+        try:
+            for phase in self.timeline:
+                self.phase = phase
+                end = phase.start + phase.duration
+                await self._sleep_until(phase.start)
+                self._emit("phase_start", phase.start, phase, int(phase.duration + 0.999))
+                k = 1
+                while phase.start + k < end - 1e-9:
+                    await self._sleep_until(phase.start + k)
+                    self._emit("tick", phase.start + k, phase, int(end - phase.start - k + 0.999))
+                    k += 1
+                await self._sleep_until(end)
+                self._emit("phase_end", end, phase, 0)
+            self.phase = None
+            self.finished = True
+            self._emit("done", total_duration(self.timeline))
+        except asyncio.CancelledError:
+            self.finished = True
+            self._emit("cancelled", self.clock() - self.start, self.phase)
+            raise
+
+    def publish(self, kind, **fields):
+        """Emit an event of another kind (e.g. "rep" from a subscriber), with extra fields, right now."""
+        self._emit(kind, self.clock() - self.start, self.phase, **fields)
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def status(self):
+        """Where the runner is right now (safe to call from any thread)."""
+        elapsed = 0.0 if self.start is None else self.clock() - self.start
+        phase = self.phase
+        return {
+            "name": self.name,
+            "elapsed": round(elapsed, 3),
+            "total": total_duration(self.timeline),
+            "finished": self.finished,
+            "phase": phase._asdict() if phase is not None else None,
+            "phase_remaining": round(max(0.0, phase.start + phase.duration - elapsed), 3) if phase else 0.0,
+        }
+
+    def events_since(self, n):
+        """Events numbered >= n (pass the last number seen + 1), oldest first."""
+        with self._events_lock:
+            return [(i, e) for i, e in self.events if i >= n]
+
+
+class ProtocolHost:
+    """One background asyncio loop running any number of keyed ProtocolRunners."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.runners = {}
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def start(self, key, protocol, subscribers=()):
+        """Start `protocol` under `key`, replacing (cancelling) any runner already there."""
+        self.stop(key)
+        runner = ProtocolRunner(protocol, name=str(key))
+        for callback in subscribers:
+            runner.subscribe(callback)
+        self.runners[key] = runner
+        asyncio.run_coroutine_threadsafe(runner.run(), self.loop)
+        return runner
+
+    def stop(self, key):
+        runner = self.runners.pop(key, None)
+        if runner is not None:
+            self.loop.call_soon_threadsafe(runner.cancel)
+        return runner is not None
+
+    def get(self, key):
+        return self.runners.get(key)
+
+
+# ----------------------
+# Stock subscribers
+# ----------------------
+
+def _hang_subscriber(manager, make_sink, device_id=None, closed=None, raw=False):
+    """Runs a WindowRecorder over each hang phase, with sink make_sink(phase_start_event).
+
+    closed(phase_start_event), if given, runs once the hang's last samples are through.
+    `raw` is passed on to the recorder.
+    """
+    state = {"recorder": None, "started": None}
+
+    def close(recorder, end, started):
+        recorder.close(end, 0)
+        if closed is not None:
+            closed(started)
+
+    def on_event(event):
+        phase = event["phase"]
+        if event["type"] == "phase_start" and phase["kind"] == "hang":
+            recorder = WindowRecorder(manager, make_sink(event), device_id, raw)
+            # the phase began at its scheduled time, not when this callback ran
+            recorder.open(manager.clock() - event["late_ms"] / 1000)
+            state["recorder"], state["started"] = recorder, event
+        elif state["recorder"] is not None and event["type"] == "tick":
+            state["recorder"].pump()
+        elif state["recorder"] is not None and event["type"] in ("phase_end", "cancelled"):
+            recorder, state["recorder"] = state["recorder"], None
+            end = manager.clock() - event["late_ms"] / 1000
+            # let in-flight frames land without blocking the loop
+            asyncio.get_running_loop().call_later(CLOSE_GRACE, close, recorder, end, state["started"])
+
+    return on_event
+
+
+def recording_subscriber(manager, sink, device_id=None, raw=False):
+    """Subscriber that records every sample streamed during hang phases.
+
+    `sink(forces, wall_times, event)` gets each chunk along with the
+    hang's phase_start event, so it can tag rows with set/rep/grip. With
+    `raw` it is called as sink(forces, wall_times, event, raw_values).
+    """
+    return _hang_subscriber(manager, lambda started: lambda f, t, *r: sink(f, t, started, *r),
+                            device_id, raw=raw)
+
+
+def rep_subscriber(manager, on_rep, on, off, device_id=None):
+    """Subscriber that finds the rep(s) in each hang phase as the samples stream in.
+
+    `on_rep(rep, event)` is called the moment a rep ends, with
+    {"start", "end" (Unix seconds), "metrics"} (see analysis/metrics.py) and
+    the hang's phase_start event. `on`/`off` are the detector thresholds
+    (see analysis/reps.py rep_thresholds).
+    """
+    detectors = {}
+
+    def make_sink(started):
+        def found(rep):
+            if rep[0] == "end":
+                on_rep({"start": rep[1], "end": rep[2], "metrics": rep[3]}, started)
+        detector = detectors[id(started)] = RepDetector(on, off, callback=found, metrics=RepMetrics)
+        return lambda forces, times: detector.feed(times, forces)
+
+    def closed(started):
+        detectors.pop(id(started)).flush()
+
+    return _hang_subscriber(manager, make_sink, device_id, closed)
@@ -0,0 +1,165 @@
+from collections import namedtuple
+
+# ----------------------
+# Protocol description format
+# ----------------------
+#
+# A protocol is a plain dict (JSON-friendly, so the web app can accept one):
+#
+#   {"name": "...", "setup": 10, "blocks": [block, ...]}
+#
+# `setup` is a GET READY phase before the first block. Block types:
+#
+#   repeater  hang, rest, reps, sets, set_rest    e.g. 7/3 x6, 4 sets
+#   max_hang  hang, rest, sets                    one hang per set
+#   ladder    hangs=[5, 10, 15], rest, sets, set_rest
+#   circuit   grips=[{"grip": ..., "load": ...}, ...], hang, rest, rounds, round_rest
+#
+# Every block also accepts `grip`, `load` (a free-form target such as
+# {"percent_bw": 110} or {"added_kg": 10}), `set_setup` (GET READY before
+# each set) and `rest_after` (rest before the next block). Rests that would
+# end the workout are dropped.
+
+Phase = namedtuple("Phase", "index start duration kind label block set rep grip load")
+Phase.__doc__ = """One timed step of a compiled protocol; `start` is seconds from the protocol start."""
+
+PHASE_LABELS = {"setup": "GET READY:", "hang": "HANG:", "rest": "REST:"}
+
+
+def _block_steps(block):
+    """(kind, duration, set, rep, grip, load) steps for one block, in order."""
+    kind = block.get("type", "repeater")
+    grip = block.get("grip")
+    load = block.get("load")
+    set_setup = block.get("set_setup", 0)
+    steps = []
+
+    if kind in ("repeater", "max_hang", "ladder"):
+        sets = block.get("sets", 1)
+        if kind == "ladder":
+            hangs = list(block["hangs"])
+            set_rest = block.get("set_rest", block.get("rest", 0))
+        elif kind == "max_hang":
+            hangs = [block["hang"]]
+            set_rest = block.get("rest", 0)
+        else:
+            hangs = [block["hang"]] * block.get("reps", 1)
+            set_rest = block.get("set_rest", block.get("rest", 0))
+        for s in range(1, sets + 1):
+            if set_setup:
+                steps.append(("setup", set_setup, s, None, grip, load))
+            for r, hang in enumerate(hangs, 1):
+                steps.append(("hang", hang, s, r, grip, load))
+                if r < len(hangs):
+                    steps.append(("rest", block.get("rest", 0), s, r, grip, load))
+            if s < sets:
+                steps.append(("rest", set_rest, s, None, grip, load))
+
+    elif kind == "circuit":
+        grips = block["grips"]
+        rounds = block.get("rounds", 1)
+        for s in range(1, rounds + 1):
+            if set_setup:
+                steps.append(("setup", set_setup, s, None, grips[0].get("grip"), grips[0].get("load")))
+            for r, station in enumerate(grips, 1):
+                g, l = station.get("grip", grip), station.get("load", load)
+                steps.append(("hang", station.get("hang", block["hang"]), s, r, g, l))
+                if r < len(grips):
+                    steps.append(("rest", block.get("rest", 0), s, r, g, l))
+            if s < rounds:
+                steps.append(("rest", block.get("round_rest", block.get("rest", 0)), s, None, grip, load))
+
+    else:
+        raise ValueError(f"unknown protocol block type {kind!r}")
+
+    if block.get("rest_after"):
+        steps.append(("rest", block["rest_after"], None, None, grip, load))
+    return steps
+
+
+def compile_protocol(protocol):
+    """Flatten a protocol dict into a list of Phases with precomputed start offsets."""
+    steps = []
+    if protocol.get("setup"):
+        steps.append((None, ("setup", protocol["setup"], None, None, None, None)))
+    for b, block in enumerate(protocol.get("blocks", [])):
+        steps.extend((b, step) for step in _block_steps(block))
+
+    # zero-length phases and trailing rests do nothing useful
+    steps = [(b, st) for b, st in steps if st[1] > 0]
+    while steps and steps[-1][1][0] == "rest":
+        steps.pop()
+
+    timeline, t = [], 0.0
+    for b, (kind, duration, s, r, grip, load) in steps:
+        timeline.append(Phase(len(timeline), t, float(duration), kind, PHASE_LABELS[kind],
+                              b, s, r, grip, load))
+        t += duration
+    return timeline
+
+
+def total_duration(timeline):
+    return timeline[-1].start + timeline[-1].duration if timeline else 0.0
+
+
+def describe_load(load):
+    """Short human text for a load target, e.g. "110% BW" or "+10 kg"."""
+    if not load:
+        return ""
+    parts = []
+    if "percent_bw" in load:
+        parts.append(f"{load['percent_bw']:g}% BW")
+    if "added_kg" in load:
+        parts.append(f"{load['added_kg']:+g} kg")
+    if "added_lbs" in load:
+        parts.append(f"{load['added_lbs']:+g} lbs")
+    if "target_force" in load:
+        parts.append(f"target {load['target_force']:g}")
+    return ", ".join(parts) or str(load)
+
+
+# ----------------------
+# Built-in protocols
+# ----------------------
+
+def simple_protocol(hang_time, rest_time, sets, setup_time=10):
+    """What complex_timer has always run: GET READY / HANG / REST for each set."""
+    return {
+        "name": f"{hang_time}/{rest_time} x{sets}",
+        "blocks": [{"type": "max_hang", "hang": hang_time, "rest": rest_time,
+                    "sets": sets, "set_setup": setup_time}],
+    }
+
+
+PRESETS = {
+    "repeaters_7_3": {
+        "name": "7/3 repeaters, 6 reps x 4 sets",
+        "setup": 10,
+        "blocks": [{"type": "repeater", "hang": 7, "rest": 3, "reps": 6, "sets": 4, "set_rest": 180}],
+    },
+    "max_hangs_10s": {
+        "name": "10 s max hangs x 5",
+        "setup": 10,
+        "blocks": [{"type": "max_hang", "hang": 10, "rest": 180, "sets": 5,
+                    "load": {"percent_bw": 110}}],
+    },
+    "ladder_5_10_15": {
+        "name": "5-10-15 s ladder x 3",
+        "setup": 10,
+        "blocks": [{"type": "ladder", "hangs": [5, 10, 15], "rest": 10, "sets": 3, "set_rest": 120}],
+    },
+    "cf_test_7_3": {
+        "name": "Critical force test (7/3 x 24, all out)",
+        "setup": 10,
+        "blocks": [{"type": "repeater", "hang": 7, "rest": 3, "reps": 24, "sets": 1}],
+    },
+    "grip_circuit": {
+        "name": "Half crimp / open hand / three finger drag circuit",
+        "setup": 10,
+        "blocks": [{"type": "circuit", "hang": 7, "rest": 5, "rounds": 3, "round_rest": 90, "grips": [
+            {"grip": "half crimp", "load": {"percent_bw": 100}},
+            {"grip": "open hand", "load": {"percent_bw": 105}},
+            {"grip": "three finger drag", "load": {"percent_bw": 100}},
+        ]}],
+    },
+}
@@ -0,0 +1,73 @@
+import time
+
+# ----------------------
+# Deadline scheduler
+# ----------------------
+#
+# Every wake-up is an absolute offset from one monotonic start time, so the
+# time spent printing, writing to the DB or oversleeping never accumulates:
+# a late tick makes only that tick late, the next one is still on schedule.
+# time.monotonic() is immune to wall-clock changes (NTP, DST, manual edits).
+
+
+class DeadlineScheduler:
+    """Sleeps until absolute offsets (seconds) from `start` and records how late it woke.
+
+    `spin` is the final stretch before a deadline that is spent yielding
+    instead of sleeping, since sleep() on some platforms overshoots by a few ms.
+    """
+
+    def __init__(self, spin=0.002, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self._sleep = sleep
+        self.spin = spin
+        self.start = clock()
+        self.overruns = 0
+        self._late = []
+
+    def now(self):
+        """Seconds since start."""
+        return self.clock() - self.start
+
+    def wait_until(self, offset):
+        """Block until `offset` seconds after start. Returns how late we woke (seconds)."""
+        deadline = self.start + offset
+        while True:
+            left = deadline - self.clock()
+            if left <= 0:
+                break
+            self._sleep(left - self.spin if left > self.spin else 0)
+        late = self.clock() - deadline
+        self._late.append(late)
+        return late
+
+    def ticks(self, begin, end, period):
+        """Yield tick offsets begin+period, begin+2*period, ... before `end`, waiting for each.
+
+        If the caller's work overruns one or more ticks, those ticks are
+        skipped (and counted) instead of firing back to back.
+        """
+        k = 1
+        while begin + k * period < end - 1e-9:
+            self.wait_until(begin + k * period)
+            yield begin + k * period
+            behind = int((self.now() - begin) / period)
+            if behind > k:
+                self.overruns += behind - k
+                k = behind
+            k += 1
+
+    def stats(self):
+        """Wake-up lateness over all waits so far, in milliseconds."""
+        late = sorted(self._late)
+        n = len(late)
+        if not n:
+            return {"waits": 0, "overruns": self.overruns}
+        return {
+            "waits": n,
+            "overruns": self.overruns,
+            "mean_late_ms": round(sum(late) / n * 1000, 3),
+            "p99_late_ms": round(late[min(n - 1, int(n * 0.99))] * 1000, 3),
+            "max_late_ms": round(late[-1] * 1000, 3),
+            "elapsed_s": round(self.now(), 3),
+        }
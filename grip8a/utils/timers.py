@@ -1,48 +1,216 @@
+import math
 import time
-from grip8a.ble.manager import force
-from grip8a.db.force_db import queue_force_reading
+from itertools import chain
+from grip8a.analysis.metrics import RepMetrics
+from grip8a.analysis.reps import RepDetector, match_reps, rep_thresholds
+from grip8a.ble.recorder import WindowRecorder
+from grip8a.db.force_db import queue_force_readings, set_recording_context, clear_recording_context, recording_context
+from grip8a.db import workout_db
+from grip8a.utils.protocols import compile_protocol, describe_load, simple_protocol
+from grip8a.utils.scheduler import DeadlineScheduler
+
+DISPLAY_TICK = 0.25  # seconds between display updates while recording
+# Recording starts this long before each hang and runs on this long after it
+# (never overlapping the next hang), so early pulls and late releases are kept;
+# the rep detector then finds where the rep really began and ended.
+PRE_ROLL = 1.0
+POST_ROLL = 2.0
 
 # ----------------------
 # Timer Logic
 # ----------------------
 
-def countdown(seconds, label="", record_force=False):
-    seconds = int(seconds)
-    start = time.time()
-    last_print_second = seconds
+def _show(label, remaining, recorder):
+    if recorder is not None:
+        force = recorder.manager.latest_force(device_id=recorder.device_id)
+        print(f"\r{label} {remaining:2d}s   | Force: {force:7.2f} | Recording Now!", end="")
+    else:
+        print(f"\r{label} {remaining:2d}s", end="")
 
-    print()  # clean line
 
-    while True:
-        elapsed = time.time() - start
-        remaining = max(0, seconds - int(elapsed))
+def _close(recorder, label, scheduler, at):
+    stats = recorder.close(scheduler.start + at)
+    print(f"\r{label} Recorded {stats['samples']} samples ({stats['rate_hz']} Hz, "
+          f"{stats['lost']} lost)                              ")
 
-        # Print label + countdown
-        if remaining != last_print_second:
-            print(f"\r{label} {remaining:2d}s   ", end="")
-            last_print_second = remaining
 
-        # Record if enabled
-        if record_force:
-            queue_force_reading(force)
-            print(f"\r{label} {remaining:2d}s   | Force: {force} | Recording Now!", end="")
-        else:
-            print(f"\r{label} {remaining:2d}s", end="")
-        
-        # End when time runs out
-        if elapsed >= seconds:
-            break
+def countdown(seconds, label="", recorder=None, scheduler=None, start_at=None, close_at=None):
+    """Count down `seconds` on `scheduler`'s clock, starting at offset `start_at`.
 
-        time.sleep(0.1)   # smooth 10 Hz updates
+    Phases chained on one scheduler (each starting at the previous one's
+    return value) keep their boundaries exact no matter how long display or
+    recording takes. An open WindowRecorder is pumped throughout and closed
+    at offset `close_at` (default: the end of this phase); if that is past
+    the end it stays open, to be passed on to the next phase's countdown.
+    Returns the offset at which this phase ended.
+    """
+    if scheduler is None:
+        scheduler = DeadlineScheduler()
+    if start_at is None:
+        start_at = scheduler.now()
+    end = start_at + seconds
+    if close_at is None:
+        close_at = end
+    shown = None
 
+    print()  # clean line
+    # display follows the ticks but never moves them
+    period = 1.0 if recorder is None else DISPLAY_TICK
+    for tick in chain((start_at,), scheduler.ticks(start_at, end, period)):
+        remaining = math.ceil(end - tick - 1e-9)
+        if recorder is not None and tick >= close_at:
+            _close(recorder, label, scheduler, close_at)
+            recorder = None
+        if recorder is not None:
+            recorder.pump()  # hand what has streamed so far to the writer
+            _show(label, remaining, recorder)
+        elif remaining != shown:
+            _show(label, remaining, recorder)
+            shown = remaining
+
+    scheduler.wait_until(end)
+    if recorder is not None and close_at <= end:
+        _close(recorder, label, scheduler, close_at)
     print(f"\r{label} Done!                                                               ")  # clear line
+    return end
+
+
+class _RepWindow:
+    """One hang's recording: writes every sample tagged with the rep and finds the rep in it."""
+
+    def __init__(self, ble, device_id, rep_id, current_weight):
+        self.rep_id = rep_id
+        # bind this rep's context now; the last samples are written after it's cleared
+        self.context = recording_context()
+        on, off = rep_thresholds(current_weight)
+        self.detector = RepDetector(on, off, callback=self._on_rep, metrics=RepMetrics)
+        self.recorder = WindowRecorder(ble, self._sink, device_id, raw=True)
+        self.device = ble.session(device_id)
+        self.stored = None  # index in detector.reps of the rep saved for this hang
+
+    def _sink(self, forces, times, raw):
+        profile = self.device.calibration
+        queue_force_readings(forces.tolist(), times.tolist(), self.context, raw=raw.tolist(),
+                             device=self.device.address, calibration_id=profile and profile["id"])
+        self.detector.feed(times, forces)
+
+    def _store(self, i):
+        (onset, offset), metrics = self.detector.reps[i], self.detector.rep_metrics[i]
+        workout_db.set_rep_bounds(self.rep_id, onset * 1000, offset * 1000, metrics)
+        self.stored = i
+        print(f"\rRep: held {offset - onset:.2f}s (on {onset - self.planned[0]:+.2f}s / "
+              f"off {offset - self.planned[1]:+.2f}s vs the timer) | peak {metrics['peak_force']:.1f} "
+              f"after {metrics['time_to_peak_s']:.2f}s | RFD {metrics['max_rfd']:.0f}/s | "
+              f"mean {metrics['mean_force']:.1f} | drop-off {metrics['drop_off']:.0%}")
+
+    def _on_rep(self, event):
+        # saved and shown the moment the detector ends a rep that overlaps this hang
+        if event[0] == "end" and self.stored is None and match_reps([event[1:3]], [self.planned])[0] == 0:
+            self._store(len(self.detector.reps) - 1)
 
-def complex_timer(hang_time, rest_time, sets, setup_time=10, record_force=False):
-    print("\nStarting complex hang timer!\n")
-    for i in range(1, sets + 1):
-        print(f"\n--- Set {i}/{sets} ---")
-        countdown(setup_time, label="GET READY:")
-        countdown(hang_time, label="HANG:", record_force=record_force)
-        if i < sets:
-            countdown(rest_time, label="REST:")
-    print("\nWorkout complete!\n")
\ No newline at end of file
+    def open(self, scheduler, open_at, start, end):
+        """Start recording at offset `open_at` for the hang planned from `start` to `end`."""
+        self.recorder.open(scheduler.start + open_at)
+        wall = time.time() - scheduler.now()
+        self.planned = (wall + start, wall + end)
+
+    def finish(self):
+        """After the recorder is closed: settle on the detected rep overlapping the hang most."""
+        self.detector.flush()
+        i = match_reps(self.detector.reps, [self.planned])[0]
+        if i < 0:
+            print("No rep detected in the force stream.")
+        elif i != self.stored:
+            self._store(i)
+
+
+def _next_hang_start(timeline, index):
+    for phase in timeline[index + 1:]:
+        if phase.kind == "hang":
+            return phase.start
+    return math.inf
+
+
+def _set_counts(timeline):
+    counts = {}
+    for phase in timeline:
+        if phase.set is not None:
+            counts[phase.block] = max(counts.get(phase.block, 0), phase.set)
+    return counts
+
+
+def complex_timer(hang_time=None, rest_time=None, sets=None, setup_time=10, record_force=False,
+                  user=None, current_weight=None, ble=None, device_id=None, protocol=None):
+    """Run GET READY / HANG / REST for each set, or any `protocol` (see protocols.py).
+
+    When recording, the workout is logged as a session with a set row per
+    set and a rep row per hang, and every sample `ble` streams during a
+    hang (plus PRE_ROLL before and POST_ROLL after) is written tagged with
+    them. The rep detector stores where each rep actually started and ended.
+    """
+    if protocol is None:
+        protocol = simple_protocol(hang_time, rest_time, sets, setup_time)
+    timeline = compile_protocol(protocol)
+    set_counts = _set_counts(timeline)
+    if record_force and ble is None:
+        print("Recording needs a force sensor connection; running the timer only.")
+        record_force = False
+    session_id = None
+    if record_force:
+        session_id = workout_db.start_session(user, protocol.get("name"))
+
+    print(f"\nStarting {protocol.get('name', 'complex hang timer')}!\n")
+    # every phase boundary is an offset from this one start time
+    scheduler = DeadlineScheduler()
+    set_key, set_id, set_number = None, None, 0
+    trailing, close_at = None, 0.0  # a hang's recording still running into the phases after it
+    try:
+        for phase in timeline:
+            if phase.set is not None and (phase.block, phase.set) != set_key:
+                if set_id is not None:
+                    workout_db.end_set(set_id)
+                set_key = (phase.block, phase.set)
+                set_number += 1
+                print(f"\n--- Set {phase.set}/{set_counts[phase.block]} ---")
+                if record_force:
+                    set_id = workout_db.start_set(session_id, set_number)
+            target = ", ".join(x for x in (phase.grip, describe_load(phase.load)) if x)
+            label = f"{phase.label} [{target}]" if target and phase.kind == "hang" else phase.label
+
+            if phase.kind == "hang" and record_force:
+                rep_id = workout_db.start_rep(session_id, set_id, phase.rep)
+                set_recording_context(user, current_weight, session_id, set_id, rep_id)
+                window = _RepWindow(ble, device_id, rep_id, current_weight)
+                end = phase.start + phase.duration
+                window.open(scheduler, max(phase.start - PRE_ROLL, close_at), phase.start, end)
+                close_at = min(end + POST_ROLL, _next_hang_start(timeline, phase.index))
+                try:
+                    countdown(phase.duration, label, window.recorder, scheduler, phase.start, close_at)
+                finally:
+                    clear_recording_context()
+                    workout_db.end_rep(rep_id)
+                if close_at > end:
+                    trailing = window
+                else:
+                    window.finish()
+            elif trailing is not None:
+                countdown(phase.duration, label, trailing.recorder, scheduler, phase.start, close_at)
+                if close_at <= phase.start + phase.duration:
+                    trailing.finish()
+                    trailing = None
+            else:
+                countdown(phase.duration, label, scheduler=scheduler, start_at=phase.start)
+        if trailing is not None:
+            # the last hang's post-roll runs past the end of the protocol
+            _close(trailing.recorder, "", scheduler, close_at)
+            trailing.finish()
+    finally:
+        if record_force:
+            if set_id is not None:
+                workout_db.end_set(set_id)
+            workout_db.end_session(session_id)
+    stats = scheduler.stats()
+    print("\nWorkout complete!\n")
+    print(f"Timing: {stats['waits']} ticks, late by {stats.get('mean_late_ms', 0)} ms on average "
+          f"(max {stats.get('max_late_ms', 0)} ms), {stats['overruns']} overruns\n")
+    return stats
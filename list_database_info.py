@@ -1,50 +1,30 @@
-import sqlite3
 from grip8a.db.config import DB_FORCE
+from grip8a.db.connection import get_connection
 
 DB = DB_FORCE
 
 DB_PATH = DB
 
 def get_all_tables():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    cursor = get_connection(DB_PATH).execute("SELECT name FROM sqlite_master WHERE type='table';")
     tables = [row[0] for row in cursor.fetchall()]
-
-    conn.close()
     return tables
 
 
 def get_columns(table_name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(f"PRAGMA table_info({table_name});")
+    cursor = get_connection(DB_PATH).execute(f"PRAGMA table_info({table_name});")
     columns = [row[1] for row in cursor.fetchall()]  # row[1] = column name
-
-    conn.close()
     return columns
 
 
 def get_rows(table_name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(f"SELECT * FROM {table_name};")
+    cursor = get_connection(DB_PATH).execute(f"SELECT * FROM {table_name};")
     rows = cursor.fetchall()
-
-    conn.close()
     return rows
 
 def get_all_users():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT DISTINCT user FROM user_table;")
+    cursor = get_connection(DB_PATH).execute("SELECT DISTINCT user FROM user_table;")
     users = [row[0] for row in cursor.fetchall()]
-
-    conn.close()
     return users
 
 
@@ -0,0 +1,136 @@
+"""Drive the force pipeline with a simulated or replayed sensor and report throughput.
+
+Examples:
+    python load_test.py --rate 2000 --devices 2 --seconds 10
+    python load_test.py --backend "replay:speed=10" --writer
+    python load_test.py --rate 5000 --writer --flask
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from grip8a.ble.manager import BLEManager
+from grip8a.ble.simulator import SimulatedBackend, load_backend
+from grip8a.db import force_db
+from grip8a.db.connection import close_connections, get_connection
+
+
+def pump_to_writer(manager, stop, counters):
+    """Forward every buffered sample to the force writer, as the recorder would."""
+    last = {device_id: -1 for device_id in manager.device_ids()}
+    while not stop.is_set():
+        for device_id in last:
+            t, seq, forces = manager.samples_since(last[device_id], device_id)
+            if len(seq):
+                last[device_id] = int(seq[-1])
+                # buffer times are monotonic; the writer wants wall-clock
+                wall = t + (time.time() - manager.clock())
+                force_db.queue_force_readings(forces.tolist(), wall.tolist())
+                counters["queued"] += len(forces)
+        time.sleep(0.01)
+
+
+def hammer_flask(manager, stop, counters):
+    """Poll /data?since= as fast as possible through the Flask test client.
+
+    Importing the app creates and migrates its DB, so GRIP8A_FLASK_DB must
+    already point at a throwaway one.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flask_app"))
+    import app as flask_app
+    flask_app.ble_manager = manager
+    client = flask_app.app.test_client()
+    since = -1
+    while not stop.is_set():
+        payload = client.get(f"/data?since={since}").get_json()
+        if payload["samples"]["seq"]:
+            since = payload["samples"]["seq"][-1]
+            counters["served"] += len(payload["samples"]["seq"])
+        counters["requests"] += 1
+    # release the DB files so the temporary directory can be removed
+    with flask_app.app.app_context():
+        flask_app.db.engine.dispose()
+    close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", help='backend spec, e.g. "replay:speed=10" (default: simulated)')
+    parser.add_argument("--rate", type=float, default=1000, help="simulated sample rate (Hz)")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--dropout", type=float, default=0.0)
+    parser.add_argument("--disconnect-every", type=float, default=None,
+                        help="mean seconds between simulated disconnects")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writer", action="store_true", help="also push samples through the DB writer")
+    parser.add_argument("--flask", action="store_true", help="also poll the Flask /data endpoint")
+    args = parser.parse_args()
+
+    if args.backend:
+        backend = load_backend(args.backend)
+    else:
+        backend = SimulatedBackend(rate_hz=args.rate, jitter=args.jitter,
+                                   dropout_prob=args.dropout,
+                                   disconnect_mean_s=args.disconnect_every, seed=args.seed)
+    devices = [{"id": f"sim{i}", "name": f"sim{i}"} for i in range(args.devices)]
+    manager = BLEManager(devices=devices, backend=backend,
+                         buffer_capacity=max(16384, int(args.rate * args.seconds * 2)))
+
+    stop = threading.Event()
+    counters = {"queued": 0, "served": 0, "requests": 0}
+    threads = []
+    # never write load-test data into the real databases
+    tmp = tempfile.TemporaryDirectory() if args.writer or args.flask else None
+    if args.writer:
+        force_db.DB = os.path.join(tmp.name, "load_test.db")
+        # ... nor replay (or leave behind) the real writer's spill file
+        force_db.write_queue.spill_path = os.path.join(tmp.name, "load_test.spill")
+        force_db.init_force_db()
+        force_db.start_force_writer()
+        threads.append(threading.Thread(target=pump_to_writer, args=(manager, stop, counters), daemon=True))
+    if args.flask:
+        os.environ["GRIP8A_FLASK_DB"] = os.path.join(tmp.name, "flask_load_test.db")
+        threads.append(threading.Thread(target=hammer_flask, args=(manager, stop, counters), daemon=True))
+
+    started = time.perf_counter()
+    manager.start()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+    manager.stop()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n=== load test: {args.devices} device(s), {elapsed:.1f}s ===")
+    print(f"generated: {backend.samples_sent} samples ({backend.samples_sent / elapsed:.0f}/s), "
+          f"{backend.disconnects} disconnects")
+    for device_id in manager.device_ids():
+        stream = manager.stream_stats(device_id)
+        reconnect = manager.reconnect_stats(device_id)
+        print(f"[{device_id}] ingested {stream['samples']} samples in {stream['frames']} frames, "
+              f"lost {stream['lost_samples']}, reconnect mean {reconnect['mean_latency_s']}")
+    if args.writer:
+        force_db.stop_force_writer()
+        rows = get_connection(force_db.DB).execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        close_connections()
+        stats = force_db.queue_stats()
+        print(f"writer: queued {counters['queued']}, stored {rows} rows "
+              f"({rows / elapsed:.0f}/s) in {stats['batches']} batches, "
+              f"queue high-water {stats['high_water']}, dropped {stats['dropped']}, "
+              f"spilled {stats['spilled']} ({stats['policy']})")
+    if args.flask:
+        print(f"flask /data: {counters['requests']} requests "
+              f"({counters['requests'] / elapsed:.0f}/s), {counters['served']} samples served")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
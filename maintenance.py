@@ -0,0 +1,60 @@
+"""Pack, archive old raw force readings and compact the database.
+
+Meant to run on a schedule, e.g. nightly from cron:
+    0 3 * * * cd /path/to/Grip8a && python maintenance.py
+
+Examples:
+    python maintenance.py --days 30
+    python maintenance.py --pack-days 1
+    python maintenance.py --dry-run
+    python maintenance.py --db flask_app/grip8a.db --table reading
+"""
+import argparse
+
+from grip8a.db.config import ARCHIVE_DIR, DB_FORCE, PACK_AFTER_DAYS, RETENTION_DAYS
+from grip8a.db.migrations import migrate
+from grip8a.db.retention import run_maintenance
+
+
+def _mb(n):
+    return f"{n / 1e6:.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DB_FORCE)
+    parser.add_argument("--table", default="readings", help='"readings" (grip8a) or "reading" (Flask app)')
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS, help="keep raw rows this many days")
+    parser.add_argument("--pack-days", type=float, default=PACK_AFTER_DAYS,
+                        help="pack readings older than this into one hang_samples row per hang")
+    parser.add_argument("--no-pack", action="store_true", help="skip packing")
+    parser.add_argument("--delete-packed", action="store_true",
+                        help="drop raw rows as soon as they are packed instead of at --days "
+                             "(session/rep sample reads, exports and recalibration no longer see them)")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--no-vacuum", action="store_true", help="skip checkpoint/vacuum")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be archived")
+    args = parser.parse_args()
+
+    if args.table == "readings":
+        migrate(args.db)  # makes sure the timestamp index and hang_samples exist
+    report = run_maintenance(args.days, args.archive_dir, args.db, args.table,
+                             vacuum=not args.no_vacuum, dry_run=args.dry_run,
+                             pack_days=None if args.no_pack else args.pack_days,
+                             keep_packed=not args.delete_packed)
+
+    if args.table == "readings" and not args.no_pack:
+        verb = "would pack" if args.dry_run else "packed"
+        print(f"{report['db']} [{report['table']}]: {verb} {report['packed_rows']} rows "
+              f"older than {args.pack_days:g} days into {report['packed_hangs']} hang(s)")
+    verb = "would archive" if args.dry_run else "archived"
+    print(f"{report['db']} [{report['table']}]: {verb} {report['archived_rows']} rows "
+          f"older than {args.days:g} days into {len(report['archive_files'])} file(s) "
+          f"in {args.archive_dir}/")
+    print(f"remaining rows: {report['remaining_rows']}")
+    print(f"size: {_mb(report['size_before'])} -> {_mb(report['size_after'])} "
+          f"(reclaimed {_mb(report['reclaimed_bytes'])}) in {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
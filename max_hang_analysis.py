@@ -1,9 +1,24 @@
+import argparse
 import sqlite3
-import pandas as pd
-
-DB_PATH = "max_hang_logs.db"
-
-def load_user_data(username):
+import time
+from datetime import date
+import numpy as np
+from grip8a.analysis.critical_force import update_critical_force
+from grip8a.db import cache
+from grip8a.db.config import DB_MAXHANG
+from grip8a.db.connection import transaction
+from grip8a.db.migrations import migrate
+
+# pandas (slow to import) is imported by the functions that build frames, so
+# --critical-force and scripts borrowing the helpers below don't pay for it
+
+# The hangs table lives in the same file the CLI logs to
+DB_PATH = DB_MAXHANG
+
+def load_user_data(username, columnar_dir=None):
+    if columnar_dir:
+        return load_user_data_columnar(username, columnar_dir)
+    import pandas as pd
     conn = sqlite3.connect(DB_PATH)
     #select selects the columns specified (* means all columns)
     #from selects the table
@@ -17,6 +32,21 @@ def load_user_data(username):
     
     return df
 
+def load_user_data_columnar(username, columnar_dir):
+    """Same frame as load_user_data, read from a grip8a.db.columnar export instead of SQLite."""
+    import pandas as pd
+    from grip8a.db import columnar
+    cols = columnar.load_columns(columnar_dir, "hangs", user=username)
+    if not cols:
+        return pd.DataFrame(columns=["id", "date", "user"])
+    df = pd.DataFrame({name: values for name, values in cols.items()})
+    for name in ("exercise_type", "side", "notes"):
+        labels = pd.Series(columnar.dictionary(columnar_dir, "hangs", name) + [None])
+        df[name] = labels.iloc[df[name].to_numpy()].to_numpy()  # code -1 -> None
+    df["date"] = pd.to_datetime(df["date"], unit="ms")
+    df.insert(2, "user", username)
+    return df.sort_values("date").reset_index(drop=True)
+
 def get_user_values(df):
     # Sort newest → oldest
     df_sorted = df.sort_values("date", ascending=False)
@@ -30,32 +60,28 @@ def get_user_values(df):
     # Return both fields
     return max_row["added_weight"], max_row["current_weight"]
 
-import pandas as pd
+def _roi_levels(roi):
+    """Low / base / high ROI (low clamped so it never goes below 0) and their labels."""
+    rois = np.array([max(0, roi - 0.03), roi, roi + 0.03])
+    return rois, [f"{r*100:.1f}%_increase" for r in rois]
+
+def progression_values(current_max, roi=0.05, total_weeks=8):
+    """Linear progression for each current max: array (maxes, 3 ROI levels, total_weeks + 1)."""
+    total_weeks = int(total_weeks)
+    rois, _ = _roi_levels(roi)
+    weeks = np.arange(total_weeks + 1)
+    current_max = np.asarray(current_max, dtype=np.float64)[:, None, None]
+    # weekly increment
+    increment = (current_max * rois[None, :, None]) / total_weeks
+    return current_max + increment * weeks
 
 def build_progression_table(current_max, bodyweight, roi=0.05, total_weeks=8):
+    import pandas as pd
     total_weeks = int(total_weeks)  # ensure integer
-    
-    # Clamp ROI so it never goes below 0
-    roi_low = max(0, roi - 0.03)
-    roi_base = roi
-    roi_high = roi + 0.03
-
-    labels = [
-        f"{roi_low*100:.1f}%_increase",
-        f"{roi_base*100:.1f}%_increase",
-        f"{roi_high*100:.1f}%_increase"
-    ]
-
+    _, labels = _roi_levels(roi)
     weeks = list(range(0, total_weeks + 1))
 
-    # Calculate weekly increment
-    def linear_progression(roi_value):
-        increment = (current_max * roi_value) / total_weeks
-        return [current_max + increment * w for w in weeks]
-
-    row_low = linear_progression(roi_low)
-    row_base = linear_progression(roi_base)
-    row_high = linear_progression(roi_high)
+    row_low, row_base, row_high = progression_values([current_max], roi, total_weeks)[0].tolist()
 
     # Build DataFrame
     to_pull_df = pd.DataFrame({
@@ -78,7 +104,97 @@ def build_progression_table(current_max, bodyweight, roi=0.05, total_weeks=8):
 
     return to_pull_df, bodyweight_percent_df
     
-if __name__ == "__main__":
+# ----------------------
+# Batch mode: every user at once
+# ----------------------
+
+def load_all_hangs(db=None, sessions=None):
+    """Every user's hangs in one query, with just the columns forecasting needs.
+
+    With `sessions`, only each user's newest `sessions` hangs are read
+    (picked in SQL through the (user, date) index).
+    """
+    import pandas as pd
+    conn = sqlite3.connect(db or DB_PATH)
+    if sessions is None:
+        df = pd.read_sql_query("SELECT user, date, added_weight, current_weight FROM hangs", conn)
+    else:
+        # one index seek per user for the newest rows
+        df = pd.read_sql_query("""
+            SELECT h.user, h.date, h.added_weight, h.current_weight
+            FROM (SELECT DISTINCT user FROM hangs) u
+            JOIN hangs h ON h.rowid IN (
+                SELECT rowid FROM hangs WHERE user = u.user ORDER BY date DESC LIMIT ?
+            )
+        """, conn, params=(sessions,))
+    conn.close()
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def get_all_user_values(df, sessions=10):
+    """get_user_values for every user at once: frame indexed by user with current_max and bodyweight."""
+    # newest first within each user, then the first `sessions` rows of each
+    df = df.sort_values(["user", "date"], ascending=[True, False], kind="stable")
+    recent = df[df.groupby("user").cumcount() < sessions].dropna(subset=["added_weight"])
+    best = recent.loc[recent.groupby("user")["added_weight"].idxmax()]
+    return (best.set_index("user")[["added_weight", "current_weight"]]
+                .rename(columns={"added_weight": "current_max", "current_weight": "bodyweight"}))
+
+def build_all_progressions(user_values, roi=0.05, total_weeks=8):
+    """All users' progression tables as one long frame: a row per user, ROI level and week."""
+    import pandas as pd
+    total_weeks = int(total_weeks)
+    rois, labels = _roi_levels(roi)
+    values = progression_values(user_values["current_max"], roi, total_weeks)
+    bodyweight = user_values["bodyweight"].to_numpy(dtype=np.float64)[:, None, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.where(bodyweight > 0, np.round((values / (bodyweight / 2)) * 100), np.nan)
+    users, levels, weeks = values.shape
+    per_user = levels * weeks
+    return pd.DataFrame({
+        "user": np.repeat(user_values.index.to_numpy(), per_user),
+        "current_max": np.repeat(user_values["current_max"].to_numpy(), per_user),
+        "bodyweight": np.repeat(user_values["bodyweight"].to_numpy(), per_user),
+        "progression": np.tile(np.repeat(labels, weeks), users),
+        "roi": np.tile(np.repeat(rois, weeks), users),
+        "week": np.tile(np.arange(weeks), users * levels),
+        "to_pull": values.ravel(),
+        "bodyweight_percent": percent.ravel(),
+    })
+
+def save_forecasts(table, db=None, forecast_date=None):
+    """Write build_all_progressions output to progression_forecasts, replacing that date's run."""
+    db = db or DB_PATH
+    forecast_date = forecast_date or date.today().isoformat()
+    migrate(db)
+    columns = list(table.columns)
+    # NaN (no bodyweight) is stored as NULL
+    rows = zip(*(table[c].astype(object).where(table[c].notna(), None).tolist() for c in columns))
+    with transaction(db) as conn:
+        conn.execute("DELETE FROM progression_forecasts WHERE forecast_date = ?", (forecast_date,))
+        conn.executemany(
+            f"INSERT INTO progression_forecasts (forecast_date, {', '.join(columns)}) "
+            f"VALUES (?, {', '.join('?' * len(columns))})",
+            ((forecast_date, *row) for row in rows),
+        )
+    return len(table)
+
+def forecast_all(roi=0.05, total_weeks=8, db=None, sessions=10):
+    """Nightly job: forecast every user's progression and store it. Returns the long table.
+
+    The table is only recomputed when someone has logged a hang since the last run.
+    """
+    db = db or DB_PATH
+    migrate(db)
+    table = cache.cached(
+        "progressions", None, ("hangs",),
+        lambda: build_all_progressions(get_all_user_values(load_all_hangs(db, sessions), sessions), roi, total_weeks),
+        params=(roi, total_weeks, sessions), db=db,
+    )
+    save_forecasts(table, db)
+    return table
+
+def run_interactive():
     user = input("Enter username for analysis: ").strip()
     df = load_user_data(user)
 
@@ -110,3 +226,28 @@ if __name__ == "__main__":
         print(progression_df_bodyweight)
 
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Max hang progression forecasts")
+    parser.add_argument("--all", action="store_true",
+                        help="forecast every user at once and store it in progression_forecasts")
+    parser.add_argument("--critical-force", action="store_true",
+                        help="estimate critical force / W' from every stored all-out repeater test")
+    parser.add_argument("--roi", type=float, default=0.05, help="rate of improvement for --all")
+    parser.add_argument("--weeks", type=int, default=8)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    if args.critical_force:
+        started = time.perf_counter()
+        tests = update_critical_force(db=args.db)
+        usable = [t for t in tests if t["critical_force"] is not None]
+        print(f"Critical force for {len(usable)} of {len(tests)} tests "
+              f"({len({t['user'] for t in usable})} users) in {time.perf_counter() - started:.2f}s")
+    elif args.all:
+        started = time.perf_counter()
+        table = forecast_all(args.roi, args.weeks, args.db)
+        print(f"Forecast {table['user'].nunique()} users ({len(table)} rows) "
+              f"in {time.perf_counter() - started:.2f}s")
+    else:
+        run_interactive()
@@ -0,0 +1,180 @@
+"""Time the CLI's cold start to the first prompt and each menu's first use, and fail on regressions.
+
+Examples:
+    python startup_bench.py --save            # record this machine's baseline
+    python startup_bench.py                   # compare against it (exit 1 if slower)
+    python startup_bench.py --runs 10 --tolerance 0.3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+RUN_PY = os.path.join(ROOT, "run.py")
+
+# Must not be imported by the time the first prompt shows (see grip8a/cli/main.py)
+HEAVY_MODULES = ("bleak", "numpy", "pandas", "matplotlib", "sqlalchemy", "flask")
+
+# Keystrokes from the main menu to each menu's prompt. Each is timed in its
+# own fresh process from the last keystroke to the prompt, i.e. the first
+# use of that menu, including whatever it imports.
+MENUS = {
+    "force_menu": ["2\n"],
+    "maxhang_menu": ["1\n"],
+    "view_logs": ["1\n", "3\n"],
+    "timer": ["1\n", "1\n"],  # up to the protocol picker; the timer itself never starts
+}
+
+# A regression is slower than baseline * (1 + tolerance) + SLACK_MS
+SLACK_MS = 15.0
+RUN_TIMEOUT = 60.0  # seconds before a stuck CLI is killed
+
+
+def _read_until(proc, prompt):
+    """Read the CLI's output until it ends with `prompt` (input() flushes it)."""
+    out, end = b"", prompt.encode()
+    while not out.endswith(end):
+        chunk = os.read(proc.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError(f"CLI exited or stalled waiting for {prompt!r}; last output:\n{out[-500:].decode()}")
+        out += chunk
+    return out
+
+
+def _spawn(workdir, env):
+    proc = subprocess.Popen([sys.executable, RUN_PY], cwd=workdir, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+    # a blocked read ends (with an error) once the watchdog kills the process
+    proc.watchdog = threading.Timer(RUN_TIMEOUT, proc.kill)
+    proc.watchdog.start()
+    return proc
+
+
+def _stop(proc):
+    proc.watchdog.cancel()
+    proc.kill()
+    proc.wait()
+
+
+def _send(proc, keys):
+    proc.stdin.write(keys.encode())
+    proc.stdin.flush()
+
+
+def _login(proc, new_user=False):
+    _send(proc, "bench\n")
+    _read_until(proc, "Bodyweight (lbs): ")
+    _send(proc, "150\n")
+    if new_user:
+        for prompt, answer in (("Gender: ", "x\n"), ("Age: ", "30\n"), ("V5): ", "V5\n")):
+            _read_until(proc, prompt)
+            _send(proc, answer)
+    _read_until(proc, "Choose: ")
+
+
+def prepare(workdir, env):
+    """One untimed run that creates the DB and the bench user, like an existing install."""
+    proc = _spawn(workdir, env)
+    try:
+        _read_until(proc, "Username: ")
+        _login(proc, new_user=True)
+    finally:
+        _stop(proc)
+
+
+def time_run(workdir, env):
+    """One round of cold starts: {"cold_start": ms to the first prompt, <menu>: ms, ...}."""
+    timings = {}
+    for menu, keys in MENUS.items():
+        started = time.perf_counter()
+        proc = _spawn(workdir, env)
+        try:
+            _read_until(proc, "Username: ")
+            timings.setdefault("cold_start", (time.perf_counter() - started) * 1000)
+            _login(proc)
+            for key in keys[:-1]:
+                _send(proc, key)
+                _read_until(proc, "Choose: ")
+            t = time.perf_counter()
+            _send(proc, keys[-1])
+            _read_until(proc, "Choose: ")
+            timings[menu] = (time.perf_counter() - t) * 1000
+        finally:
+            _stop(proc)
+    return timings
+
+
+def heavy_imports_at_prompt(workdir, env):
+    """HEAVY_MODULES already imported when main() first asks for input."""
+    code = (
+        "import builtins, json, sys\n"
+        "def report(prompt=''):\n"
+        f"    print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+        "    raise SystemExit(0)\n"
+        "builtins.input = report\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "from grip8a.cli.main import main\n"
+        "main()\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to take the median of")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "startup_baseline.json"))
+    parser.add_argument("--save", action="store_true", help="write this run's medians as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--backend", default="sim", help="GRIP8A_BLE_BACKEND for the force menu")
+    args = parser.parse_args()
+
+    env = dict(os.environ, GRIP8A_BLE_BACKEND=args.backend)
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # the CLI opens its DB files relative to the working directory
+        prepare(workdir, env)
+        heavy = heavy_imports_at_prompt(workdir, env)
+        runs = [time_run(workdir, env) for _ in range(args.runs)]
+    medians = {name: round(statistics.median(r[name] for r in runs), 1) for name in runs[0]}
+
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"\n=== startup: median of {args.runs} cold starts (ms) ===")
+    for name, ms in medians.items():
+        line = f"{name:>14}: {ms:8.1f}"
+        if baseline and name in baseline:
+            limit = baseline[name] * (1 + args.tolerance) + SLACK_MS
+            line += f"   baseline {baseline[name]:8.1f}   limit {limit:8.1f}"
+            if ms > limit:
+                line += "   REGRESSION"
+                failures.append(name)
+        print(line)
+    if heavy:
+        print(f"imported before the first prompt: {', '.join(heavy)}")
+        failures.append("heavy imports")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(medians, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"no baseline at {args.baseline}; run with --save to record one")
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()